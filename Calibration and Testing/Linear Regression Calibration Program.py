@@ -1,42 +1,30 @@
-import numpy as np
-
-# Calibration data points (pixel coordinate, motor movement time)
-x_calibration_data = [
-    (454, 0),
-    (239, 1),
-    (330, 1),
-    (542, 0)
-]
-
-y_calibration_data = [
-    (105, 0.7),
-    (136, 0.7),
-    (435, 4),
-    (367, 4)
-]
-
-# Extract data arrays
-x_pixels = np.array([p[0] for p in x_calibration_data])
-x_times = np.array([p[1] for p in x_calibration_data])
-y_pixels = np.array([p[0] for p in y_calibration_data])
-y_times = np.array([p[1] for p in y_calibration_data])
-
-# Fit linear models
-x_slope, x_intercept = np.polyfit(x_pixels, x_times, 1)
-y_slope, y_intercept = np.polyfit(y_pixels, y_times, 1)
-
-print("✅ Calibration complete. Your linear model is:")
-print(f"X_time = {x_slope:.4f} * x_pixel + {x_intercept:.4f}")
-print(f"Y_time = {y_slope:.4f} * y_pixel + {y_intercept:.4f}")
+import argparse
+import os
+import sys
+
+# The calibration model and data file are shared with the final program.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Final_Cloth_Sorting_Arm"))
+from calibration import MODEL_KINDS, CalibrationModel, load_calibration_set
+
+# Calibration data points (pixel coordinate -> motor movement time) are read from
+# Final_Cloth_Sorting_Arm/calibration_data.json. This program's original points
+# are the "regression_program" set; the main program uses the default set.
+parser = argparse.ArgumentParser(description="Fit and try out the pixel-to-motor-time calibration.")
+parser.add_argument("--set", help="calibration set name (default: the file's default set)")
+parser.add_argument("--model", choices=MODEL_KINDS, help="override the set's model kind")
+args = parser.parse_args()
+
+set_name, model_kind, pixels, times = load_calibration_set(args.set)
+model = CalibrationModel(args.model or model_kind).fit(pixels, times)
+
+print(f"✅ Calibration complete ('{set_name}'). Your {model.kind} model is:")
+print(model.describe())
 print("-" * 40)
 
 def predict_motor_time(x_pixel, y_pixel):
     """Predict motor movement time for given camera pixel coordinates."""
-    x_time = x_slope * x_pixel + x_intercept
-    y_time = y_slope * y_pixel + y_intercept
-    # Clamp to non-negative times
-    x_time = max(0, x_time)
-    y_time = max(0, y_time)
+    # Clamped to non-negative times by the model
+    x_time, y_time = model.predict([(x_pixel, y_pixel)])[0]
     return x_time, y_time
 
 def main():
@@ -1,6 +1,13 @@
+import os
+import sys
+
 import cv2
 import numpy as np
 
+# order_points is shared with the live pipeline's PerspectiveFlattener.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Final_Cloth_Sorting_Arm"))
+from perspective import order_points
+
 # Step 0: Capture image from camera.
 camera = cv2.VideoCapture(0)
 if not camera.isOpened():
@@ -18,17 +25,6 @@ orig = image.copy()
 fixed_tray_contour = np.array([(155, 109), (208, 476), (545, 393), (436, 88)], dtype="float32").reshape(4, 1, 2)
 
 # Step 2: Perspective transform
-def order_points(pts):
-    pts = pts.reshape(4, 2)
-    rect = np.zeros((4, 2), dtype="float32")
-    s = pts.sum(axis=1)
-    rect[0] = pts[np.argmin(s)]   # top-left
-    rect[2] = pts[np.argmax(s)]   # bottom-right
-    diff = np.diff(pts, axis=1)
-    rect[1] = pts[np.argmin(diff)]  # top-right
-    rect[3] = pts[np.argmax(diff)]  # bottom-left
-    return rect
-
 rect = order_points(fixed_tray_contour)
 (tl, tr, br, bl) = rect
 
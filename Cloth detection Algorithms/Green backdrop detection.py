@@ -1,6 +1,13 @@
+import os
+import sys
+
 import cv2
 import numpy as np
 
+# The detector classes live with the final program.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Final_Cloth_Sorting_Arm"))
+from detectors import GreenBackdropDetector
+
 # ====== CONFIG ======
 CAM_INDEX = 0                 # your USB camera
 MIN_CLOTH_AREA = 1500         # pixels; tune for your scale
@@ -16,17 +23,6 @@ GREEN_HI = np.array([85, 255, 255])
 # cap.set(cv2.CAP_PROP_FRAME_WIDTH, W)
 # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, H)
 
-def largest_contour(mask):
-    cts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not cts:
-        return None
-    return max(cts, key=cv2.contourArea)
-
-def mask_from_contour(shape, cnt):
-    m = np.zeros(shape[:2], dtype=np.uint8)
-    cv2.drawContours(m, [cnt], -1, 255, thickness=cv2.FILLED)
-    return m
-
 def main():
     cap = cv2.VideoCapture(CAM_INDEX)
     if not cap.isOpened():
@@ -39,18 +35,12 @@ def main():
         print("Failed to capture frame")
         return
 
-    # Convert to HSV for robust color threshold
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    # 1) Tray = largest GREEN area, 2) cloth = NON-GREEN inside the tray.
+    detector = GreenBackdropDetector(green_lo=GREEN_LO, green_hi=GREEN_HI, min_area=MIN_CLOTH_AREA)
+    blobs = detector.detect(frame)
 
-    # 1) Find the tray region by detecting the largest GREEN area
-    green_mask = cv2.inRange(hsv, GREEN_LO, GREEN_HI)
-    # Clean up green mask a bit
-    k = np.ones((5,5), np.uint8)
-    green_mask = cv2.morphologyEx(green_mask, cv2.MORPH_OPEN, k)
-    green_mask = cv2.morphologyEx(green_mask, cv2.MORPH_CLOSE, k)
-
-    tray_ct = largest_contour(green_mask)
-    if tray_ct is None or cv2.contourArea(tray_ct) < 5000:
+    tray_ct = detector.last_tray_contour
+    if tray_ct is None:
         print("Tray (green backdrop) not found. Adjust HSV or ensure backdrop is visible.")
         # Save a quick debug image to help tune HSV
         dbg = frame.copy()
@@ -58,42 +48,25 @@ def main():
         print(f"Saved debug as {SAVE_DEBUG}")
         return
 
-    # Make a precise tray mask from the contour
-    tray_mask = mask_from_contour(frame, tray_ct)
-
-    # 2) Inside the tray only, detect NON-GREEN = (cloth, arm, anything not green)
-    non_green = cv2.bitwise_not(green_mask)
-    non_green_in_tray = cv2.bitwise_and(non_green, tray_mask)
-
-    # Optional: suppress tiny specks
-    non_green_in_tray = cv2.morphologyEx(non_green_in_tray, cv2.MORPH_OPEN, k)
-    non_green_in_tray = cv2.morphologyEx(non_green_in_tray, cv2.MORPH_CLOSE, k)
-
-    # 3) Find cloth regions (largest non-green blob inside tray)
-    cloth_ct = largest_contour(non_green_in_tray)
     output = frame.copy()
 
     # Draw tray outline for reference
     cv2.drawContours(output, [tray_ct], -1, (0, 255, 255), 2)
 
-    if cloth_ct is None or cv2.contourArea(cloth_ct) < MIN_CLOTH_AREA:
+    # 3) Largest non-green blob inside the tray
+    if not blobs:
         print("No cloth detected (non-green blob too small or absent).")
         cv2.imwrite(SAVE_DEBUG, output)
         print(f"Saved debug as {SAVE_DEBUG}")
         return
 
     # Centroid for pick point
-    M = cv2.moments(cloth_ct)
-    if M["m00"] != 0:
-        cx = int(M["m10"] / M["m00"])
-        cy = int(M["m01"] / M["m00"])
-    else:
-        cx, cy = -1, -1
+    cloth_ct = blobs[0].contour
+    cx, cy = blobs[0].centroid
 
     # Draw cloth outline + centroid
     cv2.drawContours(output, [cloth_ct], -1, (0, 255, 0), 2)
-    if cx >= 0:
-        cv2.circle(output, (cx, cy), 6, (0, 0, 255), -1)
+    cv2.circle(output, (cx, cy), 6, (0, 0, 255), -1)
 
     # Bounding box (optional—helpful for robot gripper)
     x, y, w, h = cv2.boundingRect(cloth_ct)
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import cv2
-import numpy as np
+
+# The detector classes live with the final program.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Final_Cloth_Sorting_Arm"))
+from detectors import ImageSubtractionDetector, whole_frame_contour
 
 # Open camera
 cap = cv2.VideoCapture(1)
@@ -11,8 +17,10 @@ if not ret:
     cap.release()
     exit()
 
-reference_gray = cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY)
-reference_gray = cv2.GaussianBlur(reference_gray, (21, 21), 0)
+# No tray ROI here: watch the whole frame. A heavy blur and a lower threshold
+# suppress sensor noise instead of a tray mask.
+detector = ImageSubtractionDetector(reference, whole_frame_contour(reference.shape), threshold=30, min_area=500,
+                                    dilation_iterations=2, blur_size=21)
 
 print("Reference frame captured. Starting detection...")
 
@@ -21,33 +29,14 @@ while True:
     if not ret:
         break
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray = cv2.GaussianBlur(gray, (21, 21), 0)
-
-    # Compute absolute difference with reference
-    diff = cv2.absdiff(reference_gray, gray)
-    _, thresh = cv2.threshold(diff, 30, 200, cv2.THRESH_BINARY)  # higher threshold for noise reduction
-    thresh = cv2.dilate(thresh, None, iterations=2)
-
-    # Find contours of changes
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    if contours:
-        # Pick the largest contour
-        largest_contour = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(largest_contour)
-
-        if area > 500:  # filter out small changes/noise
-            # Draw contour outline
-            cv2.drawContours(frame, [largest_contour], -1, (0, 255, 0), 2)
-
-            # Find centroid
-            M = cv2.moments(largest_contour)
-            if M["m00"] != 0:
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
-                cv2.circle(frame, (cX, cY), 5, (0, 0, 255), -1)
-                print(f"Centroid: ({cX}, {cY})")
+    blobs = detector.detect(frame)
+    if blobs:
+        # Pick the largest blob
+        largest = blobs[0]
+        cv2.drawContours(frame, [largest.contour], -1, (0, 255, 0), 2)
+        cX, cY = largest.centroid
+        cv2.circle(frame, (cX, cY), 5, (0, 0, 255), -1)
+        print(f"Centroid: ({cX}, {cY})")
 
     cv2.imshow("Change Detection", frame)
 
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from tray_locator import find_tray_corners
+
 # A list to store the clicked points.
 points = []
 
@@ -18,12 +20,14 @@ cv2.namedWindow("Camera Feed")
 cv2.setMouseCallback("Camera Feed", click_event)
 
 print("Click on the four corners of the tray in this order: top-left, top-right, bottom-right, bottom-left.")
+print("Or press 'a' to find the tray's corners automatically (edges first, then a green backdrop).")
 print("Press 'q' to quit.")
 
 while True:
     ret, frame = cap.read()
     if not ret:
         break
+    clean_frame = frame.copy()
     
     # Display the frame and points
     for point in points:
@@ -31,8 +35,19 @@ while True:
         
     cv2.imshow("Camera Feed", frame)
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
+    key = cv2.waitKey(1) & 0xFF
+    if key == ord('q'):
         break
+    if key == ord('a'):
+        for method in ("edges", "color"):
+            corners = find_tray_corners(clean_frame, method)
+            if corners is not None:
+                # Already ordered top-left, top-right, bottom-right, bottom-left.
+                points[:] = [tuple(point) for point in corners.tolist()]
+                print(f"Tray found from {method}: {points}")
+                break
+        else:
+            print("No tray found automatically. Click the corners instead.")
     
 cap.release()
 cv2.destroyAllWindows()
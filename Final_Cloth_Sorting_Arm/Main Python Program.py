@@ -1,253 +1,438 @@
+import argparse
+import asyncio
 import serial
 import time
 import numpy as np
 import cv2
-import sys
+
+from arm_serial import ArmCommandError, ArmResetError, ArmSerial, DryRunArm
+from background_model import RunningAverageBackground
+from calibration import CalibrationModel, load_calibration_set
+from controller import AsyncArm, Controller
+from cycle_trigger import MotionTrigger
+from detectors import ImageSubtractionDetector
+from frame_grabber import FrameGrabber
+from frame_source import FrameRecorder, RecordingCamera, ReplayCamera
+from grasp_point import deepest_point
+from metrics import METRICS
+from pick_cycle import PickCycle
+from pick_verification import PickVerifier
+from serial_connection import SerialConnection
+from session_state import SESSION_FILE, load_session, save_session, session_matches
+from station_setup import build_calibration_lut, build_detector
+from tray_locator import DRIFT_CHECK_INTERVAL, DriftMonitor, find_tray_corners
+from visualizer import Visualizer
 
 # --- Part 1: Your Calibration Data ---
-# These data points map a pixel coordinate to a motor movement time.
-x_calibration_data = [
-    (367, 0),
-    (230, 1.2),
-    (260, 1.2),
-    (415, 0)
-]
-
-y_calibration_data = [
-    (106, 0.4),
-    (121, 0.4),
-    (416, 4.2),
-    (377, 4.2)
-]
+# Samples mapping a pixel coordinate (px, py) to motor movement times (x_time, y_time)
+# live in calibration_data.json, shared with the calibration utility.
+CALIBRATION_SET = None  # None = the file's default set
 
 # --- Part 2: Automatic Calibration ---
-x_pixels = np.array([p[0] for p in x_calibration_data])
-x_times = np.array([p[1] for p in x_calibration_data])
-x_slope, x_intercept = np.polyfit(x_pixels, x_times, 1)
-
-y_pixels = np.array([p[0] for p in y_calibration_data])
-y_times = np.array([p[1] for p in y_calibration_data])
-y_slope, y_intercept = np.polyfit(y_pixels, y_times, 1)
+calibration_name, calibration_kind, calibration_pixels, calibration_times = load_calibration_set(CALIBRATION_SET)
+calibration_model = CalibrationModel(calibration_kind).fit(calibration_pixels, calibration_times)
 
-print("✅ Calibration complete. Your linear model is:")
-print(f"X_time = {x_slope:.4f} * x_pixel + {x_intercept:.4f}")
-print(f"Y_time = {y_slope:.4f} * y_pixel + {y_intercept:.4f}")
+print(f"✅ Calibration complete ('{calibration_name}'). Your {calibration_kind} model is:")
+print(calibration_model.describe())
 print("-" * 40)
 
+def pixel_to_motor_times(cx, cy):
+    """Converts a pixel coordinate into (x_time, y_time) using the calibration lookup table."""
+    return calibration_lut(cx, cy)
+
 # --- Part 3: Serial Communication Setup ---
-PORT = 'COM7'
+PORT = 'COM7'  # tried first; otherwise the Arduino is found by USB VID/PID or by its banner
 BAUD_RATE = 9600
-ARDUINO_RESET_DELAY = 2
+CONNECT_TIMEOUT = 30  # seconds to look for the arm at startup before giving up
 
-def send_command(ser, command):
-    """Sends a command to the Arduino and waits for a brief period."""
+async def send_command(arm, command):
+    """Sends a command to the Arduino and waits until the firmware reports it complete."""
     print(f"Sending command: {command}")
-    ser.write(f"{command}\n".encode())
-    time.sleep(0.5)
+    elapsed = await arm.send(command)
+    print(f"   ↳ acknowledged after {elapsed:.2f} s")
+
+# --- Part 3b: Instrumentation ---
+# Per-stage timing spans (capture, preprocess, diff/threshold, contour, centroid-to-time,
+# each serial command, arm phases A-D), exported after every cycle. Also enabled by --metrics.
+METRICS_ENABLED = False
+METRICS_JSONL = "metrics.jsonl"   # rolling percentiles, one line per cycle
+METRICS_PROM = "metrics.prom"     # Prometheus text-format histograms, rewritten every cycle
 
-# --- Part 4: Automated Image Subtraction Logic ---
+# --- Part 4: Camera Setup ---
+CAMERA_INDEX = 1
+# Headless: no windows, no drawing and no frame copies for display (also --headless).
+# Otherwise annotated frames are shown by a separate display thread.
+HEADLESS = False
+FRAME_TIMEOUT = 2  # seconds to wait for a fresh frame from the grabber thread
+
+# --- Part 5: Automated Image Subtraction Logic ---
 # These constants and the tray contour are from the second script you provided.
 THRESHOLD_VALUE = 50
 MIN_CONTOUR_AREA = 225
 DILATION_ITERATIONS = 5
 
+# Cloth detector used by the automatic modes: "subtraction" (the production method),
+# or one of the explored alternatives "green", "white" and "canny" (see detectors.py).
+DETECTOR = "subtraction"
+DETECTOR_OPTIONS = {}  # extra keyword arguments for the non-subtraction detectors
+
+# Perspective flattening: run image subtraction on a top-down view of the tray built
+# from precomputed remap tables, at FLATTEN_SCALE of the tray's size in the camera
+# image. Removes parallax from the centroid and shrinks the per-frame pixel count.
+FLATTEN_TRAY = False
+FLATTEN_SCALE = 0.5
+
+# Coarse-to-fine detection: find candidate pieces on the tray downscaled by
+# PYRAMID_SCALE (0.5 or 0.25), then diff at full resolution only around them.
+# Centroids are unchanged; full scans then leave background learning to the
+# empty-tray updates of the motion trigger. None diffs the whole tray every time.
+PYRAMID_SCALE = None
+
+# Continuous-mode triggering: "motion" starts a pick as soon as a new object has
+# settled on the tray, "timer" keeps the original fixed 10-second cadence.
+CONTINUOUS_TRIGGER = "motion"
+TRIGGER_SETTLE_FRAMES = 5       # still frames required before picking
+TRIGGER_IDLE_POLL_HZ = 2        # tray sample rate while empty
+TRIGGER_MOTION_THRESHOLD = 3.0  # mean gray-level change between frames counted as motion
+TRIGGER_WAIT_TIMEOUT = 0.5      # seconds between quit-key checks while waiting
+TIMER_CYCLE_DELAY = 10
+
+# Adaptive background: blend still, empty-tray pixels into the reference so lighting
+# drift and dust do not need a restart. 0 keeps the captured reference fixed.
+BACKGROUND_LEARNING_RATE = 0.02
+BACKGROUND_FILE = "background_model.npz"
+
+# Session file: reference, background, tray, calibration fit and detector settings, saved after
+# setup and on exit. `--resume` reloads it and skips the interactive capture if the tray still matches.
+SESSION_PATH = SESSION_FILE
+
+# Batch picking: pick every piece found in one scan before scanning the whole tray again.
+BATCH_PICKING = True
+# Pipelined picking: while the arm carries a piece home, scan for the next one as soon as the
+# claw has left the tray, so its motor times are ready when the claw opens. Takes precedence
+# over BATCH_PICKING.
+PIPELINED_PICKING = True
+ARM_FOOTPRINT_RADIUS = 60  # pixels around the predicted claw position ignored by the look-ahead scan
+# Pick verification: after lift-off, compare the tray around the piece with the reference. If the
+# piece is still lying there, open the claw and grasp again (nudged a few pixels) before returning.
+VERIFY_PICKS = True
+# Grasp point: close the claw on the point deepest inside each piece's fabric instead of its
+# centroid, which can lie on the empty tray for folded, L-shaped or ring-shaped cloth.
+GRASP_AT_DEEPEST_POINT = True
+# Tray localization: find the tray's corners in the reference image instead of using the ones
+# below ("edges", or "color" for a green backdrop). The configured corners stay the fallback.
+AUTO_LOCATE_TRAY = False
+TRAY_LOCATE_METHOD = "edges"
+# Camera drift: every DRIFT_CHECK_INTERVAL seconds between cycles, compare the floor around
+# the tray with the reference; if the camera was knocked, move the ROI, masks and calibration
+# with it and carry on.
+DRIFT_MONITORING = True
+
 # Define the 4 points of the tray on the camera image
 fixed_tray_contour = np.array([
     (374, 122), (238, 133), (267, 428), (426, 394)
 ], dtype="int32")
 
-def apply_tray_mask(image, contour):
-    """Mask out everything except the tray region."""
-    mask = np.zeros(image.shape[:2], dtype="uint8")
-    cv2.fillPoly(mask, [contour], 255)
-    return cv2.bitwise_and(image, image, mask=mask)
+calibration_lut = build_calibration_lut(calibration_model, fixed_tray_contour)
+grasp = deepest_point if GRASP_AT_DEEPEST_POINT else None
+verifier = PickVerifier(pixel_to_motor_times, grasp=grasp) if VERIFY_PICKS else None
+drift_monitor = None
 
-def perform_pick_and_place(ser, camera, reference_image):
-    """Performs a single pick-and-place cycle using image subtraction."""
-    print("\n--- Starting new detection cycle ---")
-    
-    ret, live_image = camera.read()
-    if not ret:
-        print("❌ Error: Could not read frame.")
-        return False
-    
-    # Apply tray mask and convert to grayscale for comparison
-    ref_gray = cv2.cvtColor(apply_tray_mask(reference_image, fixed_tray_contour), cv2.COLOR_BGR2GRAY)
-    live_gray = cv2.cvtColor(apply_tray_mask(live_image, fixed_tray_contour), cv2.COLOR_BGR2GRAY)
-
-    # Calculate absolute difference
-    diff = cv2.absdiff(ref_gray, live_gray)
-    _, thresh = cv2.threshold(diff, THRESHOLD_VALUE, 255, cv2.THRESH_BINARY)
-    thresh = cv2.dilate(thresh, None, iterations=DILATION_ITERATIONS)
-
-    # Find contours of changes
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    found_object = False
-    if contours:
-        largest_contour = max(contours, key=cv2.contourArea)
-        if cv2.contourArea(largest_contour) > MIN_CONTOUR_AREA:
-            found_object = True
-            M_contour = cv2.moments(largest_contour)
-            if M_contour["m00"] != 0:
-                cx = int(M_contour['m10'] / M_contour['m00'])
-                cy = int(M_contour['m01'] / M_contour['m00'])
-                
-                print(f"✅ Object detected at centroid: ({cx}, {cy})")
-                
-                # Draw the detected object and centroid for visualization
-                display_frame = live_image.copy()
-                cv2.polylines(display_frame, [fixed_tray_contour], True, (255, 0, 0), 2)
-                cv2.drawContours(display_frame, [largest_contour], -1, (0, 255, 0), 2)
-                cv2.circle(display_frame, (cx, cy), 5, (0, 0, 255), -1)
-                cv2.imshow("Detection Result", display_frame)
-                cv2.waitKey(1)
-            else:
-                found_object = False
+def configured_detector_params():
+    """The detector settings above, in the form saved to the session file."""
+    if DETECTOR == "subtraction":
+        return {"threshold": THRESHOLD_VALUE, "min_area": MIN_CONTOUR_AREA,
+                "dilation_iterations": DILATION_ITERATIONS, "learning_rate": BACKGROUND_LEARNING_RATE,
+                "flatten_scale": FLATTEN_SCALE if FLATTEN_TRAY else None, "pyramid_scale": PYRAMID_SCALE}
+    return dict(DETECTOR_OPTIONS)
 
-    if not found_object:
-        print("⚠️ No object detected.")
-        return False
+def scheduler():
+    """The PickCycle scheduler chosen by PIPELINED_PICKING and BATCH_PICKING."""
+    if PIPELINED_PICKING:
+        return "pipelined"
+    return "batch" if BATCH_PICKING else "single"
 
-    # Calculate and Execute Movements
-    x_to_object_time = (x_slope * cx) + x_intercept
-    y_to_object_time = (y_slope * cy) + y_intercept
-    x_to_object_time = max(0, x_to_object_time)
-    y_to_object_time = max(0, y_to_object_time)
+async def run_cycle(picker):
+    """Runs one automatic cycle in the configured mode. Returns the number of objects picked."""
+    picked = await picker.cycle()
+    METRICS.export(METRICS_JSONL, METRICS_PROM)
+    return picked
 
-    print("\nStarting pick-and-place cycle.")
-    
-    # === STEP A: MOVE TO OBJECT ===
-    print("--- Step 1: Moving to object location ---")
-    send_command(ser, f"XY F {x_to_object_time:.2f} {y_to_object_time:.2f}")
-    
-    # === STEP B: PICK UP OBJECT ===
-    print("--- Step 2: Picking up the object ---")
-    send_command(ser, "Z D 2.3")
-    send_command(ser, "C C")
-    send_command(ser, "Z U 3.1")
-    
-    # === STEP C: MOVE TO BIN ===
-    print("--- Step 3: Moving to drop-off bin (home position) ---")
-    send_command(ser, f"XY R {x_to_object_time:.2f} {y_to_object_time:.2f}")
-
-    # === STEP D: DROP OFF OBJECT ===
-    print("--- Step 4: Dropping off the object ---")
-    send_command(ser, "C O")
-    
-    print("\n✅ Cycle complete!")
-    return True
-
-def run_manual_mode(ser):
+async def run_manual_mode(arm):
     """Allows manual control of the robot arm via the console."""
     print("Manual control mode activated. Enter commands (e.g., 'X F 1.0').")
     print("Type 'q' to return to the main menu.")
     while True:
-        command = input("Enter command: ").strip()
-        if command.lower() == 'q':
+        command = await controller.read_line("Enter command: ")
+        if command is None or command.lower() == 'q':
             print("Returning to main menu.")
             break
         if command:
             try:
-                send_command(ser, command)
+                await send_command(arm, command)
+            except ArmCommandError as e:
+                print(f"❌ {e}")
+            except ArmResetError as e:
+                # The link is back; the operator is already where the arm can be brought home.
+                print(f"🛑 {e}")
             except serial.SerialException as e:
                 print(f"❌ Serial communication error: {e}. Check the connection.")
                 break
 
-def run_one_time_mode(ser, camera, reference_image):
+async def run_one_time_mode(picker):
     """Runs a single automatic pick-and-place cycle."""
-    perform_pick_and_place(ser, camera, reference_image)
-    print("One-time cycle complete. Returning to main menu.")
+    await run_cycle(picker)
+    print("One-time cycle complete.")
+    if verifier is not None:
+        print(f"🎯 {verifier.summary()}")
+
+async def run_continuous_mode(picker):
+    """Runs automatic pick-and-place cycles continuously until stopped from the menu.
 
-def run_continuous_mode(ser, camera, reference_image):
-    """Runs automatic pick-and-place cycles continuously."""
+    A dropped serial link is reconnected and the loop carries on. If reopening the port
+    reset the Arduino in the middle of a move (ArmResetError), the mode stops instead: the
+    firmware has no position feedback, so the interrupted cycle cannot be resumed and the
+    arm has to be brought home in manual mode before continuous mode is started again.
+    """
     print("Continuous automatic mode activated.")
-    print("Press 'q' at any time to quit the program.")
-    while True:
-        try:
-            if perform_pick_and_place(ser, camera, reference_image):
-                print("Cycle complete. Waiting 10 seconds before next scan...")
-                time.sleep(10)
-            else:
-                print("No object found. Scanning again in 10 seconds...")
-                time.sleep(10)
-
-        except serial.SerialException as e:
-            print(f"❌ Serial communication error: {e}. Attempting to reconnect...")
-            if ser.is_open:
-                ser.close()
-            time.sleep(2)
+    print("Type 'S' to stop it, '1' to take manual control, or 'Q' (or Ctrl+C) to quit.")
+    # The motion trigger diffs against the subtraction detector's reference, so the
+    # other detectors always run on the timer.
+    arm, detector = picker.arm, picker.detector
+    trigger = None
+    if isinstance(detector, ImageSubtractionDetector):
+        trigger = MotionTrigger(picker.grabber, detector, TRIGGER_SETTLE_FRAMES,
+                                TRIGGER_IDLE_POLL_HZ, TRIGGER_MOTION_THRESHOLD)
+    last_drift_check = time.monotonic()
+    try:
+        while True:
             try:
-                ser = serial.Serial(PORT, BAUD_RATE, timeout=1)
-                time.sleep(ARDUINO_RESET_DELAY)
-                print("✅ Reconnected to Arduino.")
-            except serial.SerialException:
-                print("❌ Failed to reconnect. Check the physical connection and try again.")
-                return # Exit this mode
+                if drift_monitor is not None and time.monotonic() - last_drift_check >= DRIFT_CHECK_INTERVAL:
+                    last_drift_check = time.monotonic()
+                    move = await picker.check_drift(drift_monitor, trigger)
+                    if move is not None:
+                        dx, dy = move.shift
+                        print(f"📷 Camera moved ({dx:+.1f}, {dy:+.1f}) px since setup; tray, masks and "
+                              "calibration follow it.")
+                if CONTINUOUS_TRIGGER == "timer" or trigger is None:
+                    picked = await run_cycle(picker)
+                    if picked:
+                        if trigger:
+                            trigger.record_cycle(int(picked))
+                        print(f"Cycle complete. Waiting {TIMER_CYCLE_DELAY} seconds before next scan...")
+                    else:
+                        print(f"No object found. Scanning again in {TIMER_CYCLE_DELAY} seconds...")
+                    await asyncio.sleep(TIMER_CYCLE_DELAY)
+                elif await controller.vision(trigger.wait, TRIGGER_WAIT_TIMEOUT):
+                    picked = await run_cycle(picker)
+                    if picked:
+                        trigger.record_cycle(int(picked))
+                        print(f"📈 {trigger.summary()}")
+                    else:
+                        # Whatever changed the tray is not pickable; wait for the scene to change.
+                        trigger.disarm()
+
+            except serial.SerialException as e:
+                # The command already tried to reconnect and gave up; keep trying until stopped.
+                print(f"❌ Serial communication error: {e}. Waiting for the arm to come back...")
+                await arm.reconnect()
+    finally:
+        if trigger:
+            print(f"📈 {trigger.summary()}")
+        if verifier is not None:
+            print(f"🎯 {verifier.summary()}")
+        if drift_monitor is not None:
+            print(f"📷 {drift_monitor.summary()}")
+        if arm.connection is not None:
+            print(f"🔌 {arm.connection.summary()}")
+
+async def main_menu(controller):
+    """Operator console. Automatic modes run in the background, so the menu stays live and any
+    choice pre-empts a running cycle at its next await (the move in progress still completes)."""
+    if arm.connection is not None:
+        controller.start_background(arm.watch_connection(), "Serial health check")
+    while not controller.stopping:
+        print("\n--- Main Menu ---")
+        print("1. Manual Control")
+        print("2. Automatic One-Time Cycle")
+        print("3. Automatic Continuous Cycle")
+        print("S. Stop the automatic cycle")
+        print("Q. Quit")
         
-        # Check for 'q' key press to quit the program
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            print("Quitting program as requested...")
-            sys.exit()
+        choice = await controller.read_line("Enter your choice: ")
+        if choice is None:
+            break
+        choice = choice.lower()
+        
+        try:
+            if choice == '1':
+                await controller.preempt()
+                await run_manual_mode(arm)
+            elif choice == '2':
+                controller.start_mode(run_one_time_mode(picker), "One-time")
+            elif choice == '3':
+                controller.start_mode(run_continuous_mode(picker), "Continuous")
+            elif choice == 's':
+                await controller.preempt()
+            elif choice == 'q':
+                print("Exiting program.")
+                break
+            else:
+                print("Invalid choice. Please enter 1, 2, 3, S, or Q.")
+        except ArmResetError as e:
+            print(f"🛑 {e}")
+
+# Command-line options for offline runs
+parser = argparse.ArgumentParser(description="Automated arm-based textile sorter.")
+parser.add_argument("--record", metavar="DIR", help="record every camera frame and its timestamp to DIR")
+parser.add_argument("--replay", metavar="DIR", help="read frames from a recording instead of the camera")
+parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of at the recorded timing")
+parser.add_argument("--loop", action="store_true", help="restart the replay when it reaches the end")
+parser.add_argument("--headless", action="store_true", help="no windows or drawing (see HEADLESS)")
+parser.add_argument("--metrics", action="store_true", help="record per-stage timings (see METRICS_ENABLED)")
+parser.add_argument("--resume", action="store_true",
+                    help=f"warm start from the saved session ({SESSION_PATH}) if the live tray still matches it")
+parser.add_argument("--port", help=f"serial port of the arm, tried first (default: {PORT}); "
+                                     "e.g. the pseudo-terminal printed by firmware_model.py")
+parser.add_argument("--dry-run", action="store_true",
+                    help="do not open the serial port; acknowledge every arm command immediately")
+args = parser.parse_args()
+PORT = args.port or PORT
+launched_at = time.monotonic()
+METRICS.enabled = METRICS_ENABLED or args.metrics
+headless = HEADLESS or args.headless
+visualizer = None if headless else Visualizer().start()
+controller = Controller()
 
 # Main program loop
 try:
-    print(f"Connecting to Arduino on port {PORT} at {BAUD_RATE} baud...")
-    ser = serial.Serial(PORT, BAUD_RATE, timeout=1)
-    time.sleep(ARDUINO_RESET_DELAY)
-    print("Connection established. Please wait for camera initialization...")
+    if args.dry_run:
+        print("Dry run: arm commands will not be sent.")
+        arm = AsyncArm(DryRunArm())
+    else:
+        print(f"Looking for the arm firmware (trying {PORT} first) at {BAUD_RATE} baud...")
+        connection = SerialConnection(PORT, BAUD_RATE)
+        ser = connection.connect(CONNECT_TIMEOUT)
+        arm = AsyncArm(ArmSerial(ser), connection)
+        print(f"Connection established on {connection.port}. Please wait for camera initialization...")
     
-    camera = cv2.VideoCapture(1)
+    if args.replay:
+        camera = ReplayCamera(args.replay, realtime=not args.fast, loop=args.loop)
+        print(f"Replaying frames from '{args.replay}'.")
+    else:
+        camera = cv2.VideoCapture(CAMERA_INDEX)
     if not camera.isOpened():
         print("❌ Error: Could not open camera.")
         raise Exception("Camera not found")
+    if args.record:
+        camera = RecordingCamera(camera, FrameRecorder(args.record))
+        print(f"Recording frames to '{args.record}'.")
+    # Keep the driver queue drained so every read is the newest frame.
+    grabber = FrameGrabber(camera).start()
     print("Camera initialized.")
     
-    # --- NEW: Capture the reference image of the empty tray ---
-    print("\n--- Initial Setup ---")
-    print("Please ensure the tray is EMPTY and clear of any objects.")
-    input("Press Enter to capture the reference image...")
-    
-    ret, reference_image = camera.read()
-    if not ret:
-        print("❌ Error: Failed to capture reference image.")
-        raise Exception("Reference image capture failed")
-    cv2.imshow("Reference Image Captured", reference_image)
-    cv2.waitKey(1000)
-    cv2.destroyAllWindows()
-    print("✅ Reference image of the empty tray captured successfully!")
-    
-    while True:
-        print("\n--- Main Menu ---")
-        print("1. Manual Control")
-        print("2. Automatic One-Time Cycle")
-        print("3. Automatic Continuous Cycle")
-        print("Q. Quit")
-        
-        choice = input("Enter your choice: ").strip().lower()
-        
-        if choice == '1':
-            run_manual_mode(ser)
-        elif choice == '2':
-            run_one_time_mode(ser, camera, reference_image)
-        elif choice == '3':
-            run_continuous_mode(ser, camera, reference_image)
-        elif choice == 'q':
-            print("Exiting program.")
-            break
+    # --- Warm start: reuse the saved session if the live tray still looks like it ---
+    session = None
+    if args.resume:
+        try:
+            session = load_session(SESSION_PATH)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Cannot resume from '{SESSION_PATH}' ({e}). Falling back to interactive setup.")
+    if session is not None:
+        ret, live_frame = grabber.read()
+        threshold = session.detector_params.get("threshold", THRESHOLD_VALUE)
+        matches, changed = session_matches(session, live_frame, threshold) if ret else (False, 1.0)
+        if matches:
+            reference_image = session.reference_image
+            fixed_tray_contour = session.tray_contour
+            calibration_model = session.calibration
+            calibration_lut = build_calibration_lut(calibration_model, fixed_tray_contour)
+            DETECTOR = session.detector_name
+            detector = build_detector(DETECTOR, reference_image, fixed_tray_contour, session.detector_params)
+            if session.background is not None and isinstance(detector, ImageSubtractionDetector):
+                detector.set_background(session.background)
+            print(f"✅ Resumed session from '{SESSION_PATH}' ({changed:.1%} of the tray differs); "
+                  f"ready {time.monotonic() - launched_at:.2f} s after launch.")
         else:
-            print("Invalid choice. Please enter 1, 2, 3, or Q.")
+            print(f"⚠️ The live tray does not match the saved session ({changed:.1%} changed). "
+                  "Falling back to interactive setup.")
+            session = None
+
+    if session is None:
+        # --- NEW: Capture the reference image of the empty tray ---
+        print("\n--- Initial Setup ---")
+        print("Please ensure the tray is EMPTY and clear of any objects.")
+        setup_choice = input("Press Enter to capture the reference image (or type 'L' to load the saved background)...")
+        
+        ret, reference_image = grabber.read()
+        if not ret:
+            print("❌ Error: Failed to capture reference image.")
+            raise Exception("Reference image capture failed")
+        print("✅ Reference image of the empty tray captured successfully!")
+        if AUTO_LOCATE_TRAY:
+            corners = find_tray_corners(reference_image, TRAY_LOCATE_METHOD)
+            if corners is None:
+                print("⚠️ Could not find the tray in the reference image. Using the configured corners.")
+            else:
+                fixed_tray_contour = corners
+                calibration_lut = build_calibration_lut(calibration_model, fixed_tray_contour)
+                print(f"✅ Tray located at {[tuple(point) for point in fixed_tray_contour.tolist()]}.")
+
+        detector = build_detector(DETECTOR, reference_image, fixed_tray_contour, configured_detector_params())
+        if setup_choice.strip().lower() == 'l' and isinstance(detector, ImageSubtractionDetector):
+            try:
+                background = RunningAverageBackground.load(BACKGROUND_FILE)
+                background.learning_rate = BACKGROUND_LEARNING_RATE
+                detector.set_background(background)
+                print(f"✅ Loaded saved background model from '{BACKGROUND_FILE}'.")
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not load saved background ({e}). Using the captured reference instead.")
+        session_params = configured_detector_params()
+    else:
+        session_params = session.detector_params
+    print(f"Using the '{DETECTOR}' detector ({type(detector).__name__}).")
+    if DRIFT_MONITORING:
+        drift_monitor = DriftMonitor(reference_image, fixed_tray_contour, TRAY_LOCATE_METHOD)
+    if visualizer is not None:
+        visualizer.submit(reference_image, fixed_tray_contour)
+    save_session(SESSION_PATH, reference_image, fixed_tray_contour, calibration_model, DETECTOR, session_params,
+                 getattr(detector, "background", None), time.time())
+    picker = PickCycle(arm, grabber, detector, calibration_lut, controller.vision_executor, scheduler(), verifier,
+                       grasp, FRAME_TIMEOUT, ARM_FOOTPRINT_RADIUS, visualizer, log=print)
+    
+    asyncio.run(controller.run(main_menu))
 
 except serial.SerialException as e:
-    print(f"❌ Could not open serial port '{PORT}'. Check the connection and port name.")
+    print(f"❌ Could not connect to the arm (tried '{PORT}' first). Check the connection and port name.")
     print(f"Error: {e}")
 except Exception as e:
     print(f"❌ An unexpected error occurred: {e}")
 finally:
-    if 'ser' in locals() and ser.is_open:
+    if 'grabber' in locals():
+        grabber.stop()
+    # Let vision work left behind by a cancelled cycle finish before touching the detector.
+    controller.close()
+    # Once the camera moved, the learned background is cropped to where the tray went, not to the
+    # setup's tray; the session keeps the setup and the next run starts from its reference.
+    camera_moved = drift_monitor is not None and drift_monitor.moves > 0
+    if ('detector' in locals() and isinstance(detector, ImageSubtractionDetector) and BACKGROUND_LEARNING_RATE > 0
+            and not camera_moved):
+        detector.background.save(BACKGROUND_FILE)
+        print(f"Background model saved to '{BACKGROUND_FILE}'.")
+    if 'session_params' in locals():
+        # Keep the learned background for the next --resume.
+        save_session(SESSION_PATH, reference_image, fixed_tray_contour, calibration_model, DETECTOR, session_params,
+                     None if camera_moved else getattr(detector, "background", None), time.time())
+        print(f"Session saved to '{SESSION_PATH}'.")
+    if 'arm' in locals():
+        ser = arm.ser  # may have been replaced by a reconnect
+    if 'ser' in locals() and ser is not None and ser.is_open:
         ser.close()
         print("Serial connection closed.")
+    if 'arm' in locals():
+        arm.close()
     if 'camera' in locals() and camera.isOpened():
         camera.release()
         print("Camera released.")
-    cv2.destroyAllWindows()
+    if visualizer is not None:
+        visualizer.stop()
@@ -0,0 +1,132 @@
+import time
+
+import serial
+
+from metrics import METRICS
+
+# Completion lines printed by BTS7960_Based_control.ino once a command has finished.
+AXIS_DONE = "Done"
+XY_DONE = "Simultaneous XY move complete."
+CLAW_OPENED = "Claw OPENED"
+CLAW_CLOSED = "Claw CLOSED"
+ERROR_PREFIX = "Error"
+
+SWITCH_DELAY = 0.2     # firmware's switchDelay before every single-axis move (seconds)
+TIMEOUT_FACTOR = 1.2   # allowed slack on the expected duration
+TIMEOUT_MARGIN = 1.0   # fixed allowance for serial latency and parsing (seconds)
+
+
+class ArmTimeoutError(serial.SerialException):
+    """The firmware did not acknowledge a command in time (usually a dropped USB link)."""
+
+
+class ArmCommandError(Exception):
+    """The firmware rejected a command."""
+
+
+class ArmResetError(Exception):
+    """The link dropped during a command and reopening it reset the Arduino.
+
+    A timed move stopped somewhere unknown (or had already finished if only
+    its reply was lost), and the claw let go of whatever it held. Only an
+    operator can bring the arm back to a known position.
+    """
+
+
+def _to_float(text):
+    # Arduino's String.toFloat() returns 0 for anything it cannot parse.
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def replay_safe(command):
+    """True for commands that end in the same state however often they run (opening the claw).
+
+    Timed moves are relative, so repeating one from an unknown position overshoots.
+    """
+    parts = command.strip().upper().split()
+    return len(parts) == 2 and parts[0].startswith("C") and parts[1].startswith("O")
+
+
+def expected_reply(command):
+    """Returns (expected_seconds, completion_line_prefix) for a firmware command."""
+    parts = command.strip().upper().split()
+    if not parts:
+        raise ArmCommandError("Empty command")
+
+    if parts[0] == "XY":
+        if len(parts) != 4:
+            raise ArmCommandError(f"Expected 'XY <F|R> <x_seconds> <y_seconds>', got {command!r}")
+        return max(_to_float(parts[2]), _to_float(parts[3]), 0.0), XY_DONE
+
+    motor = parts[0][0]
+    direction = parts[1][0] if len(parts) > 1 else ""
+    if motor == "C":
+        return 0.0, CLAW_CLOSED if direction == "C" else CLAW_OPENED
+    duration = _to_float(parts[2]) if len(parts) > 2 else 0.0
+    return SWITCH_DELAY + max(duration, 0.0), AXIS_DONE
+
+
+class ArmSerial:
+    """Sends commands to the arm firmware and returns as soon as each one is acknowledged.
+
+    `ser` can be any pyserial port, including one opened on a pseudo-terminal
+    that stands in for the Arduino.
+    """
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.history = []  # (command, expected_seconds, acknowledged_seconds)
+
+    def _read_line(self, deadline):
+        """Reads one reply line, or returns None once the deadline has passed."""
+        buffer = b""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.ser.timeout = remaining
+            buffer += self.ser.readline()
+            if buffer.endswith(b"\n"):
+                return buffer.decode(errors="replace").strip()
+
+    def send(self, command):
+        """Sends one command and blocks until its completion line. Returns the seconds it took."""
+        expected, completion = expected_reply(command)
+        timeout = expected * TIMEOUT_FACTOR + TIMEOUT_MARGIN
+
+        # Anything still queued (banner, a late reply) belongs to an earlier command.
+        self.ser.reset_input_buffer()
+        sent_at = time.monotonic()
+        self.ser.write(f"{command}\n".encode())
+        deadline = sent_at + timeout
+
+        while True:
+            line = self._read_line(deadline)
+            if line is None:
+                raise ArmTimeoutError(f"No '{completion}' reply to '{command}' within {timeout:.1f} s")
+            if line.startswith(ERROR_PREFIX):
+                raise ArmCommandError(f"'{command}' rejected: {line}")
+            if line.startswith(completion):
+                break
+
+        elapsed = time.monotonic() - sent_at
+        self.history.append((command, expected, elapsed))
+        if METRICS.enabled:
+            METRICS.record(f"serial_{command.split()[0].lower()}", elapsed)
+        return elapsed
+
+
+class DryRunArm:
+    """Stands in for ArmSerial when no arm is connected: every command is acknowledged at once."""
+
+    def __init__(self):
+        self.ser = None
+        self.history = []
+
+    def send(self, command):
+        expected, _ = expected_reply(command)
+        self.history.append((command, expected, 0.0))
+        return 0.0
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+# Fraction of each new background pixel blended into the model per update.
+# 0.02 adapts to lighting drift over a few seconds of frames without absorbing
+# a cloth that sits still for a single scan.
+LEARNING_RATE = 0.02
+
+
+class RunningAverageBackground:
+    """Per-pixel running average of the empty tray in grayscale.
+
+    Only pixels classified as background are updated, so cloth on the tray is
+    never learned into the reference. `background` is the uint8 image the
+    detector diffs against; it is updated in place so holders of the array
+    always see the current model.
+    """
+
+    def __init__(self, reference_gray, learning_rate=LEARNING_RATE):
+        self.learning_rate = learning_rate
+        self.mean = reference_gray.astype(np.float32)
+        self.background = reference_gray.copy()
+        self._background_mask = np.empty_like(reference_gray)
+        self.updates = 0
+
+    def update(self, gray, foreground_mask):
+        """Blends `gray` into the model everywhere `foreground_mask` is zero."""
+        cv2.bitwise_not(foreground_mask, dst=self._background_mask)
+        cv2.accumulateWeighted(gray, self.mean, self.learning_rate, mask=self._background_mask)
+        cv2.convertScaleAbs(self.mean, dst=self.background)
+        self.updates += 1
+
+    def save(self, path):
+        """Saves the learned model to a .npz file."""
+        np.savez_compressed(path, mean=self.mean, learning_rate=self.learning_rate)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model written by save()."""
+        with np.load(path) as data:
+            model = cls(np.zeros(data["mean"].shape, dtype=np.uint8), float(data["learning_rate"]))
+            model.mean[...] = data["mean"]
+        cv2.convertScaleAbs(model.mean, dst=model.background)
+        return model
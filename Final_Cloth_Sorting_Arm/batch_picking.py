@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+import cv2
+
+# How far around a planned target the re-check looks for the cloth (pixels).
+RECHECK_PADDING = 20
+
+# A planned pick: the blob as first detected, the calibrated motor times to reach it and
+# the pixel they aim at (its centroid, or the point chosen by a grasp selector).
+PickTarget = namedtuple("PickTarget", ["blob", "x_time", "y_time", "pixel"], defaults=(None,))
+
+
+def xy_move_time(x_time, y_time):
+    """The firmware drives X and Y together, so an XY move lasts as long as its longer axis."""
+    return max(x_time, y_time)
+
+
+def trip_time(target):
+    """Motor time for one pick: out from home to the target and back to the bin at home."""
+    return 2 * xy_move_time(target.x_time, target.y_time)
+
+
+def pick_target(blob, to_motor_times, grasp=None):
+    """The PickTarget for one blob: aimed at `grasp(blob, to_motor_times)` if given, else at its centroid."""
+    pixel = blob.centroid if grasp is None else grasp(blob, to_motor_times)
+    return PickTarget(blob, *to_motor_times(*pixel), pixel)
+
+
+def plan_batch(blobs, to_motor_times, grasp=None):
+    """Turns every detected blob into a PickTarget and orders them for picking.
+
+    `to_motor_times(cx, cy)` is the calibrated pixel-to-motor-time model and
+    `grasp` an optional grasp-point selector (see pick_target()).
+    Because every pick starts and ends at the home bin, the total XY motor
+    time of the batch is the same in any order; shortest trips go first so
+    the most pieces are cleared in the least time if the batch is cut short.
+    """
+    targets = [pick_target(blob, to_motor_times, grasp) for blob in blobs]
+    targets.sort(key=trip_time)
+    return targets
+
+
+def batch_motor_time(targets):
+    """Total XY motor time of a planned batch, in seconds."""
+    return sum(trip_time(target) for target in targets)
+
+
+def recheck_rect(blob, padding=RECHECK_PADDING):
+    """Full-frame (x0, y0, x1, y1) window around a blob for the pre-pick re-check."""
+    x, y, w, h = cv2.boundingRect(blob.contour)
+    return (x - padding, y - padding, x + w + padding, y + h + padding)
+
+
+def recheck_target(detector, frame, target, padding=RECHECK_PADDING):
+    """Looks for the target again in a window around where it was planned.
+
+    Returns the blob nearest the planned centroid, or None if it is gone
+    (picked along with a neighbour, or knocked off the tray).
+    """
+    blobs = detector.detect(frame, recheck_rect(target.blob, padding))
+    if not blobs:
+        return None
+    px, py = target.blob.centroid
+    return min(blobs, key=lambda blob: (blob.centroid[0] - px) ** 2 + (blob.centroid[1] - py) ** 2)
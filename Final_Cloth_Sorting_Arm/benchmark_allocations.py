@@ -0,0 +1,160 @@
+"""Measures how much memory the subtraction detector allocates per frame, and its latency jitter.
+
+Runs the same frames through two detectors, taking turns frame by frame:
+one allocating a new array at every step of the diff chain and one writing
+into its reused workspace (reuse_buffers). Reports for each:
+
+    held_blocks  memory blocks a frame leaves allocated while its blobs are
+                 held (tracemalloc snapshot diff, mean): the returned
+                 contours and Blob tuples, and any buffer the frame grew
+    held_kb      their size (mean)
+    peak_kb      memory in use at the busiest point of the frame, over what
+                 it started with: its temporaries (traced peak, mean)
+    peak_max_kb  the largest peak seen
+    mean_ms, std_ms, p99_ms, max_ms   per-frame latency
+
+--top N lists the N source lines that left the most blocks allocated in
+the reuse run.
+
+Usage:
+    python benchmark_allocations.py [FRAMES_DIR] [--tray "x,y x,y x,y x,y"]
+    python benchmark_allocations.py --frames 300 --size 1080 1920 [--flatten-scale 1.0] [--pyramid-scale 0.5]
+
+Without FRAMES_DIR the frames come from a simulated cell with the final
+rig's tray, scaled to --size.
+"""
+import argparse
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from benchmark_detectors import load_frames, parse_tray
+from detectors import whole_frame_contour
+from simulated_cell import SimulatedCell
+from station_setup import build_detector
+from station_supervisor import SIMULATED_TRAY
+
+SIMULATED_FRAMES = 300
+SIMULATED_SIZE = (480, 640)  # the frame size SIMULATED_TRAY was drawn on
+# The snapshots themselves and this script's bookkeeping are not the detector's.
+TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+
+def simulated_frames(count, size):
+    """`count` frames of a simulated cell, the first one of the empty tray, with the tray scaled to `size`."""
+    scale = np.array([size[1] / SIMULATED_SIZE[1], size[0] / SIMULATED_SIZE[0]])
+    tray = np.round(np.array(SIMULATED_TRAY) * scale).astype("int32")
+    cell = SimulatedCell(tray, None, frame_size=size, refill_delay=0.0)
+    frames = [("empty", cell.render())]
+    cell.start_feeding()
+    for index in range(count):
+        if index % 30 == 0:
+            cell.pieces.clear()  # a new batch every 30 frames
+        frames.append((str(index), cell.render()))
+    return tray, frames
+
+
+def measure(detectors, frames):
+    """Runs every detector over every frame.
+
+    Returns {name: results dict}, {name: each frame's centroids} and
+    {name: Counter of blocks left allocated per source line}.
+
+    The detectors take turns on each frame, in alternating order, so drift
+    in the machine's load or clock weighs on all of them alike.
+    """
+    for detector in detectors.values():
+        for _, frame in frames[:3]:
+            detector.detect(frame)  # warm-up: workspace buffers, OpenCV thread pool
+
+    names = list(detectors)
+    latencies = {name: [] for name in names}
+    centroids = {name: [] for name in names}
+    for index, (_, frame) in enumerate(frames):
+        for name in (names if index % 2 == 0 else names[::-1]):
+            start = time.perf_counter()
+            blobs = detectors[name].detect(frame)
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            centroids[name].append([blob.centroid for blob in blobs])
+
+    results, held_lines = {}, {}
+    for name, detector in detectors.items():
+        # Allocations in a separate pass so tracing overhead does not skew the latencies.
+        held_blocks, held_kb, peaks = [], [], []
+        lines = held_lines[name] = Counter()
+        tracemalloc.start()
+        for _, frame in frames:
+            before = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            blobs = detector.detect(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+            del blobs  # only now: the snapshot counts what the caller holds
+            grown = [stat for stat in after.compare_to(before, "lineno") if stat.count_diff > 0]
+            held_blocks.append(sum(stat.count_diff for stat in grown))
+            held_kb.append(sum(stat.size_diff for stat in grown) / 1e3)
+            peaks.append((peak - start) / 1e3)
+            for stat in grown:
+                lines[str(stat.traceback)] += stat.count_diff
+        tracemalloc.stop()
+        results[name] = {
+            "held_blocks": float(np.mean(held_blocks)),
+            "held_kb": float(np.mean(held_kb)),
+            "peak_kb": float(np.mean(peaks)),
+            "peak_max_kb": float(np.max(peaks)),
+            "mean_ms": float(np.mean(latencies[name])),
+            "std_ms": float(np.std(latencies[name])),
+            "p99_ms": float(np.percentile(latencies[name], 99)),
+            "max_ms": float(np.max(latencies[name])),
+        }
+    return results, centroids, held_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames_dir", nargs="?", help="directory of recorded frames (default: simulated frames)")
+    parser.add_argument("--tray", help="tray corners as 'x,y x,y x,y x,y' (default: whole frame)")
+    parser.add_argument("--frames", type=int, default=SIMULATED_FRAMES, help="number of simulated frames")
+    parser.add_argument("--size", type=int, nargs=2, default=SIMULATED_SIZE, metavar=("HEIGHT", "WIDTH"),
+                        help="simulated frame size")
+    parser.add_argument("--flatten-scale", type=float, help="flatten the tray at this scale")
+    parser.add_argument("--pyramid-scale", type=float, help="coarse-to-fine search at this scale")
+    parser.add_argument("--learning-rate", type=float, default=0.0, help="background learning rate")
+    parser.add_argument("--top", type=int, default=0, metavar="N",
+                        help="list the N source lines that leave the most blocks allocated")
+    args = parser.parse_args()
+
+    if args.frames_dir:
+        frames = load_frames(args.frames_dir)
+        if not frames:
+            print(f"❌ No images found in '{args.frames_dir}'.")
+            return
+        tray = parse_tray(args.tray) if args.tray else whole_frame_contour(frames[0][1].shape)
+    else:
+        tray, frames = simulated_frames(args.frames, tuple(args.size))
+    reference = frames[0][1]
+    params = {"flatten_scale": args.flatten_scale, "pyramid_scale": args.pyramid_scale,
+              "learning_rate": args.learning_rate}
+
+    print(f"Measuring {len(frames)} frame(s) of {reference.shape[1]}x{reference.shape[0]}...")
+    detectors = {name: build_detector("subtraction", reference, tray, dict(params, reuse_buffers=reuse))
+                 for name, reuse in (("allocating", False), ("reuse_buffers", True))}
+    results, centroids, held_lines = measure(detectors, frames)
+
+    columns = list(results["allocating"])
+    print(f"{'':<14}" + "".join(f"{column:>14}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<14}" + "".join(f"{result[column]:>14.2f}" for column in columns))
+    same = centroids["allocating"] == centroids["reuse_buffers"]
+    print(f"Detections {'identical' if same else 'DIFFER'} with and without buffer reuse.")
+    if args.top:
+        print("Blocks left allocated per frame by source line (reuse_buffers):")
+        for line, blocks in held_lines["reuse_buffers"].most_common(args.top):
+            print(f"{blocks / len(frames):>8.2f}  {line}")
+
+
+if __name__ == "__main__":
+    main()
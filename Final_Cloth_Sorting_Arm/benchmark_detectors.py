@@ -0,0 +1,158 @@
+"""Feeds the same recorded frames through each cloth detector and compares them.
+
+Reports per-frame latency percentiles, peak traced memory and, when labels
+are given, centroid error against ground truth.
+
+Usage:
+    python benchmark_detectors.py FRAMES_DIR [--reference empty_tray.png] [--labels labels.csv]
+    python benchmark_detectors.py FRAMES_DIR --detectors green green_fast --baseline green
+
+FRAMES_DIR is a directory of images or a recording made with
+`Main Python Program.py --record`. labels.csv has the header `frame,cx,cy`
+and one row per cloth piece, where `frame` is the image file name (or the
+zero-based frame index for a recording). Frames with no rows are labelled
+empty. --baseline adds each detector's median per-frame speedup over the
+named one.
+"""
+import argparse
+import csv
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detectors import DETECTORS, create_detector, whole_frame_contour
+from frame_source import is_recording, iter_recording
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+MATCH_RADIUS = 25  # a detection further than this from a labelled centroid is a miss (pixels)
+
+
+def load_frames(frames_dir):
+    """Returns [(name, image)] for every frame of a recording or image directory, in order."""
+    if is_recording(frames_dir):
+        return [(str(index), frame) for index, (_, frame) in enumerate(iter_recording(frames_dir))]
+    names = sorted(name for name in os.listdir(frames_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [(name, cv2.imread(os.path.join(frames_dir, name))) for name in names]
+
+
+def load_labels(path):
+    """Returns {frame name: [(cx, cy), ...]} from a labels CSV."""
+    labels = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            labels.setdefault(row["frame"], []).append((float(row["cx"]), float(row["cy"])))
+    return labels
+
+
+def parse_tray(text):
+    """Parses 'x,y x,y x,y x,y' into a tray contour."""
+    return np.array([tuple(int(v) for v in point.split(",")) for point in text.split()], dtype="int32")
+
+
+def match_centroids(detected, truth, radius=MATCH_RADIUS):
+    """Greedily pairs each labelled centroid with the nearest unused detection.
+
+    Returns (errors in pixels, misses, false positives).
+    """
+    unused = list(detected)
+    errors = []
+    misses = 0
+    for tx, ty in truth:
+        if not unused:
+            misses += 1
+            continue
+        distances = [np.hypot(cx - tx, cy - ty) for cx, cy in unused]
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > radius:
+            misses += 1
+            continue
+        errors.append(distances[nearest])
+        unused.pop(nearest)
+    return errors, misses, len(unused)
+
+
+def benchmark(detector, frames, labels=None):
+    """Runs one detector over every frame. Returns a dict of results."""
+    detector.detect(frames[0][1])  # warm-up: lazily built masks, OpenCV thread pool
+
+    latencies = []
+    errors = []
+    misses = false_positives = 0
+    for name, frame in frames:
+        start = time.perf_counter()
+        blobs = detector.detect(frame)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if labels is not None:
+            frame_errors, frame_misses, frame_false = match_centroids(
+                [blob.centroid for blob in blobs], labels.get(name, []))
+            errors.extend(frame_errors)
+            misses += frame_misses
+            false_positives += frame_false
+
+    # Memory in a separate pass so tracing overhead does not skew the latencies.
+    tracemalloc.start()
+    for _, frame in frames:
+        detector.detect(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "p50_ms": np.percentile(latencies, 50),
+        "p90_ms": np.percentile(latencies, 90),
+        "p99_ms": np.percentile(latencies, 99),
+        "peak_mb": peak / 1e6,
+    }
+    if labels is not None:
+        result["mean_error_px"] = np.mean(errors) if errors else float("nan")
+        result["misses"] = misses
+        result["false_positives"] = false_positives
+    return result
+
+
+def add_speedup(results, baseline):
+    """Adds a `speedup` column: the baseline's median latency over each detector's."""
+    for result in results.values():
+        result["speedup"] = results[baseline]["p50_ms"] / result["p50_ms"]
+
+
+def print_report(results):
+    columns = list(next(iter(results.values())))
+    print(f"{'detector':<12}" + "".join(f"{column:>16}" for column in columns))
+    for name, result in results.items():
+        cells = "".join(f"{result[column]:>16.2f}" if isinstance(result[column], float) else f"{result[column]:>16}"
+                        for column in columns)
+        print(f"{name:<12}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="directory of recorded frames")
+    parser.add_argument("--reference", help="empty-tray image for image subtraction (default: the first frame)")
+    parser.add_argument("--labels", help="ground-truth centroids CSV (frame,cx,cy)")
+    parser.add_argument("--tray", help="tray corners as 'x,y x,y x,y x,y' (default: whole frame)")
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS), choices=list(DETECTORS))
+    parser.add_argument("--baseline", choices=list(DETECTORS), help="report speedups relative to this detector")
+    args = parser.parse_args()
+    if args.baseline and args.baseline not in args.detectors:
+        args.detectors.insert(0, args.baseline)
+
+    frames = load_frames(args.frames)
+    if not frames:
+        print(f"❌ No images found in '{args.frames}'.")
+        return
+    reference = cv2.imread(args.reference) if args.reference else frames[0][1]
+    tray = parse_tray(args.tray) if args.tray else whole_frame_contour(reference.shape)
+    labels = load_labels(args.labels) if args.labels else None
+
+    print(f"Benchmarking {len(args.detectors)} detector(s) on {len(frames)} frame(s)...")
+    results = {name: benchmark(create_detector(name, reference, tray), frames, labels) for name in args.detectors}
+    if args.baseline:
+        add_speedup(results, args.baseline)
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
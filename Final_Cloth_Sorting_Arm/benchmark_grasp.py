@@ -0,0 +1,136 @@
+"""Compares picking at the centroid with picking at the deepest point of each piece.
+
+Replays seeded scenes of a simulated tray through the subtraction detector.
+Each detected piece is aimed at once at its centroid and once at its
+deepest point. The aim goes through the calibration to motor times (to the
+firmware's two decimals) and back to the pixel the claw actually reaches, as
+the simulated arm does. A grasp succeeds if that pixel is on a piece's fabric.
+Reports the success rate per piece shape and the grasp-point cost per piece.
+
+Usage:
+    python benchmark_grasp.py [--scenes 200] [--shapes ellipse L ring] [--calibration NAME]
+    python benchmark_grasp.py FRAMES_DIR [--reference empty_tray.png] [--tray "x,y x,y x,y x,y"]
+
+With FRAMES_DIR the frames of a recording are replayed instead. Without the
+true cloth outline, a grasp then counts as on the fabric if it lies deeper
+inside the detected blob than the detector's dilation reaches.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmark_detectors import load_frames, parse_tray
+from calibration import CalibrationModel, load_calibration_set
+from detectors import DILATION_ITERATIONS, whole_frame_contour
+from grasp_point import deepest_point, depth_map
+from simulated_cell import GRAB_TOLERANCE, SimulatedCell
+from station_setup import build_calibration_lut, build_detector
+from station_supervisor import SIMULATED_TRAY
+
+SCENES = 200
+SHAPES = ("ellipse", "L", "ring")
+DETECTOR_PARAMS = {"threshold": 50, "min_area": 225, "dilation_iterations": DILATION_ITERATIONS}
+
+
+def centroid_point(blob, to_motor_times=None):
+    return blob.centroid
+
+
+SELECTORS = {"centroid": centroid_point, "deepest": deepest_point}
+
+
+def claw_pixel(lut, pixel):
+    """The pixel the claw reaches when aimed at `pixel`: motor times as sent to the firmware, mapped back."""
+    x_time, y_time = lut(*pixel)
+    return lut.to_pixel(round(x_time, 2), round(y_time, 2))
+
+
+def replay_simulated(scenes, shapes, lut):
+    """Returns {selector: {shape: [successes, attempts]}} and {selector: [ms per grasp point]}."""
+    cell = SimulatedCell(np.array(SIMULATED_TRAY, dtype=np.int32), lut, seed=1, refill_delay=0.0, shapes=shapes)
+    detector = build_detector("subtraction", cell.render(), cell.tray_contour, DETECTOR_PARAMS)
+    cell.start_feeding()
+    results = {name: {shape: [0, 0] for shape in shapes} for name in SELECTORS}
+    timings = {name: [] for name in SELECTORS}
+    for _ in range(scenes):
+        cell.pieces.clear()
+        for blob in detector.detect(cell.render()):
+            # The piece the blob came from is the one under its deepest point, which is always on it.
+            index, _ = cell.piece_under(deepest_point(blob))
+            shape = cell.pieces[index][0]
+            for name, select in SELECTORS.items():
+                start = time.perf_counter()
+                pixel = select(blob, lut)
+                timings[name].append((time.perf_counter() - start) * 1000)
+                claw = claw_pixel(lut, pixel)
+                _, depth = cell.piece_under(claw) if claw is not None else (None, float("-inf"))
+                results[name][shape][0] += depth >= -GRAB_TOLERANCE
+                results[name][shape][1] += 1
+    return results, timings
+
+
+def replay_recording(frames, reference, tray, lut):
+    """replay_simulated() for recorded frames; every piece counts as shape "recorded"."""
+    detector = build_detector("subtraction", reference, tray, DETECTOR_PARAMS)
+    results = {name: {"recorded": [0, 0]} for name in SELECTORS}
+    timings = {name: [] for name in SELECTORS}
+    for _, frame in frames:
+        for blob in detector.detect(frame):
+            distances, (x0, y0) = depth_map(blob)
+            for name, select in SELECTORS.items():
+                start = time.perf_counter()
+                pixel = select(blob, lut)
+                timings[name].append((time.perf_counter() - start) * 1000)
+                claw = claw_pixel(lut, pixel) or pixel
+                row, col = claw[1] - y0, claw[0] - x0
+                inside = 0 <= row < distances.shape[0] and 0 <= col < distances.shape[1]
+                # The mask grew by the dilation, so only deeper points are certainly on the cloth.
+                results[name]["recorded"][0] += inside and distances[row, col] > DILATION_ITERATIONS
+                results[name]["recorded"][1] += 1
+    return results, timings
+
+
+def print_report(results, timings):
+    shapes = list(next(iter(results.values())))
+    print(f"{'grasp at':<10}" + "".join(f"{shape:>12}" for shape in shapes) + f"{'all':>12}{'ms/piece':>10}")
+    for name, per_shape in results.items():
+        cells = "".join(f"{hits / total:>12.1%}" if total else f"{'n/a':>12}" for hits, total in per_shape.values())
+        hits, total = (sum(values) for values in zip(*per_shape.values()))
+        print(f"{name:<10}{cells}{hits / max(total, 1):>12.1%}{np.mean(timings[name]):>10.3f}")
+    totals = {name: sum(hits for hits, _ in per_shape.values()) / max(sum(n for _, n in per_shape.values()), 1)
+              for name, per_shape in results.items()}
+    print(f"Pick success change: {100 * (totals['deepest'] - totals['centroid']):+.1f} percentage points "
+          f"over {sum(n for _, n in results['centroid'].values())} pieces.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", nargs="?", help="recording or image directory (default: simulated scenes)")
+    parser.add_argument("--reference", help="empty-tray image (default: the first frame)")
+    parser.add_argument("--tray", help="tray corners as 'x,y x,y x,y x,y' (default: whole frame)")
+    parser.add_argument("--scenes", type=int, default=SCENES, help="simulated scenes to replay")
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES),
+                        help="shapes of the simulated pieces")
+    parser.add_argument("--calibration", help="calibration set (default: the file's default)")
+    args = parser.parse_args()
+
+    _, kind, pixels, times = load_calibration_set(args.calibration)
+    model = CalibrationModel(kind).fit(pixels, times)
+    if args.frames:
+        frames = load_frames(args.frames)
+        if not frames:
+            print(f"❌ No images found in '{args.frames}'.")
+            return
+        reference = cv2.imread(args.reference) if args.reference else frames[0][1]
+        tray = parse_tray(args.tray) if args.tray else whole_frame_contour(reference.shape)
+        results, timings = replay_recording(frames, reference, tray, build_calibration_lut(model, tray))
+    else:
+        lut = build_calibration_lut(model, np.array(SIMULATED_TRAY, dtype=np.int32))
+        results, timings = replay_simulated(args.scenes, tuple(args.shapes), lut)
+    print_report(results, timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Calibration sets shared by the main program and the calibration utility.
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_data.json")
+
+# Model kinds: polynomial terms in (px, py), or a projective mapping.
+POLYNOMIAL_TERMS = {
+    "affine": ("1", "x", "y"),
+    "bilinear": ("1", "x", "y", "x*y"),
+    "quadratic": ("1", "x", "y", "x*x", "x*y", "y*y"),
+}
+MODEL_KINDS = tuple(POLYNOMIAL_TERMS) + ("homography",)
+TERM_NAMES = {"x": "x_pixel", "y": "y_pixel", "x*y": "x_pixel*y_pixel",
+              "x*x": "x_pixel^2", "y*y": "y_pixel^2"}
+# How far (seconds per axis, combined) an arm position may be from every table entry and still count as inside it.
+INVERSE_TOLERANCE = 0.1
+
+
+def load_calibration_set(name=None, path=CALIBRATION_FILE):
+    """Loads one calibration set. Returns (name, model kind, pixels (N, 2), times (N, 2))."""
+    with open(path) as f:
+        data = json.load(f)
+    name = name or data["default"]
+    if name not in data["sets"]:
+        raise ValueError(f"No calibration set '{name}' in '{path}'. Available: {', '.join(data['sets'])}")
+    entry = data["sets"][name]
+    samples = entry["samples"]
+    pixels = np.array([(s["px"], s["py"]) for s in samples], dtype=np.float64)
+    times = np.array([(s["x_time"], s["y_time"]) for s in samples], dtype=np.float64)
+    return name, entry.get("model", "affine"), pixels, times
+
+
+def _features(pixels, kind):
+    x, y = pixels[:, 0], pixels[:, 1]
+    columns = {"1": np.ones_like(x), "x": x, "y": y, "x*y": x * y, "x*x": x * x, "y*y": y * y}
+    return np.stack([columns[term] for term in POLYNOMIAL_TERMS[kind]], axis=1)
+
+
+class CalibrationModel:
+    """2-D mapping from a pixel (px, py) to motor run times (x_time, y_time).
+
+    Fitted jointly on both axes so it captures the coupling the slanted
+    camera introduces (e.g. X time depending on py as well as px).
+    """
+
+    def __init__(self, kind="affine"):
+        if kind not in MODEL_KINDS:
+            raise ValueError(f"Unknown calibration model '{kind}'. Choose from: {', '.join(MODEL_KINDS)}")
+        self.kind = kind
+        self.coefficients = None  # (terms, 2) for polynomials, 3x3 for a homography
+        self.pixels = None
+        self.times = None
+
+    def fit(self, pixels, times):
+        """Least-squares fit to any number of samples (at least one per model parameter)."""
+        pixels = np.asarray(pixels, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        needed = 4 if self.kind == "homography" else len(POLYNOMIAL_TERMS[self.kind])
+        if len(pixels) < needed:
+            raise ValueError(f"A {self.kind} model needs at least {needed} samples, got {len(pixels)}")
+
+        if self.kind == "homography":
+            self.coefficients, _ = cv2.findHomography(pixels, times)
+            if self.coefficients is None:
+                raise ValueError("Calibration samples are degenerate for a homography")
+        else:
+            self.coefficients, *_ = np.linalg.lstsq(_features(pixels, self.kind), times, rcond=None)
+        self.pixels, self.times = pixels, times
+        return self
+
+    @classmethod
+    def restore(cls, kind, coefficients, pixels, times):
+        """Rebuilds a fitted model from saved coefficients without refitting."""
+        model = cls(kind)
+        model.coefficients = np.asarray(coefficients, dtype=np.float64)
+        model.pixels = np.asarray(pixels, dtype=np.float64)
+        model.times = np.asarray(times, dtype=np.float64)
+        return model
+
+    def predict_raw(self, pixels):
+        """Unclamped (N, 2) times for (N, 2) pixels."""
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        if self.kind == "homography":
+            return cv2.perspectiveTransform(pixels.reshape(-1, 1, 2), self.coefficients).reshape(-1, 2)
+        return _features(pixels, self.kind) @ self.coefficients
+
+    def predict(self, pixels):
+        """(N, 2) motor times for (N, 2) pixels, clamped to non-negative like the original model."""
+        return np.maximum(self.predict_raw(pixels), 0.0)
+
+    def residuals(self):
+        """(N, 2) fitted minus measured times for the calibration samples."""
+        return self.predict_raw(self.pixels) - self.times
+
+    def describe(self):
+        """Human-readable model equations and residual summary."""
+        lines = []
+        if self.kind == "homography":
+            lines.append("(x_time, y_time) = H * (x_pixel, y_pixel, 1) with H =")
+            lines.extend("    " + "  ".join(f"{v: .6g}" for v in row) for row in self.coefficients)
+        else:
+            for axis, name in enumerate(("X_time", "Y_time")):
+                terms = " + ".join(f"{c:.4f}" if t == "1" else f"{c:.6g} * {TERM_NAMES[t]}"
+                                   for c, t in zip(self.coefficients[:, axis], POLYNOMIAL_TERMS[self.kind]))
+                lines.append(f"{name} = {terms}")
+        residuals = self.residuals()
+        rms = np.sqrt(np.mean(residuals ** 2, axis=0))
+        worst = np.abs(residuals).max(axis=0)
+        lines.append(f"Residuals over {len(residuals)} samples: RMS X {rms[0]:.3f} s, Y {rms[1]:.3f} s; "
+                     f"max X {worst[0]:.3f} s, Y {worst[1]:.3f} s")
+        return "\n".join(lines)
+
+
+class CalibrationLUT:
+    """Dense per-pixel table of a CalibrationModel over a rectangle (x0, y0, x1, y1).
+
+    Looking up a centroid inside the rectangle is two array reads; points
+    outside it fall back to evaluating the model.
+
+    If the camera moves after calibrating, set_camera_motion() takes the
+    homography from the current view back to the calibrated one; pixels are
+    then mapped through it before the lookup, and the table stays valid.
+    """
+
+    def __init__(self, model, rect):
+        self.model = model
+        self.rect = rect
+        self.camera_motion = None  # current view -> calibrated view, None while the camera has not moved
+        self._camera_motion_inverse = None
+        x0, y0, x1, y1 = rect
+        xs, ys = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1))
+        times = model.predict(np.stack([xs.ravel(), ys.ravel()], axis=1))
+        self.x_table = times[:, 0].astype(np.float32).reshape(y1 - y0, x1 - x0)
+        self.y_table = times[:, 1].astype(np.float32).reshape(y1 - y0, x1 - x0)
+
+    def set_camera_motion(self, homography):
+        """Maps pixels of the current view to the calibrated one by `homography` (None: no motion)."""
+        if homography is None:
+            self.camera_motion = self._camera_motion_inverse = None
+        else:
+            self.camera_motion = np.asarray(homography, dtype=np.float64)
+            self._camera_motion_inverse = np.linalg.inv(self.camera_motion)
+
+    @staticmethod
+    def _transform(homography, x, y):
+        px, py, pw = homography @ (x, y, 1.0)
+        return px / pw, py / pw
+
+    def __call__(self, cx, cy):
+        if self.camera_motion is not None:
+            cx, cy = (round(v) for v in self._transform(self.camera_motion, cx, cy))
+        x0, y0, x1, y1 = self.rect
+        if x0 <= cx < x1 and y0 <= cy < y1:
+            row, col = int(cy) - y0, int(cx) - x0
+            return float(self.x_table[row, col]), float(self.y_table[row, col])
+        x_time, y_time = self.model.predict([(cx, cy)])[0]
+        return float(x_time), float(y_time)
+
+    def to_pixel(self, x_time, y_time, tolerance=INVERSE_TOLERANCE):
+        """Inverse lookup: the pixel in the rectangle whose motor times are nearest (x_time, y_time).
+
+        With a camera motion set, the pixel is returned in the current view.
+
+        Returns (px, py), or None if no pixel in the rectangle comes within
+        `tolerance` seconds, i.e. that arm position lies outside it.
+        """
+        distance = np.hypot(self.x_table - x_time, self.y_table - y_time)
+        row, col = np.unravel_index(np.argmin(distance), distance.shape)
+        if distance[row, col] > tolerance:
+            return None
+        x0, y0, _, _ = self.rect
+        if self.camera_motion is not None:
+            px, py = self._transform(self._camera_motion_inverse, int(col) + x0, int(row) + y0)
+            return int(round(px)), int(round(py))
+        return int(col) + x0, int(row) + y0
@@ -0,0 +1,246 @@
+import asyncio
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from arm_serial import TIMEOUT_FACTOR, TIMEOUT_MARGIN, ArmResetError, ArmTimeoutError, expected_reply, replay_safe
+from serial_connection import backoff_delays
+
+# Extra allowance on top of ArmSerial's own deadline before the loop gives up on a
+# command whose thread is stuck (e.g. a write blocked on a dead USB link), in seconds.
+COMMAND_TIMEOUT_MARGIN = 2.0
+# How long a command waits for a dropped link to come back before it fails (seconds).
+RECONNECT_GIVE_UP = 60
+HEALTH_CHECK_INTERVAL = 1.0  # seconds between idle checks of the serial link
+
+
+def reset_message(command):
+    return (f"The arm controller reset during '{command}'. The arm stopped at an unknown position "
+            "and the claw let go. Bring the arm home in manual mode before picking again.")
+
+
+class AsyncArm:
+    """Awaitable front end for ArmSerial/DryRunArm.
+
+    Commands run one at a time on a dedicated serial thread, each with a
+    deadline. The firmware cannot abort a move, so cancelling a command only
+    stops the caller from waiting: the command finishes on the serial thread,
+    and the next command is not written until it has, which keeps replies
+    paired with the commands that caused them.
+
+    With a SerialConnection, a command that fails because the link dropped
+    reconnects (with backoff). Reopening the port resets the Arduino, so only
+    a command that is safe to repeat (opening the claw) is sent again; any
+    other raises ArmResetError, which ends the automatic mode so the
+    operator can bring the arm home.
+    """
+
+    def __init__(self, arm, connection=None):
+        self.arm = arm
+        self.connection = connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="serial")
+        self._lock = asyncio.Lock()
+        self._in_flight = None
+
+    @property
+    def ser(self):
+        return self.arm.ser
+
+    @ser.setter
+    def ser(self, ser):
+        self.arm.ser = ser
+
+    @property
+    def history(self):
+        return self.arm.history
+
+    async def _wait_in_flight(self):
+        if self._in_flight is None:
+            return
+        await asyncio.wait([self._in_flight])
+        if not self._in_flight.cancelled():
+            self._in_flight.exception()  # already reported to whoever gave up on it
+        self._in_flight = None
+
+    async def send(self, command, timeout=None):
+        """Sends one command and waits for its completion line. Returns the seconds it took."""
+        if timeout is None:
+            expected, _ = expected_reply(command)
+            timeout = expected * TIMEOUT_FACTOR + TIMEOUT_MARGIN + COMMAND_TIMEOUT_MARGIN
+        async with self._lock:
+            try:
+                return await self._send_locked(command, timeout)
+            except serial.SerialException as e:
+                if self.connection is None:
+                    raise
+                lost_at = time.monotonic()
+                print(f"⚠️ Serial link lost during '{command}' ({e}). Reconnecting...")
+                try:
+                    await self._reconnect_locked(lost_at, RECONNECT_GIVE_UP)
+                except serial.SerialException:
+                    if replay_safe(command):
+                        raise
+                    raise ArmResetError(reset_message(command)) from e
+                if not replay_safe(command):
+                    raise ArmResetError(reset_message(command)) from e
+                print(f"   ↳ sending '{command}' again")
+                return await self._send_locked(command, timeout)
+
+    async def _send_locked(self, command, timeout):
+        await self._wait_in_flight()
+        self._in_flight = asyncio.get_running_loop().run_in_executor(self._executor, self.arm.send, command)
+        try:
+            elapsed = await asyncio.wait_for(asyncio.shield(self._in_flight), timeout)
+        except asyncio.TimeoutError:
+            raise ArmTimeoutError(f"'{command}' still running on the serial thread after {timeout:.1f} s")
+        self._in_flight = None
+        return elapsed
+
+    async def reconnect(self, give_up_after=None):
+        """Re-opens the link now, retrying until the firmware answers (or `give_up_after` seconds)."""
+        async with self._lock:
+            await self._reconnect_locked(time.monotonic(), give_up_after)
+
+    async def _reconnect_locked(self, lost_at, give_up_after):
+        # A stuck command keeps the serial thread busy; closing the port is what frees it.
+        old = self.arm.ser
+        if old is not None and old.is_open:
+            old.close()
+        await self._wait_in_flight()
+        loop = asyncio.get_running_loop()
+        for delay in backoff_delays():
+            ser = await loop.run_in_executor(self._executor, self.connection.find_and_open)
+            if ser is not None:
+                self.arm.ser = ser
+                recovery = time.monotonic() - lost_at
+                self.connection.record_recovery(recovery)
+                print(f"✅ Reconnected to the arm on {self.connection.port} after {recovery:.2f} s.")
+                return
+            if give_up_after is not None and time.monotonic() - lost_at + delay > give_up_after:
+                raise serial.SerialException(f"Arm did not come back within {give_up_after:.0f} s")
+            await asyncio.sleep(delay)
+
+    async def watch_connection(self, interval=HEALTH_CHECK_INTERVAL):
+        """Background health check: reconnects a dead link while no command is using it."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.connection is None or self._lock.locked():
+                continue
+            if not self.connection.is_healthy(self.arm.ser):
+                print("\n⚠️ Serial link is down. Reconnecting in the background...")
+                await self.reconnect()
+
+    async def idle(self):
+        """Waits until no command is running on the serial thread."""
+        async with self._lock:
+            await self._wait_in_flight()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class Controller:
+    """Runs the operator console and at most one automatic mode as tasks on one event loop.
+
+    Console lines are read on a daemon thread and queued for the loop, so a
+    pending prompt never holds up a cycle. Everything that touches the
+    camera or the detector goes through a single vision thread: a cancelled
+    cycle may leave work queued there, but never runs it alongside the next.
+    """
+
+    def __init__(self):
+        self.vision_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+        self.mode_task = None
+        self.background_tasks = []
+        self.stopping = False
+        self._loop = None
+        self._console = None
+
+    async def vision(self, func, *args):
+        """Runs a blocking OpenCV/grabber call on the vision thread."""
+        return await self._loop.run_in_executor(self.vision_executor, func, *args)
+
+    def _read_console(self):
+        for line in sys.stdin:
+            self._loop.call_soon_threadsafe(self._console.put_nowait, line.strip())
+        self._loop.call_soon_threadsafe(self._console.put_nowait, None)
+
+    async def read_line(self, prompt=""):
+        """Next console line, or None once the console closes or shutdown was requested."""
+        if prompt:
+            print(prompt, end="", flush=True)
+        return await self._console.get()
+
+    def start_mode(self, coroutine, name):
+        """Runs an automatic mode in the background, pre-empting any mode already running."""
+        if self.mode_task is not None and not self.mode_task.done():
+            self.mode_task.cancel()
+        self.mode_task = self._loop.create_task(coroutine, name=name)
+        self.mode_task.add_done_callback(self._mode_finished)
+        return self.mode_task
+
+    def start_background(self, coroutine, name):
+        """Runs a service task (e.g. a health check) until the controller stops."""
+        task = self._loop.create_task(coroutine, name=name)
+        task.add_done_callback(self._mode_finished)
+        self.background_tasks.append(task)
+        return task
+
+    def _mode_finished(self, task):
+        if task.cancelled():
+            if task not in self.background_tasks:
+                print(f"\n⏹️ {task.get_name()} mode stopped.")
+        elif isinstance(task.exception(), ArmResetError):
+            # Not resumed: the arm's position after the reset is unknown.
+            print(f"\n🛑 {task.get_name()} mode stopped: {task.exception()}")
+        elif task.exception() is not None:
+            print(f"\n❌ {task.get_name()} mode failed: {task.exception()}")
+
+    async def preempt(self):
+        """Cancels the running automatic mode and waits until it has unwound."""
+        task, self.mode_task = self.mode_task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        await asyncio.wait([task])
+
+    def request_shutdown(self):
+        """Stops the running mode and ends the console loop."""
+        if self.stopping:
+            return
+        self.stopping = True
+        if self.mode_task is not None:
+            self.mode_task.cancel()
+        self._console.put_nowait(None)
+
+    def _on_signal(self, signum, frame):
+        if self.stopping:
+            # Second Ctrl+C: the operator wants out now.
+            raise KeyboardInterrupt
+        print(f"\nReceived {signal.Signals(signum).name}. Stopping...")
+        self._loop.call_soon_threadsafe(self.request_shutdown)
+
+    async def run(self, main):
+        """Runs `main(controller)` with the console reader and signal handlers in place."""
+        self._loop = asyncio.get_running_loop()
+        self._console = asyncio.Queue()
+        threading.Thread(target=self._read_console, name="Console", daemon=True).start()
+        # signal.signal rather than loop.add_signal_handler, which Windows does not support.
+        for name in ("SIGINT", "SIGTERM"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self._on_signal)
+        try:
+            await main(self)
+        finally:
+            await self.preempt()
+            for task in self.background_tasks:
+                task.cancel()
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
+
+    def close(self):
+        """Shuts the vision thread down once any queued work has finished."""
+        self.vision_executor.shutdown(wait=True)
@@ -0,0 +1,129 @@
+import time
+
+import cv2
+
+from detectors import Workspace
+
+# Defaults for the rig; the main program passes its own configuration.
+SETTLE_FRAMES = 5         # consecutive still frames required before a pick starts
+IDLE_POLL_HZ = 2          # sample rate while the tray is empty
+MOTION_THRESHOLD = 3.0    # mean gray-level change between frames that counts as motion
+TRIGGER_SCALE = 0.25      # resolution of the trigger's diff relative to the tray ROI
+FRAME_TIMEOUT = 2         # seconds to wait for a new frame from the grabber
+
+
+class MotionTrigger:
+    """Starts a pick cycle when something new is on the tray and the scene has settled.
+
+    Works on a low-resolution grayscale copy of the detector's tray ROI. Each
+    sample answers two questions: does the tray differ from the empty-tray
+    reference (presence), and did it change since the last sample (motion)?
+    """
+
+    def __init__(self, grabber, detector, settle_frames=SETTLE_FRAMES, idle_poll_hz=IDLE_POLL_HZ,
+                 motion_threshold=MOTION_THRESHOLD, scale=TRIGGER_SCALE):
+        self.grabber = grabber
+        self.detector = detector
+        self.settle_frames = settle_frames
+        self.idle_poll_hz = idle_poll_hz
+        self.motion_threshold = motion_threshold
+        self.scale = scale
+        self.workspace = Workspace()
+
+        self.mask_small = self._shrink(detector.roi_mask, cv2.INTER_NEAREST)
+        self.min_present_pixels = max(int(detector.min_area * scale * scale), 1)
+        self.refresh_reference()
+
+        self.cycles = 0
+        self.idle_time = 0.0
+        self.started_at = time.monotonic()
+        self._previous = None
+        self._samples = 0
+        self._last_frame_time = 0.0
+        self._still_frames = 0
+        self._armed = True
+
+    def _shrink(self, image, interpolation=cv2.INTER_AREA, dst=None):
+        return cv2.resize(image, None, dst=dst, fx=self.scale, fy=self.scale, interpolation=interpolation)
+
+    def refresh_reference(self):
+        """Re-reads the detector's grayscale reference, e.g. after the background was recaptured."""
+        self.reference_small = self._shrink(self.detector.reference_gray)
+
+    def refresh_tray(self):
+        """Re-reads the detector's ROI and reference after it followed the tray (detector.retarget)."""
+        self.mask_small = self._shrink(self.detector.roi_mask, cv2.INTER_NEAREST)
+        self.refresh_reference()
+        self._previous = None  # a different crop; the motion test restarts from the next sample
+
+    def _sample(self):
+        """Returns (present, moving, frame) for the next new frame, or None if the camera stalls."""
+        frame_time, frame = self.grabber.wait_for_frame_after(self._last_frame_time, FRAME_TIMEOUT)
+        if frame is None:
+            return None
+        self._last_frame_time = frame_time
+        # The sample alternates between two buffers so the previous one survives for the motion test.
+        shape = self.mask_small.shape
+        self._samples += 1
+        small = self._shrink(self.detector.to_gray(frame, scratch=True),
+                             dst=self.workspace.view(f"small{self._samples % 2}", shape))
+
+        changed = cv2.absdiff(small, self.reference_small, dst=self.workspace.view("changed", shape))
+        cv2.threshold(changed, self.detector.threshold, 255, cv2.THRESH_BINARY, dst=changed)
+        cv2.bitwise_and(changed, self.mask_small, dst=changed)
+        present = cv2.countNonZero(changed) >= self.min_present_pixels
+
+        if self._previous is None:
+            moving = True
+        else:
+            motion = cv2.absdiff(small, self._previous, dst=self.workspace.view("motion", shape))
+            moving = cv2.mean(motion, mask=self.mask_small)[0] > self.motion_threshold
+        self._previous = small
+        return present, moving, frame
+
+    def disarm(self):
+        """Suppresses triggering until the scene changes (e.g. after a cycle found nothing to pick)."""
+        self._armed = False
+
+    def wait(self, timeout=None):
+        """Blocks until a pick should start. Returns True when triggered, False on timeout."""
+        start = time.monotonic()
+        try:
+            while timeout is None or time.monotonic() - start < timeout:
+                sample = self._sample()
+                if sample is None:
+                    return False
+                present, moving, frame = sample
+
+                if moving:
+                    self._still_frames = 0
+                    self._armed = True
+                else:
+                    self._still_frames += 1
+
+                if present and self._armed and self._still_frames >= self.settle_frames:
+                    return True
+                if not present:
+                    if not moving and self.detector.background.learning_rate > 0:
+                        # A still, empty tray is the best time to follow lighting drift.
+                        self.detector.learn_background(frame)
+                        self.refresh_reference()
+                    # Nothing on the tray: back off instead of diffing every frame.
+                    time.sleep(1 / self.idle_poll_hz)
+            return False
+        finally:
+            self.idle_time += time.monotonic() - start
+
+    def record_cycle(self, picks=1):
+        """Counts completed picks (a batch cycle can pick several pieces)."""
+        self.cycles += picks
+
+    def cycles_per_minute(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.cycles * 60 / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started_at
+        idle_share = self.idle_time / elapsed * 100 if elapsed > 0 else 0.0
+        return (f"{self.cycles} cycles, {self.cycles_per_minute():.1f} cycles/min, "
+                f"idle {self.idle_time:.1f} s ({idle_share:.0f}%)")
@@ -0,0 +1,755 @@
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from background_model import RunningAverageBackground
+from metrics import METRICS
+from perspective import PerspectiveFlattener
+
+# A detected cloth piece. contour, centroid and the contours of any holes in it are in
+# full-frame pixel coordinates.
+Blob = namedtuple("Blob", ["contour", "area", "centroid", "holes"], defaults=((),))
+# Connected-component statistics of the blobs in a mask that passed the filters, largest
+# first: their ids in `labels` (the label image of the window at `origin`), pixel areas,
+# (x, y, w, h) boxes and (x, y) centroids. Boxes and centroids are in mask coordinates.
+BlobStats = namedtuple("BlobStats", ["labels", "origin", "ids", "areas", "boxes", "centroids"])
+
+# Defaults match the tuning used on the rig (see Main Python Program.py).
+THRESHOLD_VALUE = 50
+MIN_CONTOUR_AREA = 225
+DILATION_ITERATIONS = 5
+
+# Defaults for the colour and edge detectors, from the scripts in "Cloth detection Algorithms".
+GREEN_LO = np.array([35, 40, 40])      # H,S,V of a bright green backdrop
+GREEN_HI = np.array([85, 255, 255])
+MIN_GREEN_TRAY_AREA = 5000
+SATURATED_LO = np.array([0, 50, 50])   # anything coloured on a white tray
+SATURATED_HI = np.array([179, 255, 255])
+CANNY_LOW = 50
+CANNY_HIGH = 150
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+
+# Fast green-backdrop mode: bits kept per BGR channel by the optional colour lookup
+# table (5 bits = 32 levels, a 32 KB table), and how often the cached tray is re-checked.
+COLOR_LUT_BITS = 5
+TRAY_REVALIDATE_EVERY = 30   # frames between cheap tray checks
+TRAY_REVALIDATE_SCALE = 0.25  # resolution of the check relative to the frame
+TRAY_MIN_IOU = 0.9           # bounding-box overlap below which the tray is found again
+
+# Coarse-to-fine mode: the coarse pass keeps blobs down to this share of the
+# scaled minimum area, so pieces near the threshold are not lost to resampling;
+# the full-resolution refinement applies the real minimum.
+PYRAMID_AREA_SLACK = 0.5
+
+
+def blob_stats(mask, min_area, max_aspect=None, exclude_border=False, workspace=None):
+    """Labels a binary mask and returns the BlobStats of every blob that passes the filters.
+
+    One connectedComponentsWithStats pass measures every blob; the filters
+    then run on its arrays, so noise specks cost no Python work. A blob is
+    kept if its pixel area exceeds `min_area`, its bounding box is at most
+    `max_aspect` times longer than wide and, with `exclude_border`, it does
+    not touch the edge of the mask. With a `workspace` the labels are
+    written into its "labels" buffer.
+    """
+    # Labelling costs the same for every pixel, so only the box around the changed pixels is labelled.
+    wx, wy, w, h = cv2.boundingRect(mask)
+    if w == 0:
+        return BlobStats(None, (0, 0), np.empty(0, int), np.empty(0, int), np.empty((0, 4), int), np.empty((0, 2)))
+    # 8-connected blobs are at least one pixel apart, so a window this small cannot hold 65536 of them.
+    dtype, ltype = ("uint16", cv2.CV_16U) if ((w + 1) // 2) * ((h + 1) // 2) < 2 ** 16 else ("int32", cv2.CV_32S)
+    labels = None if workspace is None else workspace.view("labels", (h, w), dtype)
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(mask[wy:wy + h, wx:wx + w], labels=labels,
+                                                                    connectivity=8, ltype=ltype)
+    # stats and centroids are fresh arrays from OpenCV, so they are moved to mask coordinates in place.
+    stats[:, cv2.CC_STAT_LEFT] += wx
+    stats[:, cv2.CC_STAT_TOP] += wy
+    centroids += (wx, wy)
+    areas = stats[1:, cv2.CC_STAT_AREA]  # row 0 is the background
+    boxes = stats[1:, :4]
+    keep = areas > min_area
+    if max_aspect:
+        long_side, short_side = np.maximum(boxes[:, 2], boxes[:, 3]), np.minimum(boxes[:, 2], boxes[:, 3])
+        keep &= long_side <= max_aspect * short_side
+    if exclude_border:
+        x, y, bw, bh = boxes.T
+        keep &= (x > 0) & (y > 0) & (x + bw < mask.shape[1]) & (y + bh < mask.shape[0])
+    index = np.flatnonzero(keep)
+    index = index[np.argsort(-areas[index], kind="stable")]
+    return BlobStats(labels, (wx, wy), index + 1, areas[index], boxes[index], centroids[index + 1])
+
+
+def blobs_from_mask(mask, min_area, offset=(0, 0), max_aspect=None, exclude_border=False, workspace=None):
+    """Returns every blob of a binary mask that passes blob_stats()'s filters as Blobs, largest first.
+
+    Contours are traced only for the blobs that pass, each inside its own bounding box.
+    """
+    stats = blob_stats(mask, min_area, max_aspect, exclude_border, workspace)
+    wx, wy = stats.origin
+    ox, oy = offset
+    blobs = []
+    # Plain Python numbers: indexing the arrays would make a numpy scalar or row view per value.
+    for label, area, (x, y, w, h), (cx, cy) in zip(stats.ids.tolist(), stats.areas.tolist(), stats.boxes.tolist(),
+                                                   stats.centroids.tolist()):
+        component = cv2.compare(stats.labels[y - wy:y - wy + h, x - wx:x - wx + w], label, cv2.CMP_EQ,
+                                dst=None if workspace is None else workspace.view("component", (h, w)))
+        # One 8-connected component has exactly one outer contour; the rest are its holes.
+        contours, hierarchy = cv2.findContours(component, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE,
+                                               offset=(x + ox, y + oy))
+        outer = int(hierarchy[0, :, 3].argmin())  # the only contour without a parent (-1)
+        holes = tuple(contour for index, contour in enumerate(contours) if index != outer)
+        blobs.append(Blob(contours[outer], float(area), (int(cx) + ox, int(cy) + oy), holes))
+    return blobs
+
+
+def clip_rect(rect, bounds):
+    """Intersects two (x0, y0, x1, y1) rectangles, or returns None if they do not overlap."""
+    x0, y0 = max(rect[0], bounds[0]), max(rect[1], bounds[1])
+    x1, y1 = min(rect[2], bounds[2]), min(rect[3], bounds[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def open_close(mask):
+    """Removes specks and fills pinholes with a 5x5 opening and closing."""
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL)
+
+
+def rect_iou(a, b):
+    """Intersection over union of two (x0, y0, x1, y1) rectangles."""
+    inter = clip_rect(a, b)
+    if inter is None:
+        return 0.0
+    inter_area, a_area, b_area = ((r[2] - r[0]) * (r[3] - r[1]) for r in (inter, a, b))
+    return inter_area / (a_area + b_area - inter_area)
+
+
+class ColorLUT:
+    """Classifies BGR pixels against an HSV range with one table lookup instead of cvtColor + inRange.
+
+    Every colour is quantized to `bits` per channel, and the HSV test is run
+    once per quantized colour when the table is built. Per frame, cv2.LUT
+    turns each channel into its share of the table index and a single take()
+    reads the answer. Colours within half a quantization step of the range
+    boundary may classify differently from the exact HSV test.
+    """
+
+    def __init__(self, lower, upper, bits=COLOR_LUT_BITS):
+        levels = 1 << bits
+        step = 256 >> bits
+        centers = (np.arange(levels) * step + step // 2).astype(np.uint8)
+        b, g, r = np.meshgrid(centers, centers, centers, indexing="ij")
+        colors = np.stack([b, g, r], axis=-1).reshape(-1, 1, 3)
+        self.table = cv2.inRange(cv2.cvtColor(colors, cv2.COLOR_BGR2HSV), lower, upper).reshape(-1)
+
+        values = np.arange(256, dtype=np.uint16) >> (8 - bits)
+        self.channel_lut = np.stack([values << (2 * bits), values << bits, values], axis=-1).reshape(1, 256, 3)
+
+    def __call__(self, image):
+        """Returns a uint8 mask, 255 where the pixel's colour is in range."""
+        shares = cv2.LUT(image, self.channel_lut)
+        index = shares[..., 0] | shares[..., 1] | shares[..., 2]
+        return np.take(self.table, index)
+
+
+def merge_rects(rects):
+    """Merges overlapping (x0, y0, x1, y1) rectangles until none overlap."""
+    merged = []
+    for rect in sorted(rects):
+        rect = list(rect)
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            if clip_rect(rect, other) is not None:
+                rect = [min(rect[0], other[0]), min(rect[1], other[1]), max(rect[2], other[2]), max(rect[3], other[3])]
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    return [tuple(rect) for rect in merged]
+
+
+def whole_frame_contour(frame_shape):
+    """A tray contour covering the entire frame, for setups without a defined tray ROI."""
+    h, w = frame_shape[:2]
+    return np.array([(0, 0), (w - 1, 0), (w - 1, h - 1), (0, h - 1)], dtype="int32")
+
+
+def tray_roi(tray_contour, frame_shape, padding=0):
+    """Returns the tray's bounding rectangle (x0, y0, x1, y1), padded and clipped to the frame."""
+    x, y, w, h = cv2.boundingRect(tray_contour)
+    frame_h, frame_w = frame_shape[:2]
+    return (max(x - padding, 0), max(y - padding, 0),
+            min(x + w + padding, frame_w), min(y + h + padding, frame_h))
+
+
+class Workspace:
+    """Named scratch buffers reused from frame to frame, so a steady stream of frames allocates nothing.
+
+    view(name, shape) returns an array of `shape` (uint8 unless a dtype is
+    given) backed by buffer `name`, which only grows when a larger shape is
+    asked for. Its contents are valid until the next view of the same name.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self._views = {}  # name: ((shape, dtype), view) of the last view handed out
+
+    def view(self, name, shape, dtype="uint8"):
+        # Full scans ask for the same shapes frame after frame. Building a view costs ~8 us,
+        # a share of a small ROI's whole diff chain, so the last one per name is kept.
+        key = (tuple(shape), dtype)
+        cached = self._views.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        itemsize = np.dtype(dtype).itemsize
+        size = math.prod(key[0]) * itemsize
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[name] = np.empty(size, dtype="uint8")
+        view = buffer[:size].view(dtype).reshape(key[0])
+        self._views[name] = (key, view)
+        return view
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class Detector:
+    """Common interface of every cloth detector: detect(frame) returns a list of Blobs, largest first.
+
+    Subclasses implement mask(image) for a BGR image, as preprocess(image)
+    followed by classify(preprocessed), and may restrict it to a fixed tray
+    polygon. detect() crops to `rect` first when one is given.
+    """
+
+    min_area = 0
+    max_aspect = None       # drop blobs whose bounding box is more than this many times longer than wide
+    exclude_border = False  # drop blobs touching the edge of the search area (pieces hanging off it)
+
+    def __init__(self, tray_contour=None):
+        self.tray_contour = None if tray_contour is None else np.asarray(tray_contour, dtype="int32")
+        self._tray_mask = None
+
+    def tray_mask(self, frame_shape):
+        """Full-frame polygon mask of the tray, built once per frame size. None without a tray contour."""
+        if self.tray_contour is None:
+            return None
+        if self._tray_mask is None or self._tray_mask.shape != frame_shape[:2]:
+            self._tray_mask = np.zeros(frame_shape[:2], dtype="uint8")
+            cv2.fillPoly(self._tray_mask, [self.tray_contour], 255)
+        return self._tray_mask
+
+    def retarget(self, tray_contour, homography=None):
+        """Moves the tray polygon to where it now appears in the frame (the camera moved).
+
+        `homography` maps pixels of the new view to the previous one; only
+        detectors that keep images of the tray (a reference) need it.
+        """
+        self.tray_contour = np.asarray(tray_contour, dtype="int32")
+        self._tray_mask = None
+
+    def preprocess(self, image):
+        """Converts a BGR image into what classify() works on (a colour space, a blurred gray)."""
+        return image
+
+    def classify(self, image):
+        """Returns a binary uint8 mask of cloth pixels in a preprocess()ed image."""
+        raise NotImplementedError
+
+    def mask(self, image):
+        """Returns a binary uint8 mask of cloth pixels in a BGR image."""
+        return self.classify(self.preprocess(image))
+
+    def blobs(self, mask, offset=(0, 0), whole=True, workspace=None):
+        """blobs_from_mask() with this detector's filters.
+
+        The border filter only applies to a `whole` search area: the edge of
+        a window inside it cuts through pieces that are not on the border.
+        """
+        return blobs_from_mask(mask, self.min_area, offset, self.max_aspect, self.exclude_border and whole, workspace)
+
+    def detect(self, frame, rect=None):
+        """Returns every blob above min_area, largest first, in full-frame coordinates."""
+        whole = rect is None
+        frame_rect = (0, 0, frame.shape[1], frame.shape[0])
+        rect = frame_rect if whole else clip_rect(rect, frame_rect)
+        if rect is None:
+            return []
+        x0, y0, x1, y1 = rect
+        with METRICS.span("preprocess"):
+            image = self.preprocess(frame[y0:y1, x0:x1])
+        with METRICS.span("diff_threshold"):
+            mask = self.classify(image)
+            tray_mask = self.tray_mask(frame.shape)
+            if tray_mask is not None:
+                cv2.bitwise_and(mask, tray_mask[y0:y1, x0:x1], dst=mask)
+        with METRICS.span("contour"):
+            return self.blobs(mask, (x0, y0), whole=whole)
+
+
+class GreenBackdropDetector(Detector):
+    """Chroma keying: the tray is the largest green region and cloth is anything non-green on it."""
+
+    def __init__(self, tray_contour=None, green_lo=GREEN_LO, green_hi=GREEN_HI,
+                 min_area=1500, min_tray_area=MIN_GREEN_TRAY_AREA):
+        super().__init__(tray_contour)
+        self.green_lo = green_lo
+        self.green_hi = green_hi
+        self.min_area = min_area
+        self.min_tray_area = min_tray_area
+        self.last_tray_contour = None
+
+    def preprocess(self, image):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    def classify(self, hsv):
+        green_mask = open_close(cv2.inRange(hsv, self.green_lo, self.green_hi))
+
+        contours, _ = cv2.findContours(green_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        tray_ct = max(contours, key=cv2.contourArea) if contours else None
+        if tray_ct is None or cv2.contourArea(tray_ct) < self.min_tray_area:
+            self.last_tray_contour = None
+            return np.zeros(hsv.shape[:2], dtype=np.uint8)
+        self.last_tray_contour = tray_ct
+
+        tray_mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+        cv2.drawContours(tray_mask, [tray_ct], -1, 255, thickness=cv2.FILLED)
+        non_green_in_tray = cv2.bitwise_and(cv2.bitwise_not(green_mask), tray_mask)
+        return open_close(non_green_in_tray)
+
+
+class FastGreenBackdropDetector(GreenBackdropDetector):
+    """GreenBackdropDetector for continuous use: same masks, a fraction of the per-frame work.
+
+    - The tray is found once and cached. Every `revalidate_every` frames it is
+      re-found on a downscaled frame and re-acquired only if it moved.
+    - Classification and all four morphology passes run on the tray's
+      bounding box instead of the whole frame.
+
+    With `lut_bits`, green is classified by a ColorLUT instead of cvtColor +
+    inRange. That only pays off where OpenCV's HSV conversion is not
+    vectorised; on an x86 desktop the table lookup measured several times
+    slower, so it is off by default.
+    """
+
+    def __init__(self, tray_contour=None, green_lo=GREEN_LO, green_hi=GREEN_HI,
+                 min_area=1500, min_tray_area=MIN_GREEN_TRAY_AREA, lut_bits=None,
+                 revalidate_every=TRAY_REVALIDATE_EVERY):
+        super().__init__(tray_contour, green_lo, green_hi, min_area, min_tray_area)
+        self.color_lut = ColorLUT(green_lo, green_hi, lut_bits) if lut_bits else None
+        self.revalidate_every = revalidate_every
+        self.tray_rect = None       # cached green tray's bounding box (x0, y0, x1, y1)
+        self.cached_tray_mask = None  # its filled contour, cropped to tray_rect
+        self.tray_acquisitions = 0
+        self._frames_since_check = 0
+
+    def is_green(self, image):
+        """uint8 mask, 255 where a BGR pixel has the backdrop's colour."""
+        if self.color_lut is not None:
+            return self.color_lut(image)
+        return cv2.inRange(cv2.cvtColor(image, cv2.COLOR_BGR2HSV), self.green_lo, self.green_hi)
+
+    def _largest_green(self, image):
+        green_mask = open_close(self.is_green(image))
+        contours, _ = cv2.findContours(green_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return max(contours, key=cv2.contourArea) if contours else None
+
+    def acquire_tray(self, frame):
+        """Finds the tray on the whole frame and caches its mask. Returns False if there is none."""
+        self.tray_acquisitions += 1
+        self._frames_since_check = 0
+        tray_ct = self._largest_green(frame)
+        if tray_ct is None or cv2.contourArea(tray_ct) < self.min_tray_area:
+            self.tray_rect = self.cached_tray_mask = self.last_tray_contour = None
+            return False
+        x, y, w, h = cv2.boundingRect(tray_ct)
+        self.tray_rect = (x, y, x + w, y + h)
+        self.cached_tray_mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.drawContours(self.cached_tray_mask, [tray_ct], -1, 255, thickness=cv2.FILLED, offset=(-x, -y))
+        self.last_tray_contour = tray_ct
+        return True
+
+    def tray_moved(self, frame):
+        """Cheap re-check: does the largest green region of a downscaled frame still match the cache?"""
+        scale = TRAY_REVALIDATE_SCALE
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        tray_ct = self._largest_green(small)
+        if tray_ct is None or cv2.contourArea(tray_ct) < self.min_tray_area * scale * scale:
+            return True
+        x, y, w, h = cv2.boundingRect(tray_ct)
+        found = (x / scale, y / scale, (x + w) / scale, (y + h) / scale)
+        return rect_iou(found, self.tray_rect) < TRAY_MIN_IOU
+
+    def _update_tray(self, frame):
+        if self.tray_rect is None:
+            return self.acquire_tray(frame)
+        self._frames_since_check += 1
+        if self._frames_since_check >= self.revalidate_every:
+            self._frames_since_check = 0
+            if self.tray_moved(frame):
+                return self.acquire_tray(frame)
+        return True
+
+    def detect(self, frame, rect=None):
+        """Returns every blob above min_area, largest first, in full-frame coordinates."""
+        if not self._update_tray(frame):
+            return []
+        window = self.tray_rect if rect is None else clip_rect(rect, self.tray_rect)
+        if window is None:
+            return []
+        x0, y0, x1, y1 = window
+        tx, ty = self.tray_rect[:2]
+        with METRICS.span("preprocess"):
+            green_mask = open_close(self.is_green(frame[y0:y1, x0:x1]))
+        with METRICS.span("diff_threshold"):
+            mask = cv2.bitwise_not(green_mask)
+            cv2.bitwise_and(mask, self.cached_tray_mask[y0 - ty:y1 - ty, x0 - tx:x1 - tx], dst=mask)
+            tray_mask = self.tray_mask(frame.shape)
+            if tray_mask is not None:
+                cv2.bitwise_and(mask, tray_mask[y0:y1, x0:x1], dst=mask)
+            mask = open_close(mask)
+        with METRICS.span("contour"):
+            return self.blobs(mask, (x0, y0), whole=rect is None)
+
+
+class WhiteBackgroundDetector(Detector):
+    """Colour thresholding: on a white tray, any saturated pixel is cloth."""
+
+    def __init__(self, tray_contour=None, lower=SATURATED_LO, upper=SATURATED_HI, min_area=500):
+        super().__init__(tray_contour)
+        self.lower = lower
+        self.upper = upper
+        self.min_area = min_area
+
+    def preprocess(self, image):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    def classify(self, hsv):
+        return open_close(cv2.inRange(hsv, self.lower, self.upper))
+
+
+class CannyEdgeDetector(Detector):
+    """Edge detection: closed cloth outlines found by Canny on a lightly blurred image."""
+
+    def __init__(self, tray_contour=None, low=CANNY_LOW, high=CANNY_HIGH, blur_size=5, min_area=500):
+        super().__init__(tray_contour)
+        self.low = low
+        self.high = high
+        self.blur_size = blur_size
+        self.min_area = min_area
+
+    def preprocess(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (self.blur_size, self.blur_size), 0)
+
+    def classify(self, blurred):
+        edges = cv2.Canny(blurred, self.low, self.high)
+        # Blobs are measured by their pixels, so each closed outline is filled; otherwise a
+        # piece would only count its edge pixels against min_area.
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return cv2.drawContours(edges, contours, -1, 255, thickness=cv2.FILLED)
+
+
+class ImageSubtractionDetector(Detector):
+    """Image subtraction against an empty-tray reference, restricted to the tray's bounding rectangle.
+
+    Everything that does not change between frames (the polygon mask, the
+    grayscale reference and the crop rectangle) is built once here, so a
+    frame only costs a crop, a grayscale conversion and the diff chain over
+    the tray area.
+
+    With a non-zero `learning_rate` the reference is a RunningAverageBackground
+    that every full-tray scan updates wherever no cloth was found.
+
+    With a PerspectiveFlattener the "ROI" is the flattened top-down tray
+    instead of a crop: reference, masks and thresholds all live in flattened
+    space, and blobs are mapped back to camera pixels before they are returned.
+
+    With a `pyramid_scale` (0.5 or 0.25) a full scan first looks for candidate
+    blobs in a downscaled ROI, then runs the full-resolution diff only inside
+    each candidate's padded bounding box. Contours and centroids still come
+    from full resolution. Full scans then no longer update the background;
+    the trigger's idle-tray updates (learn_background) still do.
+
+    `max_aspect` and `exclude_border` drop streaks and pieces hanging off the
+    search area (see blob_stats); both are off by default.
+
+    With `reuse_buffers` every intermediate image of the diff chain is written
+    into a Workspace sized by the first full scan, so later frames allocate no
+    image memory. The mask from foreground_mask() is then overwritten by the
+    next call; detector calls must stay on one thread (the vision executor).
+    """
+
+    def __init__(self, reference_image, tray_contour, threshold=THRESHOLD_VALUE,
+                 min_area=MIN_CONTOUR_AREA, dilation_iterations=DILATION_ITERATIONS, learning_rate=0.0,
+                 blur_size=0, flattener=None, pyramid_scale=None, reuse_buffers=True, max_aspect=None,
+                 exclude_border=False):
+        super().__init__(tray_contour)
+        self.threshold = threshold
+        self.min_area = min_area
+        self.dilation_iterations = dilation_iterations
+        self.learning_rate = learning_rate
+        self.blur_size = blur_size
+        self.flattener = flattener
+        self.pyramid_scale = pyramid_scale
+        self.max_aspect = max_aspect
+        self.exclude_border = exclude_border
+        self._coarse_reference = None
+        self._coarse_reference_version = None
+        self.workspace = Workspace() if reuse_buffers else None
+        self._frame_shape = reference_image.shape
+
+        if flattener is not None:
+            # Pixel counts shrink with the output scale of the flattened view.
+            self.min_area = min_area * flattener.scale ** 2
+            self.dilation_iterations = max(int(round(dilation_iterations * flattener.scale)), 1)
+        self._set_roi()
+        self.set_reference(reference_image)
+        if pyramid_scale:
+            s = pyramid_scale
+            # One 3x3 iteration reaches 1/s full-resolution pixels, so fewer are needed to merge fragments.
+            self._coarse_iterations = max(int(np.ceil(self.dilation_iterations * s)), 1)
+            self._coarse_min_area = self.min_area * s * s * PYRAMID_AREA_SLACK
+            # Refine around each candidate far enough to cover the full-resolution dilation and resampling.
+            self._refine_padding = self.dilation_iterations + int(np.ceil(2 / s))
+
+    def _set_roi(self):
+        """Builds the crop rectangle and polygon mask (and its coarse copy) for the current tray."""
+        if self.flattener is None:
+            # Pad by the dilation reach (one pixel per 3x3 iteration) so blobs touching
+            # the tray edge grow exactly as they would on the full frame.
+            self.roi = tray_roi(self.tray_contour, self._frame_shape, padding=self.dilation_iterations)
+            x0, y0, x1, y1 = self.roi
+            self.roi_mask = np.zeros((y1 - y0, x1 - x0), dtype="uint8")
+            cv2.fillPoly(self.roi_mask, [self.tray_contour - (x0, y0)], 255)
+        else:
+            # The flattened image is the tray, so every pixel is inside it.
+            w, h = self.flattener.size
+            self.roi = (0, 0, w, h)
+            self.roi_mask = np.full((h, w), 255, dtype="uint8")
+        if self.pyramid_scale:
+            s = self.pyramid_scale
+            self._coarse_roi_mask = cv2.resize(self.roi_mask, None, fx=s, fy=s, interpolation=cv2.INTER_NEAREST)
+            self._coarse_reference_version = None
+
+    def retarget(self, tray_contour, homography=None):
+        """Follows the tray to where it now appears in the frame, keeping the learned background.
+
+        The crop rectangle, masks and (with a flattener) remap tables are
+        rebuilt for the new corners. A flattened background still shows the
+        same tray, so it is kept as is; a cropped one is warped through
+        `homography` (new view to previous view) into the new crop.
+        Pixels that were outside the previous crop repeat its edge; they
+        lie outside the tray and only pad the dilation.
+        """
+        old_x0, old_y0 = self.roi[:2]
+        super().retarget(tray_contour)
+        if self.flattener is not None:
+            self.flattener = PerspectiveFlattener(self.tray_contour, self.flattener.scale, size=self.flattener.size)
+            self._set_roi()
+            return
+        self._set_roi()
+        x0, y0, x1, y1 = self.roi
+        # New-crop pixel -> new frame pixel -> previous frame pixel -> previous-crop pixel.
+        homography = np.eye(3) if homography is None else np.asarray(homography, dtype=np.float64)
+        to_old = (np.array([[1, 0, -old_x0], [0, 1, -old_y0], [0, 0, 1]], dtype=np.float64) @ homography
+                  @ np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], dtype=np.float64))
+        size = (x1 - x0, y1 - y0)
+        flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        old = self.background
+        background = RunningAverageBackground(
+            cv2.warpPerspective(old.background, to_old, size, flags=flags, borderMode=cv2.BORDER_REPLICATE),
+            old.learning_rate)
+        cv2.warpPerspective(old.mean, to_old, size, dst=background.mean, flags=flags,
+                            borderMode=cv2.BORDER_REPLICATE)
+        self.set_background(background)
+
+    def set_reference(self, reference_image):
+        """Replaces the empty-tray reference image and restarts background learning from it."""
+        self.set_background(RunningAverageBackground(self.to_gray(reference_image), self.learning_rate))
+
+    def set_background(self, background):
+        """Uses a RunningAverageBackground (e.g. one loaded from disk) as the reference."""
+        if background.background.shape != self.roi_mask.shape:
+            raise ValueError(f"Background is {background.background.shape}, tray ROI is {self.roi_mask.shape}")
+        self.background = background
+        # Same array the model updates in place, so the diff always sees the latest model.
+        self.reference_gray = background.background
+
+    def _scratch(self, name, shape):
+        """A workspace buffer, or None (allocate) without reuse_buffers."""
+        return None if self.workspace is None else self.workspace.view(name, shape)
+
+    def crop(self, frame, rect=None, scratch=False):
+        """Returns the ROI of a full frame, or only `rect` (ROI-space x0, y0, x1, y1) of it.
+
+        A view of the frame without flattening, a remapped copy with it; with
+        `scratch` the copy goes into the workspace.
+        """
+        x0, y0, x1, y1 = rect or self.roi
+        if self.flattener is not None:
+            dst = self._scratch("crop", (y1 - y0, x1 - x0, 3)) if scratch else None
+            return self.flattener.flatten(frame, (x0, y0, x1, y1), dst=dst)
+        return frame[y0:y1, x0:x1]
+
+    def _gray(self, image, scratch=False):
+        shape = image.shape[:2]
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._scratch("gray", shape) if scratch else None)
+        if self.blur_size:
+            gray = cv2.GaussianBlur(gray, (self.blur_size, self.blur_size), 0,
+                                    dst=self._scratch("blur", shape) if scratch else None)
+        return gray
+
+    def to_gray(self, frame, scratch=False):
+        """Crops a full BGR frame to the ROI and converts it to (optionally blurred) grayscale.
+
+        With `scratch` the result lives in the workspace and is only valid
+        until the next detector call; keep it only for the current frame.
+        """
+        return self._gray(self.crop(frame, scratch=scratch), scratch)
+
+    def clip_to_roi(self, rect):
+        """Converts a full-frame rectangle (x0, y0, x1, y1) to ROI space and clips it.
+
+        Returns None if it does not overlap the tray.
+        """
+        if self.flattener is not None:
+            rect = self.flattener.rect_to_flat(rect)
+        return clip_rect(rect, self.roi)
+
+    def foreground_mask(self, frame, rect=None):
+        """Returns the dilated, tray-masked change mask for the ROI, or for `rect` inside it.
+
+        `rect` is a ROI-space (x0, y0, x1, y1) from clip_to_roi(). With
+        reuse_buffers the mask is only valid until the next detector call.
+        """
+        x0, y0, x1, y1 = rect or self.roi
+        rx, ry = x0 - self.roi[0], y0 - self.roi[1]
+        window = (slice(ry, ry + y1 - y0), slice(rx, rx + x1 - x0))
+        shape = (y1 - y0, x1 - x0)
+
+        with METRICS.span("preprocess"):
+            gray = self._gray(self.crop(frame, rect, scratch=True), scratch=True)
+        with METRICS.span("diff_threshold"):
+            diff = cv2.absdiff(self.reference_gray[window], gray, dst=self._scratch("diff", shape))
+            # Thresholding and masking run in place on the diff.
+            cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            # Masking the binary image is equivalent to masking both inputs before the
+            # diff, at a fraction of the cost.
+            cv2.bitwise_and(diff, self.roi_mask[window], dst=diff)
+            # Dilation cannot run in place, so it writes to its own buffer.
+            mask = cv2.dilate(diff, None, dst=self._scratch("mask", shape), iterations=self.dilation_iterations)
+        if rect is None and self.background.learning_rate > 0:
+            # The dilated mask leaves a margin around cloth edges out of the update.
+            with METRICS.span("background_update"):
+                self.background.update(gray, mask)
+        return mask
+
+    def _coarse_reference_gray(self):
+        # The background model updates reference_gray in place; rescale it only when it changed.
+        version = (id(self.background), self.background.updates)
+        if version != self._coarse_reference_version:
+            s = self.pyramid_scale
+            self._coarse_reference = cv2.resize(self.reference_gray, None, fx=s, fy=s, interpolation=cv2.INTER_NEAREST)
+            self._coarse_reference_version = version
+        return self._coarse_reference
+
+    def candidate_rects(self, frame):
+        """ROI-space (x0, y0, x1, y1) boxes around changed regions, found on the downscaled ROI."""
+        s = self.pyramid_scale
+        with METRICS.span("preprocess"):
+            # Subsample before converting: nearest-neighbour is far cheaper than area averaging,
+            # and a candidate only has to be found here, not measured.
+            shape = self._coarse_roi_mask.shape
+            small = cv2.resize(self.crop(frame, scratch=True), None, dst=self._scratch("small", shape + (3,)),
+                               fx=s, fy=s, interpolation=cv2.INTER_NEAREST)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._scratch("small_gray", shape))
+            if self.blur_size:
+                gray = cv2.GaussianBlur(gray, (self.blur_size, self.blur_size), 0,
+                                        dst=self._scratch("small_blur", shape))
+        with METRICS.span("diff_threshold"):
+            diff = cv2.absdiff(self._coarse_reference_gray(), gray, dst=self._scratch("small_diff", shape))
+            cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            cv2.bitwise_and(diff, self._coarse_roi_mask, dst=diff)
+            mask = cv2.dilate(diff, None, dst=self._scratch("small_mask", shape), iterations=self._coarse_iterations)
+        x_off, y_off = self.roi[:2]
+        pad = self._refine_padding
+        rects = []
+        # Candidates need only their boxes, so no contours are traced here.
+        stats = blob_stats(mask, self._coarse_min_area, exclude_border=self.exclude_border,
+                           workspace=self.workspace)
+        for x, y, w, h in stats.boxes.tolist():
+            rect = (x_off + int(x / s) - pad, y_off + int(y / s) - pad,
+                    x_off + int(np.ceil((x + w) / s)) + pad, y_off + int(np.ceil((y + h) / s)) + pad)
+            rect = clip_rect(rect, self.roi)
+            if rect is not None:
+                rects.append(rect)
+        return merge_rects(rects)
+
+    def learn_background(self, frame):
+        """Updates the background model from a frame without running the contour search."""
+        self.foreground_mask(frame)
+
+    def _contour_to_camera(self, contour):
+        contour = self.flattener.to_frame(contour.reshape(-1, 2))
+        return np.round(contour).astype("int32").reshape(-1, 1, 2)
+
+    def _to_camera(self, blob):
+        """Maps a blob found in the flattened view back to camera pixels."""
+        contour = self._contour_to_camera(blob.contour)
+        cx, cy = self.flattener.to_frame([blob.centroid])[0]
+        return Blob(contour, cv2.contourArea(contour), (int(round(cx)), int(round(cy))),
+                    tuple(self._contour_to_camera(hole) for hole in blob.holes))
+
+    def detect(self, frame, rect=None):
+        """Returns every blob above min_area, largest first, in full-frame coordinates.
+
+        Pass `rect` (full-frame x0, y0, x1, y1) to search only part of the tray.
+        """
+        if rect is not None:
+            rect = self.clip_to_roi(rect)
+            if rect is None:
+                return []
+        elif self.pyramid_scale:
+            blobs = []
+            for candidate in self.candidate_rects(frame):
+                blobs.extend(self.detect_in_roi(frame, candidate))
+            blobs.sort(key=lambda blob: blob.area, reverse=True)
+            return blobs
+        return self.detect_in_roi(frame, rect)
+
+    def detect_in_roi(self, frame, rect=None):
+        """detect() for a ROI-space rectangle from clip_to_roi(), or the whole ROI."""
+        x0, y0, _, _ = rect or self.roi
+        mask = self.foreground_mask(frame, rect)
+        with METRICS.span("contour"):
+            blobs = self.blobs(mask, (x0, y0), whole=rect is None, workspace=self.workspace)
+            if self.flattener is not None:
+                blobs = [self._to_camera(blob) for blob in blobs]
+        return blobs
+
+
+# Detectors selectable by name from the main program and the benchmark.
+DETECTORS = {
+    "subtraction": ImageSubtractionDetector,
+    "green": GreenBackdropDetector,
+    "green_fast": FastGreenBackdropDetector,
+    "white": WhiteBackgroundDetector,
+    "canny": CannyEdgeDetector,
+}
+
+
+def create_detector(name, reference_image, tray_contour, **options):
+    """Builds a detector by name. Only image subtraction uses the reference image."""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}'. Choose from: {', '.join(DETECTORS)}")
+    if name == "subtraction":
+        return ImageSubtractionDetector(reference_image, tray_contour, **options)
+    return DETECTORS[name](tray_contour, **options)
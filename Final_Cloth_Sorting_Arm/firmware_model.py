@@ -0,0 +1,502 @@
+"""Software model of BTS7960_Based_control.ino on a virtual clock, served on a pseudo-terminal.
+
+Usage:
+    python firmware_model.py                      # serve; point the host at the printed port
+    python "Main Python Program.py" --port /dev/pts/N --replay RECORDING --fast --loop
+    python firmware_model.py --bench 1000
+
+The model parses commands exactly as the sketch's loop() does and prints the
+same lines. Moves take no real time: each command advances a virtual clock
+by the duration the firmware would block for, and the real time the host
+spends between commands is added on top, so cycles per hour on the virtual
+clock match what the rig would do. --time-scale 0.1 runs moves at 1/10 of
+real time instead, for hosts that watch the wall clock.
+
+--bench runs each scheduler of the shared pick core (PickCycle: single,
+batch and pipelined, with grasp checks) against the model, with ArmSerial
+on the pseudo-terminal and a simulated tray rendered on demand at frame
+times of the virtual clock. Nothing sleeps: waiting for a fresh frame moves
+the virtual clock on to it, the look-ahead scan waits for the virtual clock
+to pass the claw's exit from the tray, and the host's real compute between
+commands is added as host time. A thousand picks, about three hours on
+the rig, take 8-15 s per scheduler on one core. The look-ahead's compute is charged as host time although on the rig it
+overlaps the return move, so the pipelined scheduler's lead is understated
+by its scan time (a few ms a pick).
+"""
+import argparse
+import asyncio
+import math
+import os
+import select
+import threading
+import time
+
+# Firmware constants (BTS7960_Based_control.ino).
+SWITCH_DELAY = 0.2          # switchDelay before every single-axis and Z move (seconds)
+CLAW_DEFAULT = 0.1          # duration the sketch assigns to a claw command without one (unused by the claw)
+# The Uno prints its banner after the reset that opening the port causes. A pty has no such
+# reset and pyserial flushes input on open, so the banner repeats until the first command.
+BANNER_REPEAT = 0.5         # seconds
+BANNER = (
+    "Robotic Arm Control Ready (BTS7960 Drivers)",
+    "Command format: [Motor] [Direction] [Duration]",
+    "Motors:",
+    "   X/Y: F=forward, R=reverse",
+    "   Z: U=up, D=down",
+    "   C: O=open, C=close",
+    "New command for simultaneous X/Y movement: XY <direction> <x_duration> <y_duration>",
+    "Examples:",
+    "   X F 2.5    - X forward 2.5s",
+    "   Z U 1.0    - Z up 1.0s",
+    "   C C        - Close claw",
+    "   XY F 2.5 1.5 - X/Y forward for 2.5s/1.5s (simultaneously)",
+)
+
+BENCH_SCHEDULERS = ("single", "batch", "pipelined")  # pick_cycle.SCHEDULERS, without importing OpenCV
+BENCH_CONNECT_TIMEOUT = 10  # seconds the bench's host waits for the model's banner
+BENCH_WAIT_TIMEOUT = 5      # real seconds a bench thread waits for the virtual clock before giving up on it
+
+
+def arduino_to_float(text):
+    """String.toFloat(): the longest leading number after whitespace, or 0."""
+    text = text.lstrip()
+    end, seen_digit, seen_point = 0, False, False
+    if end < len(text) and text[end] in "+-":
+        end += 1
+    while end < len(text) and (text[end].isdigit() or (text[end] == "." and not seen_point)):
+        seen_digit |= text[end].isdigit()
+        seen_point |= text[end] == "."
+        end += 1
+    return float(text[:end]) if seen_digit else 0.0
+
+
+def arduino_substring(text, left, right=None):
+    """String.substring(): swaps reversed bounds and clamps them to the string."""
+    if right is None:
+        right = len(text)
+    if left > right:
+        left, right = right, left
+    left, right = max(left, 0), min(right, len(text))
+    return text[left:right] if left < right else ""
+
+
+def char_at(text, index):
+    """String.charAt(): NUL past the end, upper-cased like toupper()."""
+    return text[index].upper() if 0 <= index < len(text) else "\0"
+
+
+def millis(seconds):
+    """unsigned long duration_ms = seconds * 1000 (truncated; negative durations treated as 0)."""
+    return max(int(seconds * 1000), 0) / 1000
+
+
+def arduino_print(value, digits=1):
+    """Serial.print(float, digits): adds half of the last digit, then truncates."""
+    sign = "-" if value < 0 else ""
+    value = abs(value) + 0.5 / 10 ** digits
+    whole = int(value)
+    rest = value - whole
+    decimals = ""
+    for _ in range(digits):
+        rest *= 10
+        decimals += str(int(rest))
+        rest -= int(rest)
+    return f"{sign}{whole}.{decimals}" if digits else f"{sign}{whole}"
+
+
+class VirtualClock:
+    """Time as the rig would experience it: simulated move durations plus the host's real time.
+
+    With time_scale 0 moves return at once; otherwise they sleep for their
+    duration times time_scale. Other threads may wait for the clock to pass
+    a time (wait_until) or move it on themselves (advance_to).
+    """
+
+    def __init__(self, time_scale=0.0):
+        self.time_scale = time_scale
+        self.now = 0.0
+        self.move_time = 0.0  # share of `now` spent blocked in moves
+        self.host_time = 0.0  # share of `now` spent waiting for the host
+        self._real_mark = time.monotonic()
+        self._changed = threading.Condition()
+
+    def restart(self):
+        """Starts counting host time from now, e.g. once the host has connected."""
+        self._real_mark = time.monotonic()
+
+    def catch_up(self):
+        """Adds the real time since the last move, i.e. the host's thinking time."""
+        real = time.monotonic()
+        elapsed = real - self._real_mark
+        self._real_mark = real
+        if self.time_scale:
+            elapsed /= self.time_scale  # a scaled run's real gaps are scaled rig time
+        self.advance(elapsed)
+
+    def run(self, seconds):
+        """Blocks for a move of `seconds` rig time."""
+        if self.time_scale:
+            time.sleep(seconds * self.time_scale)
+        with self._changed:
+            self.now += seconds
+            self.move_time += seconds
+            self._changed.notify_all()
+        self._real_mark = time.monotonic()
+
+    def advance(self, seconds):
+        """Adds simulated host time (e.g. a modelled scan) without sleeping."""
+        with self._changed:
+            self.now += seconds
+            self.host_time += seconds
+            self._changed.notify_all()
+
+    def advance_to(self, when):
+        """Moves the clock on to `when` as host time, e.g. while the host waits for a frame. No-op if it has passed."""
+        with self._changed:
+            if when > self.now:
+                self.host_time += when - self.now
+                self.now = when
+                self._changed.notify_all()
+
+    def wait_until(self, when, timeout=None):
+        """Blocks until the clock reaches `when` or `timeout` real seconds pass. Returns True if it did."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.now >= when, timeout)
+
+
+class Axis:
+    """One motor's position in seconds of travel from home, as a function of virtual time.
+
+    With `home_stop`, the axis cannot run back past home: the carriage sits
+    against the frame there, which is also what brings an `XY R` that
+    overshoots (rounding in re-grasp corrections adds up) back to home.
+    """
+
+    def __init__(self, home_stop=False):
+        self.home_stop = home_stop
+        self.start_position = 0.0
+        self.start_time = 0.0
+        self.end_time = 0.0
+        self.velocity = 0.0
+
+    def position(self, now):
+        elapsed = min(now, self.end_time) - self.start_time
+        position = self.start_position + self.velocity * max(elapsed, 0.0)
+        return max(position, 0.0) if self.home_stop else position
+
+    def move(self, now, velocity, seconds):
+        self.start_position = self.position(now)
+        self.start_time, self.end_time, self.velocity = now, now + seconds, velocity
+
+
+class FirmwareModel:
+    """The sketch's loop(): one command line in, its reply lines out, axes moved on the clock.
+
+    `on_claw(closed, x, y, z)` is called whenever the claw changes, with the
+    axis positions at that instant, so a simulated tray can react to grasps.
+    """
+
+    def __init__(self, clock=None, on_claw=None):
+        self.clock = clock or VirtualClock()
+        self.on_claw = on_claw
+        self.axes = {"X": Axis(home_stop=True), "Y": Axis(home_stop=True), "Z": Axis()}
+        self.claw_closed = False
+        self.commands = 0
+        self.errors = 0
+        self.grasps = 0
+
+    def position(self):
+        """(x, y, z) in seconds of travel from home at the current virtual time."""
+        now = self.clock.now
+        return tuple(self.axes[name].position(now) for name in "XYZ")
+
+    def handle(self, line, write):
+        """Runs one command; `write(text)` receives each reply line as the sketch prints it."""
+        if self.commands:
+            self.clock.catch_up()
+        else:
+            self.clock.restart()  # time spent connecting is not cycle time
+        self.commands += 1
+        text = line.strip()
+        if text.startswith("XY"):
+            direction = char_at(text, 3)
+            first_space = text.find(" ", 4)
+            second_space = text.find(" ", first_space + 1)
+            x_seconds = arduino_to_float(arduino_substring(text, first_space + 1, second_space))
+            y_seconds = arduino_to_float(arduino_substring(text, second_space + 1))
+            self._run_xy(direction, x_seconds, y_seconds, write)
+            return
+
+        motor, direction = char_at(text, 0), char_at(text, 2)
+        duration = arduino_to_float(arduino_substring(text, 4))
+        if motor == "C" and duration <= 0:
+            duration = CLAW_DEFAULT
+        if motor in ("X", "Y"):
+            if direction in ("F", "R"):
+                self._run_motor(motor, direction, duration, write)
+            else:
+                self._error("Error: Use F/R for X/Y axes", write)
+        elif motor == "Z":
+            if direction in ("U", "D"):
+                self._run_z(direction, duration, write)
+            else:
+                self._error("Error: Use U=up, D=down for Z-axis", write)
+        elif motor == "C":
+            if direction == "O":
+                self._set_claw(False)
+                write("Claw OPENED (LOW)")
+            elif direction == "C":
+                self._set_claw(True)
+                write("Claw CLOSED (HIGH)")
+            else:
+                self._error("Error: Use O to open or C to close claw", write)
+        else:
+            self._error("Error: Invalid motor (use X/Y/Z/C)", write)
+
+    def _error(self, message, write):
+        self.errors += 1
+        write(message)
+
+    def _run_motor(self, motor, direction, seconds, write):
+        write(f"Motor {motor} {'FORWARD' if direction == 'F' else 'REVERSE'} for {arduino_print(seconds)} seconds")
+        self.clock.run(SWITCH_DELAY)
+        duration = millis(seconds)
+        self.axes[motor].move(self.clock.now, 1.0 if direction == "F" else -1.0, duration)
+        self.clock.run(duration)
+        write("Done")
+
+    def _run_xy(self, direction, x_seconds, y_seconds, write):
+        write(f"Simultaneous XY move for X:{arduino_print(x_seconds)}s and Y:{arduino_print(y_seconds)}s")
+        # Anything but F runs the motors in reverse, and there is no switchDelay.
+        velocity = 1.0 if direction == "F" else -1.0
+        x_duration, y_duration = millis(x_seconds), millis(y_seconds)
+        now = self.clock.now
+        self.axes["X"].move(now, velocity, x_duration)
+        self.axes["Y"].move(now, velocity, y_duration)
+        self.clock.run(max(x_duration, y_duration))
+        write("Simultaneous XY move complete.")
+
+    def _run_z(self, direction, seconds, write):
+        write(f"Z-axis {'UP' if direction == 'U' else 'DOWN'} for {arduino_print(seconds)} seconds")
+        self.clock.run(SWITCH_DELAY)
+        duration = millis(seconds)
+        self.axes["Z"].move(self.clock.now, 1.0 if direction == "U" else -1.0, duration)
+        self.clock.run(duration)
+        write("Done")
+
+    def _set_claw(self, closed):
+        if closed and not self.claw_closed:
+            self.grasps += 1
+        self.claw_closed = closed
+        if self.on_claw is not None:
+            self.on_claw(closed, *self.position())
+
+
+class VirtualArduino:
+    """Serves a FirmwareModel on a pseudo-terminal that pyserial opens like the Uno's port.
+
+    The banner repeats until the first command arrives, standing in for the
+    one setup() prints after the reset that opening the port causes. Lines
+    written while a move runs wait in the pty buffer, as they would in the
+    Uno's serial buffer.
+    """
+
+    def __init__(self, model=None, time_scale=0.0):
+        if not hasattr(os, "openpty"):
+            raise OSError("Pseudo-terminals are not available on this platform")
+        import tty  # POSIX only
+
+        self.model = model or FirmwareModel(VirtualClock(time_scale))
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # no echo, no newline translation: bytes pass as on a USB serial link
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._thread = None
+
+    @property
+    def clock(self):
+        return self.model.clock
+
+    def _write(self, text):
+        os.write(self._master, f"{text}\r\n".encode())
+
+    def start(self):
+        """Starts answering commands. Returns self so it can be chained."""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="VirtualArduino", daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        buffer = b""
+        while self._running:
+            try:
+                if not self.model.commands:
+                    for line in BANNER:
+                        self._write(line)
+                    if not select.select([self._master], [], [], BANNER_REPEAT)[0]:
+                        continue
+                data = os.read(self._master, 1024)
+            except (OSError, ValueError):
+                return  # closed
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self.model.handle(line.decode(errors="replace"), self._write)
+
+    def stop(self):
+        self._running = False
+        for fd in (self._slave, self._master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def summary(self):
+        clock, model = self.clock, self.model
+        hours = clock.now / 3600
+        rate = f", {model.grasps / hours:.0f} grasps/hour" if hours > 0 else ""
+        return (f"{model.commands} commands, {model.grasps} grasps, {model.errors} errors in "
+                f"{clock.now:.1f} s virtual ({clock.move_time:.1f} s moving, {clock.host_time:.1f} s host){rate}")
+
+
+class VirtualCamera:
+    """FrameGrabber stand-in for --bench: renders a SimulatedCell on demand, on the model's virtual clock.
+
+    Frames are exposed every 1/fps seconds of virtual time. Asking for the
+    first frame after a time that has not come yet moves the clock on to
+    it, so the host's wait for a fresh frame counts as host time. The claw
+    is drawn where the model's axes are when the frame is exposed.
+    """
+
+    def __init__(self, cell, model, fps):
+        self.cell = cell
+        self.model = model
+        self.interval = 1 / fps
+
+    def _frame(self, timestamp):
+        x, y = (self.model.axes[name].position(timestamp) for name in "XY")
+        self.cell.move_claw(x, y)
+        return timestamp, self.cell.render()
+
+    def latest(self):
+        return self._frame(math.floor(self.model.clock.now / self.interval) * self.interval)
+
+    def wait_for_frame_after(self, after, timeout=1.0):
+        timestamp = (math.floor(after / self.interval) + 1) * self.interval
+        self.model.clock.advance_to(timestamp)
+        return self._frame(timestamp)
+
+    def read(self):
+        _, frame = self.wait_for_frame_after(self.model.clock.now)
+        return True, frame
+
+
+async def bench_scheduler(scheduler, picks, seed=0):
+    """Picks `picks` pieces with one PickCycle scheduler against the model. Returns (arduino, cell, verifier)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+
+    from arm_serial import ArmSerial
+    from calibration import CalibrationModel, load_calibration_set
+    from controller import AsyncArm
+    from grasp_point import deepest_point
+    from pick_cycle import PickCycle
+    from pick_verification import PickVerifier
+    from serial_connection import SerialConnection
+    from simulated_cell import SIMULATED_FPS, SimulatedCell
+    from station_setup import build_calibration_lut, build_detector
+    from station_supervisor import SIMULATED_TRAY, simulated_stations
+
+    station = simulated_stations(1)[0]
+    tray = np.array(SIMULATED_TRAY, dtype=np.int32)
+    _, kind, pixels, times = load_calibration_set(station.calibration_set)
+    calibration = CalibrationModel(kind).fit(pixels, times)
+    # The next batch arrives as soon as the tray is empty and the arm is home (see the loop
+    # below): throughput, not idle time, and never a piece dropped under the claw.
+    cell = SimulatedCell(tray, build_calibration_lut(calibration, tray), seed=seed, refill_delay=math.inf)
+
+    def on_claw(closed, x, y, z):
+        if closed:
+            cell.grab(x, y)
+        else:
+            cell.release()
+
+    clock = VirtualClock()
+    arduino = VirtualArduino(FirmwareModel(clock, on_claw)).start()
+    camera = VirtualCamera(cell, arduino.model, SIMULATED_FPS)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+    arm = None
+    try:
+        arm = AsyncArm(ArmSerial(SerialConnection(arduino.port, discover=False).connect(BENCH_CONNECT_TIMEOUT)))
+        detector = build_detector(station.detector, camera.read()[1], tray, station.detector_params)
+        calibration_lut = build_calibration_lut(calibration, tray)
+        verifier = PickVerifier(calibration_lut, grasp=deepest_point)
+        picker = PickCycle(arm, camera, detector, calibration_lut, executor, scheduler, verifier, deepest_point,
+                           should_stop=lambda: cell.picked >= picks, clock=lambda: clock.now,
+                           sleep=lambda seconds: clock.wait_until(clock.now + seconds, BENCH_WAIT_TIMEOUT))
+        while cell.picked < picks:
+            cell.feed()
+            await picker.cycle()
+    finally:
+        executor.shutdown(wait=True)
+        if arm is not None:
+            arm.ser.close()
+            arm.close()
+        arduino.stop()
+    return arduino, cell, verifier
+
+
+def bench(picks, schedulers=BENCH_SCHEDULERS):
+    """Runs every scheduler until it has made `picks` picks on the model.
+
+    Returns one (scheduler, real seconds, arduino, cell, verifier) per
+    scheduler; the VirtualArduino holds the virtual clock.
+    """
+    results = []
+    for scheduler in schedulers:
+        real_start = time.monotonic()
+        arduino, cell, verifier = asyncio.run(bench_scheduler(scheduler, picks))
+        results.append((scheduler, time.monotonic() - real_start, arduino, cell, verifier))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--time-scale", type=float, default=0.0,
+                        help="run moves at this fraction of real time (default: 0, instantly)")
+    parser.add_argument("--bench", type=int, metavar="PICKS",
+                        help="make this many picks with each scheduler on a simulated tray and report throughput")
+    parser.add_argument("--scheduler", action="append", choices=BENCH_SCHEDULERS,
+                        help="bench only this scheduler (repeatable; default: all)")
+    args = parser.parse_args()
+
+    if args.bench:
+        results = bench(args.bench, args.scheduler or BENCH_SCHEDULERS)
+        # "misses" are grasps the check found left behind; "failed grabs" are closes that caught nothing.
+        print(f"{'scheduler':>10} {'picks':>6} {'rig h':>6} {'picks/hour':>11} {'host s/pick':>12} "
+              f"{'misses':>7} {'retries':>8} {'failed grabs':>13} {'real s':>7}")
+        for scheduler, real, arduino, cell, verifier in results:
+            clock = arduino.clock
+            print(f"{scheduler:>10} {cell.picked:>6} {clock.now / 3600:>6.2f} {cell.picked * 3600 / clock.now:>11.1f} "
+                  f"{clock.host_time / cell.picked:>12.3f} {verifier.misses:>7} {verifier.retries:>8} "
+                  f"{cell.missed_grabs:>13} {real:>7.1f}")
+        return
+
+    arduino = VirtualArduino(time_scale=args.time_scale).start()
+    print(f"Virtual arm firmware listening on {arduino.port}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        arduino.stop()
+        print(arduino.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import deque
+
+# Number of timestamped frames kept in memory. Small on purpose: we only ever
+# want the newest frame, the rest is slack for a consumer that lags one frame.
+RING_BUFFER_SIZE = 4
+
+# Pause after a failed camera.read() so a disconnected camera does not spin a core.
+READ_RETRY_DELAY = 0.01
+
+
+class FrameGrabber:
+    """Drains a cv2.VideoCapture on a background thread into a ring buffer of (timestamp, frame)."""
+
+    def __init__(self, camera, buffer_size=RING_BUFFER_SIZE):
+        self.camera = camera
+        self.frames_captured = 0
+        self.read_failures = 0
+        self._frames = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Starts the capture thread. Returns self so it can be chained."""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="FrameGrabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Stops the capture thread. The camera itself is left open for the caller to release."""
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.camera.read()
+            # Timestamp on arrival: the driver hands us the frame as soon as it is
+            # exposed because we never let its internal queue fill up.
+            timestamp = time.monotonic()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(READ_RETRY_DELAY)
+                continue
+            with self._condition:
+                self._frames.append((timestamp, frame))
+                self.frames_captured += 1
+                self._condition.notify_all()
+
+    def latest(self):
+        """Returns the newest (timestamp, frame) without waiting, or (None, None) if nothing arrived yet."""
+        with self._condition:
+            if not self._frames:
+                return None, None
+            return self._frames[-1]
+
+    def wait_for_frame_after(self, after, timeout=1.0):
+        """Blocks until a frame captured after `after` (time.monotonic()) is available.
+
+        Returns (timestamp, frame), or (None, None) on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._frames and self._frames[-1][0] > after:
+                    return self._frames[-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None, None
+                self._condition.wait(remaining)
+
+    def read(self):
+        """Drop-in for cv2.VideoCapture.read(): returns the first frame captured after the call."""
+        _, frame = self.wait_for_frame_after(time.monotonic())
+        return frame is not None, frame
@@ -0,0 +1,219 @@
+import glob
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Frames per chunk. The chunk bounds how much the recorder holds in memory (100 VGA
+# frames are about 90 MB before encoding) before handing it to the writer thread.
+CHUNK_SIZE = 100
+CHUNK_PATTERN = "chunk_{:05d}.npz"
+# Full chunks waiting for the writer thread. Past this the disk is not keeping up and
+# further chunks are dropped (and counted) rather than holding up the capture thread.
+MAX_PENDING_CHUNKS = 4
+# How frames are stored. A JPEG at quality 95 of a noisy VGA frame is about a tenth of
+# the raw frame and takes ~2 ms to encode; pixels move by a few gray levels, far below
+# the detectors' thresholds. ".png" is lossless but only halves the size and takes
+# ~40 ms a frame, too slow to keep up with 30 fps on a small host.
+IMAGE_FORMAT = ".jpg"
+JPEG_QUALITY = 95
+PNG_COMPRESSION = 1
+
+
+class FrameRecorder:
+    """Writes frames and their capture timestamps to a directory of .npz chunks.
+
+    write() only collects frames; full chunks are encoded (`image_format`,
+    ".jpg" or ".png") and saved by a writer thread, so the camera thread
+    never waits on the encoder or the disk. A chunk holds the encoded
+    frames back to back in "data", where frame i is
+    data[offsets[i]:offsets[i + 1]], with their "timestamps".
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE, image_format=IMAGE_FORMAT, quality=JPEG_QUALITY,
+                 max_pending=MAX_PENDING_CHUNKS):
+        if image_format == ".jpg":
+            self._encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif image_format == ".png":
+            self._encode_params = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+        else:
+            raise ValueError(f"Unknown recording format '{image_format}' (use '.jpg' or '.png')")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.image_format = image_format
+        self.frames_written = 0
+        self.bytes_written = 0
+        self._dropped = 0         # frames of chunks the writer had no room for
+        self._failed = 0          # frames of chunks the writer could not save
+        self._frames = []
+        self._timestamps = []
+        self._chunk_index = 0
+        self._error = None
+        os.makedirs(path, exist_ok=True)
+        self._pending = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="FrameRecorder", daemon=True)
+        self._thread.start()
+
+    def write(self, frame, timestamp=None):
+        self._frames.append(frame)
+        self._timestamps.append(time.monotonic() if timestamp is None else timestamp)
+        if len(self._frames) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Hands the frames collected so far to the writer thread. Never blocks."""
+        if not self._frames:
+            return
+        chunk_path = os.path.join(self.path, CHUNK_PATTERN.format(self._chunk_index))
+        try:
+            self._pending.put_nowait((chunk_path, self._frames, self._timestamps))
+        except queue.Full:
+            if not self._dropped:
+                print(f"⚠️ Recording to '{self.path}' cannot keep up with the camera. Dropping frames.")
+            self._dropped += len(self._frames)
+        self._chunk_index += 1
+        self._frames = []
+        self._timestamps = []
+
+    def _encode(self, frames):
+        encoded = []
+        for frame in frames:
+            ok, data = cv2.imencode(self.image_format, frame, self._encode_params)
+            if not ok:
+                raise ValueError(f"Could not encode a {frame.shape} frame as {self.image_format}")
+            encoded.append(data.reshape(-1))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([data.size for data in encoded], out=offsets[1:])
+        return np.concatenate(encoded), offsets
+
+    def _write_loop(self):
+        while True:
+            chunk = self._pending.get()
+            if chunk is None:
+                return
+            chunk_path, frames, timestamps = chunk
+            if self._error is None:
+                try:
+                    data, offsets = self._encode(frames)
+                    np.savez(chunk_path, data=data, offsets=offsets, timestamps=np.array(timestamps, dtype=np.float64))
+                    self.frames_written += len(frames)
+                    self.bytes_written += data.size
+                    continue
+                except (OSError, ValueError) as e:
+                    self._error = e  # raised by close(); later chunks are not attempted
+            self._failed += len(frames)
+
+    @property
+    def frames_dropped(self):
+        return self._dropped + self._failed
+
+    def close(self):
+        """Writes what is left and waits for the writer thread to finish."""
+        self.flush()
+        self._pending.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def is_recording(path):
+    """True if `path` is a directory written by FrameRecorder."""
+    return os.path.isdir(path) and bool(glob.glob(os.path.join(path, "chunk_*.npz")))
+
+
+def iter_recording(path):
+    """Yields (timestamp, frame) from a recording, decoding one frame at a time.
+
+    Recordings made before frames were encoded hold raw "frames" arrays;
+    those are still read.
+    """
+    for chunk_path in sorted(glob.glob(os.path.join(path, "chunk_*.npz"))):
+        with np.load(chunk_path) as chunk:
+            timestamps = chunk["timestamps"]
+            if "frames" in chunk.files:
+                for timestamp, frame in zip(timestamps, chunk["frames"]):
+                    yield float(timestamp), frame
+                continue
+            data, offsets = chunk["data"], chunk["offsets"]
+        for index, timestamp in enumerate(timestamps):
+            yield float(timestamp), cv2.imdecode(data[offsets[index]:offsets[index + 1]], cv2.IMREAD_UNCHANGED)
+
+
+class RecordingCamera:
+    """Wraps a cv2.VideoCapture and records every frame it reads."""
+
+    def __init__(self, camera, recorder):
+        self.camera = camera
+        self.recorder = recorder
+
+    def read(self):
+        ret, frame = self.camera.read()
+        if ret:
+            self.recorder.write(frame)
+        return ret, frame
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def release(self):
+        try:
+            self.recorder.close()
+        finally:
+            self.camera.release()
+        dropped = f" ({self.recorder.frames_dropped} dropped)" if self.recorder.frames_dropped else ""
+        print(f"Recorded {self.recorder.frames_written} frame(s), {self.recorder.bytes_written / 1e6:.1f} MB, "
+              f"to '{self.recorder.path}'{dropped}.")
+
+
+class ReplayCamera:
+    """Plays a recording back through the cv2.VideoCapture read()/isOpened()/release() interface.
+
+    Frames are decoded as they are read. With realtime=True they are
+    released at their recorded spacing; otherwise they come out as fast as
+    they are read. loop=True restarts at the end instead of reporting end
+    of stream.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        if not is_recording(path):
+            raise FileNotFoundError(f"No recording found in '{path}'")
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.frames_read = 0
+        self._opened = True
+        self._restart()
+
+    def _restart(self):
+        self._frames = iter_recording(self.path)
+        self._first_timestamp = None
+        self._replay_start = None
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        try:
+            timestamp, frame = next(self._frames)
+        except StopIteration:
+            if not self.loop:
+                return False, None
+            self._restart()
+            timestamp, frame = next(self._frames)
+
+        if self.realtime:
+            if self._first_timestamp is None:
+                self._first_timestamp, self._replay_start = timestamp, time.monotonic()
+            delay = (timestamp - self._first_timestamp) - (time.monotonic() - self._replay_start)
+            if delay > 0:
+                time.sleep(delay)
+        self.frames_read += 1
+        return True, frame
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        self._opened = False
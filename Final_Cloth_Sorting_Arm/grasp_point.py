@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+from batch_picking import xy_move_time
+
+# Points within this many pixels of the deepest one count as equally deep. A long
+# piece has a whole ridge of them; the one the arm reaches soonest is taken.
+GRASP_TIE_DEPTH = 1.0
+# Ridge points compared by travel time, spread evenly along the ridge.
+GRASP_MAX_CANDIDATES = 32
+# A piece whose deepest point is nearer its edge than this (pixels) is too thin or
+# too small to aim for; the claw goes to its centroid as before.
+MIN_GRASP_DEPTH = 2.0
+
+
+def depth_map(blob):
+    """Distance of every pixel in the blob's bounding box to the nearest edge of the fabric.
+
+    Returns (distances, (x, y) of the box's top-left corner in the frame).
+    Holes in the blob count as edges, the box border does too.
+    """
+    x, y, w, h = cv2.boundingRect(blob.contour)
+    # One empty pixel around the box so fabric touching it still has an edge there.
+    mask = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    cv2.drawContours(mask, [blob.contour], -1, 255, -1, offset=(1 - x, 1 - y))
+    if blob.holes:
+        cv2.drawContours(mask, list(blob.holes), -1, 0, -1, offset=(1 - x, 1 - y))
+    return cv2.distanceTransform(mask, cv2.DIST_L2, cv2.DIST_MASK_5), (x - 1, y - 1)
+
+
+def deepest_points(blob, tie_depth=GRASP_TIE_DEPTH, max_candidates=GRASP_MAX_CANDIDATES):
+    """The points deepest inside the blob's fabric, as an (N, 2) int array of frame (x, y), and their depth."""
+    distances, (x0, y0) = depth_map(blob)
+    _, depth, _, _ = cv2.minMaxLoc(distances)
+    ys, xs = np.nonzero(distances >= depth - tie_depth)
+    if len(xs) > max_candidates:
+        keep = np.linspace(0, len(xs) - 1, max_candidates).round().astype(int)
+        xs, ys = xs[keep], ys[keep]
+    return np.column_stack((xs + x0, ys + y0)), depth
+
+
+def deepest_point(blob, to_motor_times=None, tie_depth=GRASP_TIE_DEPTH, min_depth=MIN_GRASP_DEPTH):
+    """Pixel (x, y) to close the claw on: the point of the blob deepest inside its fabric.
+
+    The centroid of a folded, L-shaped or ring-shaped piece can lie on the
+    empty tray; the deepest point is always on the cloth, as far from its
+    edges as the piece allows. Among equally deep points the one with the
+    shortest calibrated trip wins (`to_motor_times(x, y)`), or without a
+    calibration the one nearest the centroid. Pieces too thin to have a
+    deep point fall back to the centroid.
+    """
+    points, depth = deepest_points(blob, tie_depth)
+    if depth < min_depth or len(points) == 0:
+        return blob.centroid
+    if to_motor_times is not None:
+        costs = [xy_move_time(*to_motor_times(px, py)) for px, py in points.tolist()]
+    else:
+        costs = np.hypot(points[:, 0] - blob.centroid[0], points[:, 1] - blob.centroid[1])
+    x, y = points[int(np.argmin(costs))]
+    return (int(x), int(y))
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond vision stages up to arm moves.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROLLING_WINDOW = 1000  # most recent durations kept per stage for percentiles
+METRIC_NAME = "cloth_sorter_stage_seconds"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Stage:
+    def __init__(self):
+        self.recent = deque(maxlen=ROLLING_WINDOW)
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+
+class Metrics:
+    """Per-stage timing spans with rolling percentiles and cumulative histograms.
+
+    Disabled, span() hands back a shared no-op context manager, so leaving
+    the spans in the hot path costs one attribute check per stage.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Context manager that times the enclosed block as stage `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        """Adds one duration to a stage."""
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage()
+            stage.recent.append(seconds)
+            stage.count += 1
+            stage.total += seconds
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stage.bucket_counts[index] += 1
+                    break
+
+    def summary(self):
+        """{stage: {count, mean_ms, p50_ms, p90_ms, p99_ms}} over each stage's rolling window."""
+        with self._lock:
+            snapshot = {name: (stage.count, list(stage.recent)) for name, stage in self._stages.items()}
+        result = {}
+        for name, (count, recent) in snapshot.items():
+            ms = np.array(recent) * 1000
+            p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+            result[name] = {"count": count, "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+                            "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3)}
+        return result
+
+    def write_jsonl(self, path):
+        """Appends a timestamped summary line to a JSONL log."""
+        if not self._stages:
+            return
+        with open(path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "stages": self.summary()}) + "\n")
+
+    def prometheus_text(self):
+        """Cumulative histograms in the Prometheus text exposition format."""
+        lines = [f"# HELP {METRIC_NAME} Duration of each pick-cycle stage.",
+                 f"# TYPE {METRIC_NAME} histogram"]
+        with self._lock:
+            for name, stage in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stage.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {stage.total:.6f}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {stage.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Rewrites a Prometheus text file atomically so a scraper never sees half a file."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    def export(self, jsonl_path=None, prometheus_path=None):
+        if not self.enabled:
+            return
+        if jsonl_path:
+            self.write_jsonl(jsonl_path)
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+
+
+# Shared by the main program, the detectors and the serial driver. Off until enabled.
+METRICS = Metrics()
@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+# Output resolution of the flattened tray relative to its size in the camera image.
+FLATTEN_SCALE = 0.5
+
+
+def order_points(pts):
+    """Orders four corners as top-left, top-right, bottom-right, bottom-left."""
+    pts = np.asarray(pts, dtype="float32").reshape(4, 2)
+    rect = np.zeros((4, 2), dtype="float32")
+    s = pts.sum(axis=1)
+    rect[0] = pts[np.argmin(s)]   # top-left
+    rect[2] = pts[np.argmax(s)]   # bottom-right
+    diff = np.diff(pts, axis=1)
+    rect[1] = pts[np.argmin(diff)]  # top-right
+    rect[3] = pts[np.argmax(diff)]  # bottom-left
+    return rect
+
+
+def flattened_size(rect):
+    """Width and height of the top-down view: the longer of each pair of opposite edges."""
+    (tl, tr, br, bl) = rect
+    width = max(np.linalg.norm(br - bl), np.linalg.norm(tr - tl))
+    height = max(np.linalg.norm(tr - br), np.linalg.norm(tl - bl))
+    return width, height
+
+
+class PerspectiveFlattener:
+    """Warps the tray quadrilateral into a top-down rectangle with precomputed remap tables.
+
+    The homography and the per-pixel lookup tables are built once from the
+    tray corners; flattening a frame is then a single cv2.remap. Points found
+    in the flattened view map back to camera pixels through the inverse
+    homography, so the calibration keeps working on camera coordinates.
+
+    `size`, if given, fixes the output size instead of deriving it from the
+    corners, so a view rebuilt for moved corners matches the old one.
+    """
+
+    def __init__(self, tray_contour, scale=FLATTEN_SCALE, size=None):
+        self.scale = scale
+        rect = order_points(tray_contour)
+        if size is None:
+            width, height = flattened_size(rect)
+            size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        w, h = self.size = size
+
+        dst = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+        self.homography = cv2.getPerspectiveTransform(rect, dst)
+        self.inverse = np.linalg.inv(self.homography)
+
+        # For every output pixel, the camera pixel it samples.
+        xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+        grid = np.dstack([xs, ys]).reshape(-1, 1, 2)
+        source = cv2.perspectiveTransform(grid, self.inverse).reshape(h, w, 2)
+        # Fixed-point maps remap noticeably faster than float ones.
+        self.map1, self.map2 = cv2.convertMaps(source[..., 0], source[..., 1], cv2.CV_16SC2)
+
+    def flatten(self, frame, window=None, dst=None):
+        """Returns the top-down view of the tray, or only `window` (x0, y0, x1, y1) of it.
+
+        `dst`, if given, is a preallocated output of the right shape to write into.
+        """
+        if window is None:
+            return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst)
+        x0, y0, x1, y1 = window
+        return cv2.remap(frame, self.map1[y0:y1, x0:x1], self.map2[y0:y1, x0:x1], cv2.INTER_LINEAR, dst=dst)
+
+    def to_frame(self, points):
+        """Maps flattened (x, y) points back to camera pixels. Returns an (N, 2) float array."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, self.inverse).reshape(-1, 2)
+
+    def to_flat(self, points):
+        """Maps camera (x, y) points into the flattened view. Returns an (N, 2) float array."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, self.homography).reshape(-1, 2)
+
+    def rect_to_flat(self, rect):
+        """Bounding rectangle, in the flattened view, of a camera-space rectangle (x0, y0, x1, y1)."""
+        x0, y0, x1, y1 = rect
+        corners = self.to_flat([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+        fx0, fy0 = np.floor(corners.min(axis=0)).astype(int)
+        fx1, fy1 = np.ceil(corners.max(axis=0)).astype(int)
+        return (int(fx0), int(fy0), int(fx1), int(fy1))
@@ -0,0 +1,284 @@
+import asyncio
+import time
+
+from batch_picking import batch_motor_time, pick_target, plan_batch, recheck_target
+from metrics import METRICS
+from pick_verification import CLAW_JAW_RADIUS, commanded, correction_moves, left_behind, regrasp_commands
+from pipelined_picking import ARM_FOOTPRINT_RADIUS, ArmFootprint, LookaheadScan
+from tray_locator import follow_tray
+
+# How a cycle orders its picks: "single" picks the largest piece and stops, "batch" picks
+# everything one scan found, re-checking each piece before its pick, and "pipelined" finds
+# each next piece while the arm carries the last one home.
+SCHEDULERS = ("single", "batch", "pipelined")
+FRAME_TIMEOUT = 2  # seconds to wait for a fresh frame from the grabber thread
+
+
+class PickCycle:
+    """One station's scan, pick, grasp check and scheduler, shared by the console program and the station workers.
+
+    Arm commands go through an AsyncArm; everything that touches the camera
+    or the detector runs on `vision_executor`, a single thread, so the
+    look-ahead scan never uses the detector alongside another scan.
+    `calibration_lut` is used in place, so following camera drift (see
+    check_drift()) carries over to the next pick.
+
+    `log` receives the progress lines the console prints, `on_command` is
+    called after every acknowledged command (the station's heartbeat) and
+    `should_stop` is asked before every pick of a batch or pipeline.
+    `clock` and `sleep` are the time source the grabber stamps frames with,
+    and `time_scale` how many of its seconds one second of arm motion takes
+    (see LookaheadScan); simulated stations and the firmware model's bench
+    pass their own.
+    """
+
+    def __init__(self, arm, grabber, detector, calibration_lut, vision_executor, scheduler="pipelined",
+                 verifier=None, grasp=None, frame_timeout=FRAME_TIMEOUT, footprint_radius=ARM_FOOTPRINT_RADIUS,
+                 visualizer=None, log=None, on_command=None, should_stop=None, clock=time.monotonic,
+                 sleep=time.sleep, time_scale=1.0):
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler '{scheduler}' (use one of {', '.join(SCHEDULERS)})")
+        self.arm = arm
+        self.grabber = grabber
+        self.detector = detector
+        self.calibration_lut = calibration_lut
+        self.vision_executor = vision_executor
+        self.scheduler = scheduler
+        self.verifier = verifier
+        self.grasp = grasp
+        self.frame_timeout = frame_timeout
+        self.visualizer = visualizer
+        self.log = log or (lambda message: None)
+        self.on_command = on_command
+        self.should_stop = should_stop or (lambda: False)
+        self.clock = clock
+        self.sleep = sleep
+        self.time_scale = time_scale
+        self.footprint = ArmFootprint(calibration_lut, footprint_radius)
+        self.claw = ArmFootprint(calibration_lut, CLAW_JAW_RADIUS)
+        self.frame_missed = False  # the last cycle found no frame to scan
+
+    async def vision(self, func, *args):
+        """Runs a blocking OpenCV/grabber call on the vision thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.vision_executor, func, *args)
+
+    async def send(self, command):
+        """Sends a command to the Arduino and waits until the firmware reports it complete."""
+        self.log(f"Sending command: {command}")
+        elapsed = await self.arm.send(command)
+        self.log(f"   ↳ acknowledged after {elapsed:.2f} s")
+        if self.on_command is not None:
+            self.on_command()
+
+    async def fresh_frame(self):
+        """(timestamp, frame) of the first frame exposed after the call, or (None, None) on timeout."""
+        return await self.vision(self.grabber.wait_for_frame_after, self.clock(), self.frame_timeout)
+
+    async def scan(self):
+        """Captures a fresh frame and finds every piece on the tray. Returns (frame time, frame, blobs).
+
+        Without a frame in time, the frame and its time are None and there are no blobs.
+        """
+        # Only accept a frame exposed after this cycle started, never a stale one.
+        with METRICS.span("capture"):
+            frame_time, frame = await self.fresh_frame()
+        self.frame_missed = frame is None
+        if frame is None:
+            self.log("❌ Error: Could not read frame.")
+            return None, None, []
+        # Diff, threshold and contour search run on the tray ROI only; the detector
+        # maps the results back to full-frame coordinates.
+        with METRICS.span("detect"):
+            blobs = await self.vision(self.detector.detect, frame)
+        if not blobs:
+            self.log("⚠️ No object detected.")
+        return frame_time, frame, blobs
+
+    def plan(self, blobs):
+        """Every blob as a PickTarget, in picking order."""
+        with METRICS.span("centroid_to_time"):
+            targets = plan_batch(blobs, self.calibration_lut, self.grasp)
+        if targets:
+            self.log(f"✅ {len(targets)} object(s) detected. Planned XY motor time: {batch_motor_time(targets):.1f} s")
+        return targets
+
+    def show(self, frame, targets):
+        # Hand the frame to the display thread; drawing never blocks the cycle.
+        if self.visualizer is not None:
+            self.visualizer.submit(frame, self.detector.tray_contour, [t.blob.contour for t in targets],
+                                   [t.pixel for t in targets])
+
+    async def verify_grasp(self, target):
+        """Looks for the piece where it was grasped and re-grasps it if it is still there.
+
+        Returns the motor times the claw is at afterwards, for the return move.
+        """
+        position, blob, attempts = commanded((target.x_time, target.y_time)), target.blob, 0
+        while True:
+            _, frame = await self.fresh_frame()
+            with METRICS.span("verify"):
+                claw = self.claw.claw_rect(*position)
+                remaining = (await self.vision(left_behind, self.detector, frame, blob, claw)
+                             if frame is not None else None)
+            if remaining is None or attempts == self.verifier.max_retries:
+                self.verifier.record_pick(target, attempts, remaining is None)
+                if remaining is not None:
+                    self.log(f"⚠️ Still missed after {attempts} retries. Returning; the next scan will find it.")
+                return position
+            pixel, retry_position = self.verifier.retry_target(remaining, attempts)
+            retry_position = commanded(retry_position)
+            self.log(f"⚠️ Grasp missed: the piece is still at {remaining.centroid}. Retrying at {pixel}.")
+            moves = correction_moves(position, retry_position)
+            self.verifier.record_retry(attempts, moves)
+            for command in regrasp_commands(moves):
+                await self.send(command)
+            position, blob, attempts = retry_position, remaining, attempts + 1
+
+    async def pick_at(self, target, lookahead=None):
+        """Runs steps A-D for one target: move out, pick, return home and drop.
+
+        If a LookaheadScan is given, it starts as the return move is sent.
+        With a verifier, the grasp is checked after lift-off.
+        """
+        x_time, y_time = target.x_time, target.y_time
+        self.log("\nStarting pick-and-place cycle.")
+
+        # === STEP A: MOVE TO OBJECT ===
+        self.log("--- Step 1: Moving to object location ---")
+        with METRICS.span("phase_a_move_to_object"):
+            await self.send(f"XY F {x_time:.2f} {y_time:.2f}")
+
+        # === STEP B: PICK UP OBJECT ===
+        self.log("--- Step 2: Picking up the object ---")
+        with METRICS.span("phase_b_pick_up"):
+            await self.send("Z D 2.3")
+            await self.send("C C")
+            await self.send("Z U 3.1")
+
+        if self.verifier is not None and target.blob is not None:
+            with METRICS.span("phase_b_verify"):
+                x_time, y_time = await self.verify_grasp(target)
+
+        # === STEP C: MOVE TO BIN ===
+        self.log("--- Step 3: Moving to drop-off bin (home position) ---")
+        with METRICS.span("phase_c_move_to_bin"):
+            if lookahead is not None:
+                lookahead.start(x_time, y_time, self.clock())
+            await self.send(f"XY R {x_time:.2f} {y_time:.2f}")
+
+        # === STEP D: DROP OFF OBJECT ===
+        self.log("--- Step 4: Dropping off the object ---")
+        with METRICS.span("phase_d_drop_off"):
+            await self.send("C O")
+
+    async def pick_single(self):
+        """Picks the largest object on the tray. Returns the number of objects picked (0 or 1)."""
+        self.log("\n--- Starting new detection cycle ---")
+        frame_time, frame, blobs = await self.scan()
+        if not blobs:
+            return 0
+        with METRICS.span("centroid_to_time"):
+            target = pick_target(blobs[0], self.calibration_lut, self.grasp)
+        cx, cy = target.pixel
+        latency_ms = (self.clock() - frame_time) * 1000
+        self.log(f"✅ Object detected, grasping at ({cx}, {cy}) [capture-to-centroid {latency_ms:.0f} ms]")
+        self.show(frame, [target])
+        await self.pick_at(target)
+        self.log("\n✅ Cycle complete!")
+        return 1
+
+    async def pick_batch(self):
+        """Picks every object found in one scan, re-checking only the area around each next target.
+
+        Returns the number of objects picked.
+        """
+        self.log("\n--- Starting new batch detection cycle ---")
+        _, frame, blobs = await self.scan()
+        targets = self.plan(blobs)
+        if not targets:
+            return 0
+        self.show(frame, targets)
+
+        picked = 0
+        for index, target in enumerate(targets):
+            if self.should_stop():
+                break
+            if index > 0:
+                # The arm is back at home, so the tray is unobstructed again. Only look
+                # where this target was: earlier picks may have dragged or removed it.
+                with METRICS.span("capture"):
+                    _, frame = await self.fresh_frame()
+                with METRICS.span("recheck"):
+                    blob = (await self.vision(recheck_target, self.detector, frame, target)
+                            if frame is not None else None)
+                if blob is None:
+                    self.log(f"⚠️ Object {index + 1} is no longer at {target.pixel}. Skipping.")
+                    continue
+                target = pick_target(blob, self.calibration_lut, self.grasp)
+
+            cx, cy = target.pixel
+            self.log(f"\n--- Object {index + 1}/{len(targets)} at ({cx}, {cy}) ---")
+            await self.pick_at(target)
+            picked += 1
+
+        self.log(f"\n✅ Batch complete! Picked {picked} of {len(targets)} object(s).")
+        return picked
+
+    async def pick_pipelined(self):
+        """Picks until the tray looks empty, finding each next piece while the arm returns with the last.
+
+        Only the first scan is on the critical path. Returns the number of objects picked.
+        """
+        self.log("\n--- Starting new pipelined detection cycle ---")
+        _, frame, blobs = await self.scan()
+        targets = self.plan(blobs)
+        if not targets:
+            return 0
+
+        # The scan shares the vision thread, so a cancelled cycle cannot leave it racing the next one.
+        lookahead = LookaheadScan(self.grabber, self.detector, self.calibration_lut, self.footprint,
+                                  self.frame_timeout, self.vision_executor, self.grasp, self.clock, self.sleep,
+                                  self.time_scale)
+        target = targets[0]
+        picked = 0
+        while target is not None and not self.should_stop():
+            cx, cy = target.pixel
+            self.log(f"\n--- Object {picked + 1} at ({cx}, {cy}) ---")
+            self.show(frame, [target])
+            await self.pick_at(target, lookahead)
+            picked += 1
+            # Usually already finished: the scan ran while the arm was returning and dropping.
+            with METRICS.span("lookahead_wait"):
+                target = await asyncio.wrap_future(lookahead.future)
+            frame = lookahead.frame
+            if lookahead.scan_delay is not None:
+                METRICS.record("lookahead_scan_delay", lookahead.scan_delay)
+
+        self.log(f"\n✅ Pipelined cycle complete! Picked {picked} object(s).")
+        return picked
+
+    async def cycle(self):
+        """Runs one cycle with the configured scheduler. Returns the number of objects picked."""
+        with METRICS.span("cycle"):
+            if self.scheduler == "pipelined":
+                return await self.pick_pipelined()
+            if self.scheduler == "batch":
+                return await self.pick_batch()
+            return await self.pick_single()
+
+    def _follow_drift(self, drift_monitor, trigger):
+        _, frame = self.grabber.latest()
+        if frame is None:
+            return None
+        move = drift_monitor.check(frame)
+        if move is not None:
+            follow_tray(move, self.detector, self.calibration_lut, trigger)
+        return move
+
+    async def check_drift(self, drift_monitor, trigger=None):
+        """Checks the newest frame for camera drift and moves everything tied to the tray if it moved.
+
+        Runs on the vision thread, between cycles, so no detection sees half
+        of the update. Returns the TrayMove, or None if the camera is still.
+        """
+        return await self.vision(self._follow_drift, drift_monitor, trigger)
@@ -0,0 +1,177 @@
+import cv2
+import numpy as np
+
+from arm_serial import expected_reply
+from batch_picking import recheck_rect, trip_time
+
+# How far around the picked piece the post-lift check looks (pixels).
+VERIFY_PADDING = 20
+# Share of the piece's outline that must still differ from the reference for the grasp
+# to count as missed. Below it, what is left is the lifted claw's shadow or a loose corner.
+VERIFY_MIN_REMAINING = 0.5
+# Half-width (pixels) of the square left out of the check around the raised claw: its
+# closed jaws as the camera sees them from above, plus a few pixels of calibration error.
+# It must stay well under the smallest piece (about 43 x 53 px), or every piece hides
+# under it and every grasp passes. The look-ahead's ARM_FOOTPRINT_RADIUS is far too big.
+CLAW_JAW_RADIUS = 12
+# A piece left behind still lies all around the spot the claw closed on. Width (pixels)
+# of the band around the jaws that is checked for it, and the share of the band the
+# remaining fabric must cover: a neighbour that was merged with the picked piece into
+# one blob only touches the band on one side.
+VERIFY_RING = 6
+VERIFY_MIN_AROUND = 0.75
+# Share of the piece that must lie outside the raised claw's jaws for the check to
+# judge the grasp at all. The claw and the piece it holds hide the rest; a piece hidden
+# more than this is trusted to be in the claw, and a miss is left to the next scan.
+VERIFY_MIN_VISIBLE = 0.2
+MAX_RETRIES = 2
+# Pixel nudges tried on successive retries, applied to where the piece now lies: a grasp
+# that missed once at a spot tends to miss there again.
+RETRY_OFFSETS = ((0, 8), (8, 0), (0, -8), (-8, 0))
+MIN_AXIS_MOVE = 0.01  # seconds; shorter corrections are skipped (commands carry 2 decimals)
+GRASP_COMMANDS = ("Z D 2.3", "C C", "Z U 3.1")
+
+
+def remaining_share(blob, candidate, rect, claw=None, min_visible=VERIFY_MIN_VISIBLE):
+    """Share of `blob`'s area that `candidate` still covers, both drawn inside `rect` (x0, y0, x1, y1).
+
+    `claw` (x0, y0, x1, y1) is left out of both: what lies under the raised
+    claw is the claw and the piece it holds. Returns 0.0 if less than
+    `min_visible` of the blob lies outside it.
+    """
+    x0, y0, x1, y1 = rect
+    before = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    after = np.zeros_like(before)
+    cv2.drawContours(before, [blob.contour - (x0, y0)], -1, 255, -1)
+    cv2.drawContours(after, [candidate.contour - (x0, y0)], -1, 255, -1)
+    area = cv2.countNonZero(before)
+    if claw is not None:
+        cx0, cy0 = max(claw[0] - x0, 0), max(claw[1] - y0, 0)
+        cx1, cy1 = max(claw[2] - x0, 0), max(claw[3] - y0, 0)
+        before[cy0:cy1, cx0:cx1] = 0
+        after[cy0:cy1, cx0:cx1] = 0
+    visible = cv2.countNonZero(before)
+    if visible == 0 or visible < min_visible * area:
+        return 0.0
+    return cv2.countNonZero(cv2.bitwise_and(before, after)) / visible
+
+
+def around_share(candidate, claw, ring=VERIFY_RING):
+    """Share of the band `ring` pixels wide around `claw` (x0, y0, x1, y1) that `candidate` covers."""
+    x0, y0, x1, y1 = claw[0] - ring, claw[1] - ring, claw[2] + ring, claw[3] + ring
+    band = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.drawContours(band, [candidate.contour - (x0, y0)], -1, 255, -1)
+    band[ring:-ring, ring:-ring] = 0
+    return cv2.countNonZero(band) / (band.size - (band.shape[0] - 2 * ring) * (band.shape[1] - 2 * ring))
+
+
+def left_behind(detector, frame, blob, claw=None, padding=VERIFY_PADDING, min_remaining=VERIFY_MIN_REMAINING,
+                min_around=VERIFY_MIN_AROUND):
+    """Checks a frame taken after lift-off for the piece that was just grasped.
+
+    Only the window around the piece is compared with the reference, minus
+    `claw`, the square around the raised claw's jaws (an ArmFootprint of
+    CLAW_JAW_RADIUS; see ArmFootprint.claw_rect). With a `claw`, fabric only
+    counts as left behind if it also surrounds the jaws (around_share).
+    Returns the blob still lying where the piece was, or None if the grasp
+    took it.
+    """
+    rect = recheck_rect(blob, padding)
+    rect = (max(rect[0], 0), max(rect[1], 0), min(rect[2], frame.shape[1]), min(rect[3], frame.shape[0]))
+    best, best_share = None, 0.0
+    for candidate in detector.detect(frame, rect):
+        if claw is not None and around_share(candidate, claw) < min_around:
+            continue
+        share = remaining_share(blob, candidate, rect, claw)
+        if share > best_share:
+            best, best_share = candidate, share
+    return best if best_share >= min_remaining else None
+
+
+def commanded(times):
+    """Motor times as commands carry them (2 decimals).
+
+    Keeping a re-grasp's positions at this resolution makes its corrections
+    add up to exactly the return move's times; otherwise every retry leaves
+    up to 0.01 s of rounding behind, and the arm creeps away from home.
+    """
+    return tuple(round(t, 2) for t in times)
+
+
+def axis_commands(motor, delta):
+    delta = round(delta, 2)
+    if abs(delta) < MIN_AXIS_MOVE:
+        return []
+    return [f"{motor} {'F' if delta > 0 else 'R'} {abs(delta):.2f}"]
+
+
+def correction_moves(from_times, to_times):
+    """Commands that move the raised claw from one motor position to another.
+
+    XY drives both axes the same way, so a correction with mixed signs is
+    sent as separate X and Y moves.
+    """
+    dx, dy = round(to_times[0] - from_times[0], 2), round(to_times[1] - from_times[1], 2)
+    if abs(dx) >= MIN_AXIS_MOVE and abs(dy) >= MIN_AXIS_MOVE and (dx > 0) == (dy > 0):
+        return [f"XY {'F' if dx > 0 else 'R'} {abs(dx):.2f} {abs(dy):.2f}"]
+    return axis_commands("X", dx) + axis_commands("Y", dy)
+
+
+def regrasp_commands(moves):
+    """Opens the empty claw, applies the correction moves and grasps again."""
+    return ["C O"] + list(moves) + list(GRASP_COMMANDS)
+
+
+def commands_time(commands):
+    return sum(expected_reply(command)[0] for command in commands)
+
+
+class PickVerifier:
+    """Decides whether and where to re-grasp after lift-off, and counts the outcome.
+
+    A missed grasp caught here costs one short correction; caught by the next
+    scan it costs the trip home and back out. The difference is counted as
+    time saved.
+    """
+
+    def __init__(self, to_motor_times, max_retries=MAX_RETRIES, offsets=RETRY_OFFSETS, grasp=None):
+        self.to_motor_times = to_motor_times
+        self.grasp = grasp  # grasp-point selector for the piece left behind; None aims at its centroid
+        self.max_retries = max_retries
+        self.offsets = offsets
+        self.picks = 0
+        self.misses = 0      # lift-offs that left the piece behind
+        self.retries = 0     # re-grasps attempted
+        self.recovered = 0   # picks that succeeded on a retry
+        self.abandoned = 0   # picks still missed after max_retries
+        self.time_saved = 0.0
+        self._correction_time = 0.0  # correction moves of the pick in progress
+
+    def retry_target(self, blob, attempt):
+        """(pixel, motor times) for re-grasp number `attempt` (0-based) of a piece that stayed put."""
+        dx, dy = self.offsets[attempt % len(self.offsets)]
+        cx, cy = blob.centroid if self.grasp is None else self.grasp(blob, self.to_motor_times)
+        pixel = (cx + dx, cy + dy)
+        return pixel, self.to_motor_times(*pixel)
+
+    def record_retry(self, attempt, moves):
+        """Counts re-grasp number `attempt` (0-based) and the correction moves it needed."""
+        if attempt == 0:
+            self.misses += 1
+        self.retries += 1
+        self._correction_time += commands_time(moves)
+
+    def record_pick(self, target, attempts, picked):
+        """Counts one finished pick of `target` that took `attempts` re-grasps."""
+        self.picks += 1
+        correction_time, self._correction_time = self._correction_time, 0.0
+        if attempts and picked:
+            self.recovered += 1
+            # Without the check the miss costs a trip home and back out before the same grasp.
+            self.time_saved += trip_time(target) - correction_time
+        elif attempts:
+            self.abandoned += 1
+
+    def summary(self):
+        return (f"{self.picks} picks verified, {self.misses} missed grasps, {self.retries} retries, "
+                f"{self.recovered} recovered, {self.abandoned} abandoned, {self.time_saved:.1f} s of arm time saved")
@@ -0,0 +1,128 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_picking import plan_batch
+
+# Half-size of the square around the claw (and the cloth hanging from it) that
+# the look-ahead scan treats as arm, in pixels.
+ARM_FOOTPRINT_RADIUS = 60
+# Resolution of the predicted return timeline, in seconds.
+TIMELINE_STEP = 0.05
+
+
+def return_position(x_time, y_time, elapsed):
+    """Motor times still separating the arm from home `elapsed` seconds into an `XY R` move.
+
+    Both axes run together from the start of the move, and each stops when
+    its own time runs out.
+    """
+    return max(x_time - elapsed, 0.0), max(y_time - elapsed, 0.0)
+
+
+class ArmFootprint:
+    """Predicts where the arm is over the tray from the commanded motion timeline.
+
+    `lut` is the CalibrationLUT over the tray; its inverse lookup turns motor
+    times back into the pixel under the claw.
+    """
+
+    def __init__(self, lut, radius=ARM_FOOTPRINT_RADIUS):
+        self.lut = lut
+        self.radius = radius
+
+    def rect(self, x_time, y_time, elapsed):
+        """(x0, y0, x1, y1) around the claw `elapsed` seconds into the return, or None once it is off the tray."""
+        pixel = self.lut.to_pixel(*return_position(x_time, y_time, elapsed))
+        if pixel is None:
+            return None
+        px, py = pixel
+        return (px - self.radius, py - self.radius, px + self.radius, py + self.radius)
+
+    def claw_rect(self, x_time, y_time):
+        """(x0, y0, x1, y1) around the claw standing at motor position (x_time, y_time), or None off the tray."""
+        return self.rect(x_time, y_time, 0.0)
+
+    def exit_time(self, x_time, y_time, step=TIMELINE_STEP):
+        """Seconds into the return after which the claw is off the tray for good.
+
+        If home itself lies over the tray, that is the end of the move.
+        """
+        duration = max(x_time, y_time)
+        # Walk back from home: the last on-tray instant bounds when the view is clear.
+        elapsed = duration
+        while elapsed > 0 and self.rect(x_time, y_time, elapsed) is None:
+            elapsed -= step
+        if elapsed >= duration:
+            return duration
+        return max(elapsed + step, 0.0)
+
+
+def overlaps(blob, rect):
+    """True if any point of a blob's contour falls inside rect (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = rect
+    points = blob.contour.reshape(-1, 2)
+    inside = (points[:, 0] >= x0) & (points[:, 0] < x1) & (points[:, 1] >= y0) & (points[:, 1] < y1)
+    return bool(inside.any())
+
+
+class LookaheadScan:
+    """Finds the next target on a worker thread while the arm carries the current piece home.
+
+    start() is called as the `XY R` return is sent. The worker waits until the
+    timeline says the claw has left the tray (or as long as it must), grabs
+    the first frame after that, drops anything overlapping where the arm is
+    predicted to be when the frame was exposed, and plans the next pick. By
+    the time `C O` is acknowledged, result() usually returns without waiting.
+
+    The scan runs on `executor` (a private single thread by default). Pass
+    the executor that does the rest of the vision work so the detector is
+    never used from two threads at once. `clock` and `sleep` must match the
+    clock the grabber stamps its frames with; `time_scale` is how many of
+    its seconds one second of arm motion takes (below 1 for a simulated arm
+    that runs its moves faster than the rig).
+    """
+
+    def __init__(self, grabber, detector, to_motor_times, footprint, frame_timeout, executor=None, grasp=None,
+                 clock=time.monotonic, sleep=time.sleep, time_scale=1.0):
+        self.grabber = grabber
+        self.detector = detector
+        self.to_motor_times = to_motor_times
+        self.grasp = grasp
+        self.footprint = footprint
+        self.frame_timeout = frame_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.time_scale = time_scale
+        self.frame = None
+        self.frame_time = None
+        self.scan_delay = None  # seconds of arm motion after the return started that the frame was exposed
+        self.future = None  # concurrent.futures.Future of the running scan
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="LookaheadScan")
+
+    def start(self, x_time, y_time, return_started):
+        self.frame = self.frame_time = self.scan_delay = None
+        self.future = self._executor.submit(self._scan, x_time, y_time, return_started)
+
+    def _scan(self, x_time, y_time, return_started):
+        clear_at = return_started + self.footprint.exit_time(x_time, y_time) * self.time_scale
+        self.sleep(max(clear_at - self.clock(), 0.0))
+        frame_time, frame = self.grabber.wait_for_frame_after(clear_at, self.frame_timeout)
+        if frame is None:
+            return None
+        self.frame, self.frame_time = frame, frame_time
+        self.scan_delay = (frame_time - return_started) / self.time_scale
+        blobs = self.detector.detect(frame)
+        arm = self.footprint.rect(x_time, y_time, self.scan_delay)
+        if arm is not None:
+            # Whatever overlaps the arm may be the arm, the piece it carries, or a
+            # piece merged with either; the next full scan sorts it out.
+            blobs = [blob for blob in blobs if not overlaps(blob, arm)]
+        targets = plan_batch(blobs, self.to_motor_times, self.grasp)
+        return targets[0] if targets else None
+
+    def result(self):
+        """Waits for the scan. Returns the next PickTarget, or None if nothing pickable was found."""
+        if self.future is None:
+            return None
+        future, self.future = self.future, None
+        return future.result()
@@ -0,0 +1,100 @@
+"""Runs the detection pipeline headless over a recording to measure throughput and catch regressions.
+
+Usage:
+    python replay_pipeline.py RECORDING_DIR [--tray "x,y x,y x,y x,y"] [--save results.json]
+    python replay_pipeline.py RECORDING_DIR --compare results.json
+
+The first frame of the recording is the empty-tray reference unless
+--reference is given. --save writes every frame's centroids. --compare
+checks a new run against a saved one and exits with status 1 if any frame's
+detections changed by more than --tolerance pixels.
+"""
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmark_detectors import parse_tray
+from detectors import DETECTORS, create_detector, whole_frame_contour
+from frame_source import iter_recording
+
+COMPARE_TOLERANCE = 2  # pixels a centroid may move before it counts as a regression
+
+
+def run_pipeline(recording, detector_name, reference=None, tray=None):
+    """Detects on every frame of a recording. Returns (per-frame centroids, per-frame latencies in ms)."""
+    frames = iter_recording(recording)
+    if reference is None:
+        _, reference = next(frames)
+    detector = create_detector(detector_name, reference, whole_frame_contour(reference.shape) if tray is None else tray)
+
+    centroids = []
+    latencies = []
+    for _, frame in frames:
+        start = time.perf_counter()
+        blobs = detector.detect(frame)
+        latencies.append((time.perf_counter() - start) * 1000)
+        centroids.append([list(blob.centroid) for blob in blobs])
+    return centroids, latencies
+
+
+def compare_runs(baseline, current, tolerance=COMPARE_TOLERANCE):
+    """Returns the indices of frames whose detections differ between two runs."""
+    changed = []
+    for index, (before, after) in enumerate(zip(baseline, current)):
+        if len(before) != len(after):
+            changed.append(index)
+            continue
+        # Both lists are largest-first, so matching blobs line up.
+        if any(np.hypot(bx - ax, by - ay) > tolerance for (bx, by), (ax, ay) in zip(before, after)):
+            changed.append(index)
+    changed.extend(range(min(len(baseline), len(current)), max(len(baseline), len(current))))
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="directory written by 'Main Python Program.py --record'")
+    parser.add_argument("--detector", default="subtraction", choices=list(DETECTORS))
+    parser.add_argument("--reference", help="empty-tray image (default: the recording's first frame)")
+    parser.add_argument("--tray", help="tray corners as 'x,y x,y x,y x,y' (default: whole frame)")
+    parser.add_argument("--save", metavar="JSON", help="write per-frame centroids to this file")
+    parser.add_argument("--compare", metavar="JSON", help="compare against centroids saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=COMPARE_TOLERANCE)
+    args = parser.parse_args()
+
+    reference = cv2.imread(args.reference) if args.reference else None
+    tray = parse_tray(args.tray) if args.tray else None
+
+    start = time.perf_counter()
+    centroids, latencies = run_pipeline(args.recording, args.detector, reference, tray)
+    elapsed = time.perf_counter() - start
+    if not latencies:
+        print(f"❌ No frames to process in '{args.recording}'.")
+        sys.exit(1)
+
+    detected = sum(1 for frame in centroids if frame)
+    print(f"Processed {len(latencies)} frames in {elapsed:.2f} s ({len(latencies) / elapsed:.1f} fps incl. decoding)")
+    print(f"Detection latency: mean {np.mean(latencies):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms")
+    print(f"Frames with detections: {detected}/{len(centroids)}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"detector": args.detector, "centroids": centroids}, f)
+        print(f"Saved results to '{args.save}'.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["centroids"]
+        changed = compare_runs(baseline, centroids, args.tolerance)
+        if changed:
+            print(f"❌ {len(changed)} frame(s) changed, first: {changed[:10]}")
+            sys.exit(1)
+        print("✅ Detections match the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import time
+
+import serial
+from serial.tools import list_ports
+
+from metrics import METRICS
+
+# First line BTS7960_Based_control.ino prints from setup(); seeing it means the sketch is running.
+READY_BANNER = "Robotic Arm Control Ready"
+BANNER_TIMEOUT = 4.0  # the Uno bootloader plus setup() takes about 2 s after the port opens
+
+# (VID, PID) of USB interfaces found on Arduino boards and clones. None matches any PID.
+ARDUINO_USB_IDS = (
+    (0x2341, None),    # Arduino SA
+    (0x2A03, None),    # Arduino.org
+    (0x1A86, 0x7523),  # WCH CH340 (most clones)
+    (0x0403, 0x6001),  # FTDI FT232R
+    (0x10C4, 0xEA60),  # Silicon Labs CP210x
+)
+
+# Delay between reconnect attempts: doubles from BACKOFF_INITIAL up to BACKOFF_MAX (seconds).
+BACKOFF_INITIAL = 0.1
+BACKOFF_MAX = 3.0
+BACKOFF_FACTOR = 2
+
+
+def backoff_delays(initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX, factor=BACKOFF_FACTOR):
+    """Endless bounded exponential backoff: 0.1, 0.2, 0.4, ... capped at `maximum`."""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def is_arduino(port_info):
+    return any(port_info.vid == vid and (pid is None or port_info.pid == pid) for vid, pid in ARDUINO_USB_IDS)
+
+
+def candidate_ports(preferred=None, discover=True, exclude=()):
+    """Ports worth trying, best first: the configured one, USB IDs of Arduino boards, then the rest.
+
+    Without `discover` only the configured port is tried. Ports in `exclude`
+    (another station's arm) are never tried.
+    """
+    ordered = [preferred] if preferred else []
+    if discover:
+        ports = list_ports.comports()
+        ordered += [p.device for p in ports if is_arduino(p)]
+        ordered += [p.device for p in ports if not is_arduino(p)]
+    return [port for port in dict.fromkeys(ordered) if port == preferred or port not in exclude]
+
+
+def wait_for_banner(ser, timeout=BANNER_TIMEOUT, banner=READY_BANNER):
+    """Reads lines until the firmware's ready banner. Returns False if it does not appear in time."""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        ser.timeout = remaining
+        line = ser.readline().decode(errors="replace")
+        if banner in line:
+            return True
+
+
+class SerialConnection:
+    """Finds the arm's Arduino and (re)opens it, recording how long each recovery took.
+
+    A port counts as ready only once the firmware's banner arrives, which
+    replaces a fixed post-reset sleep: opening the port resets the board and
+    setup() prints the banner as soon as it is listening.
+
+    Ports are opened exclusively, so a port another process holds is
+    skipped rather than shared (and its board reset). With `discover` off
+    only `port` is ever tried; `exclude` lists ports discovery must leave
+    alone, e.g. the arms of other stations on the same host.
+    """
+
+    def __init__(self, port=None, baud_rate=9600, banner_timeout=BANNER_TIMEOUT, discover=True, exclude=()):
+        self.port = port  # tried first; afterwards the last port that worked
+        self.baud_rate = baud_rate
+        self.banner_timeout = banner_timeout
+        self.discover = discover
+        self.exclude = tuple(exclude)
+        self.recoveries = []  # seconds from losing the link to the firmware being ready again
+        self._usb_listed = False
+
+    def open_ready(self, port):
+        """Opens one port and waits for the banner. Returns the open port, or None."""
+        try:
+            ser = serial.Serial(port, self.baud_rate, timeout=1, exclusive=True)
+        except (serial.SerialException, OSError):
+            return None
+        try:
+            if wait_for_banner(ser, self.banner_timeout):
+                # Drop the rest of the help text so the first reply read belongs to the first command.
+                time.sleep(0.05)
+                ser.reset_input_buffer()
+                return ser
+        except (serial.SerialException, OSError):
+            pass
+        ser.close()
+        return None
+
+    def find_and_open(self):
+        """One pass over the candidate ports. Returns a ready port, or None."""
+        for port in candidate_ports(self.port, self.discover, self.exclude):
+            ser = self.open_ready(port)
+            if ser is not None:
+                self.port = port
+                self._usb_listed = port in {p.device for p in list_ports.comports()}
+                return ser
+        return None
+
+    def connect(self, give_up_after=None):
+        """Blocks until the Arduino is ready, backing off between passes. Raises SerialException on giving up."""
+        start = time.monotonic()
+        for delay in backoff_delays():
+            ser = self.find_and_open()
+            if ser is not None:
+                return ser
+            if give_up_after is not None and time.monotonic() - start + delay > give_up_after:
+                tried = candidate_ports(self.port, self.discover, self.exclude)
+                raise serial.SerialException(f"No arm firmware found within {give_up_after:.0f} s "
+                                             f"(tried {', '.join(tried) or 'no ports'})")
+            time.sleep(delay)
+
+    def is_healthy(self, ser):
+        """Cheap check while idle: the port is open, still enumerated, and the driver answers."""
+        if ser is None or not ser.is_open:
+            return False
+        try:
+            ser.in_waiting
+        except (serial.SerialException, OSError):
+            return False
+        # Pseudo-terminals and other non-USB ports never show up in the listing.
+        return not self._usb_listed or ser.port in {p.device for p in list_ports.comports()}
+
+    def record_recovery(self, seconds):
+        self.recoveries.append(seconds)
+        if METRICS.enabled:
+            METRICS.record("serial_recovery", seconds)
+
+    def mean_time_to_recover(self):
+        return sum(self.recoveries) / len(self.recoveries) if self.recoveries else 0.0
+
+    def summary(self):
+        if not self.recoveries:
+            return "no serial drops"
+        return (f"{len(self.recoveries)} serial drop(s), mean time to recover {self.mean_time_to_recover():.2f} s, "
+                f"worst {max(self.recoveries):.2f} s")
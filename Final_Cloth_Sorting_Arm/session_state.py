@@ -0,0 +1,95 @@
+import json
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from background_model import RunningAverageBackground
+from calibration import CalibrationModel
+
+# Bump when the layout of the session file changes; older files are then ignored.
+SESSION_VERSION = 1
+SESSION_FILE = "session_state.npz"
+
+# Resume check: the live frame is compared with the saved reference at this scale...
+VALIDATE_SCALE = 0.25
+# ...and the session is only trusted if fewer than this share of tray pixels changed.
+VALIDATE_MAX_CHANGED = 0.02
+
+Session = namedtuple("Session", ["reference_image", "background", "tray_contour", "calibration",
+                                 "detector_name", "detector_params", "saved_at"])
+
+
+def save_session(path, reference_image, tray_contour, calibration, detector_name, detector_params,
+                 background=None, saved_at=0.0):
+    """Writes everything a warm start needs to one compressed .npz file, atomically."""
+    arrays = {
+        "version": np.array(SESSION_VERSION),
+        "reference_image": reference_image,
+        "tray_contour": np.asarray(tray_contour, dtype=np.int32),
+        "calibration_kind": np.array(calibration.kind),
+        "calibration_coefficients": calibration.coefficients,
+        "calibration_pixels": calibration.pixels,
+        "calibration_times": calibration.times,
+        "detector_name": np.array(detector_name),
+        "detector_params": np.array(json.dumps(detector_params)),
+        "saved_at": np.array(saved_at),
+    }
+    if background is not None:
+        arrays["background_mean"] = background.mean
+        arrays["background_learning_rate"] = np.array(background.learning_rate)
+    # np.savez adds .npz to names without it, so write to a name that already has it.
+    temp_path = f"{path}.tmp.npz"
+    np.savez_compressed(temp_path, **arrays)
+    os.replace(temp_path, path)
+
+
+def load_session(path):
+    """Reads a file written by save_session(). Raises ValueError if it is from another version."""
+    with np.load(path) as data:
+        version = int(data["version"]) if "version" in data else None
+        if version != SESSION_VERSION:
+            raise ValueError(f"session file version {version}, expected {SESSION_VERSION}")
+        calibration = CalibrationModel.restore(str(data["calibration_kind"]), data["calibration_coefficients"],
+                                               data["calibration_pixels"], data["calibration_times"])
+        background = None
+        if "background_mean" in data:
+            mean = data["background_mean"]
+            background = RunningAverageBackground(np.zeros(mean.shape, dtype=np.uint8),
+                                                  float(data["background_learning_rate"]))
+            background.mean[...] = mean
+            cv2.convertScaleAbs(background.mean, dst=background.background)
+        return Session(data["reference_image"], background, data["tray_contour"], calibration,
+                       str(data["detector_name"]), json.loads(str(data["detector_params"])),
+                       float(data["saved_at"]))
+
+
+def _small_gray(image, scale):
+    return cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def changed_fraction(frame, reference_image, tray_contour, threshold, scale=VALIDATE_SCALE):
+    """Share of tray pixels that differ from the reference by more than `threshold` gray levels."""
+    if frame.shape != reference_image.shape:
+        return 1.0
+    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [tray_contour], 255)
+    mask = cv2.resize(mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    live = _small_gray(frame, scale)
+    saved = _small_gray(reference_image, scale)
+    _, changed = cv2.threshold(cv2.absdiff(live, saved), threshold, 255, cv2.THRESH_BINARY)
+    tray_pixels = cv2.countNonZero(mask)
+    if tray_pixels == 0:
+        return 1.0
+    return cv2.countNonZero(cv2.bitwise_and(changed, mask)) / tray_pixels
+
+
+def session_matches(session, frame, threshold, max_changed=VALIDATE_MAX_CHANGED):
+    """Quick resume check: is the live tray empty and seen from where the session was saved?
+
+    Returns (matches, changed fraction). A moved camera, a changed light or
+    cloth left on the tray all fail it.
+    """
+    fraction = changed_fraction(frame, session.reference_image, session.tray_contour, threshold)
+    return fraction < max_changed, fraction
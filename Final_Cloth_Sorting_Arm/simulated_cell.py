@@ -0,0 +1,299 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from arm_serial import expected_reply
+
+# Simulated cells run the arm faster than real time so a scaling run finishes in
+# seconds; 0.05 turns a ~12 s pick into ~0.6 s and leaves the vision work unscaled.
+TIME_SCALE = 0.05
+SIMULATED_FPS = 30
+PIECES_PER_BATCH = (1, 4)  # pieces dropped on the empty tray at a time (inclusive range)
+REFILL_DELAY = 1.0         # seconds the tray stays empty before the next batch (real time)
+GRAB_TOLERANCE = 2         # pixels off the fabric the claw may close and still catch the piece
+PIECE_AXES = (14, 30)      # range of the ellipse half-axes drawn for a piece (pixels)
+# Shapes pieces are drawn in: "ellipse", or the concave "L" and "ring" whose centroid
+# can lie off the fabric (see piece_polygons).
+PIECE_SHAPES = ("ellipse",)
+MISS_RATE = 0.0            # share of grasps that close on nothing even when a piece is under the claw
+MISS_SHIFT = 4             # pixels a missed piece may be dragged in each direction
+CLAW_RADIUS = 10           # radius of the claw as the camera sees it from above (pixels)
+CLAW_LEVEL = 20            # gray level the claw is drawn in
+HELD_SHRINK = 0.5          # a lifted piece gathers under the claw: its outline drawn this much closer to it
+
+
+def piece_polygons(shape, centre, axes, angle):
+    """Outline of a piece followed by its holes, as int32 point arrays in frame pixels.
+
+    An "L" has legs twice the axes long, a "ring" is an ellipse twice the
+    axes across; both are the smaller axis times 0.6 thick.
+    """
+    if shape == "ellipse":
+        return [cv2.ellipse2Poly(centre, axes, angle, 0, 360, 10)]
+    a, b = 2 * axes[0], 2 * axes[1]
+    thickness = max(int(min(axes) * 0.6), 4)
+    if shape == "ring":
+        inner = (a - thickness, b - thickness)
+        return [cv2.ellipse2Poly(centre, (a, b), angle, 0, 360, 10),
+                cv2.ellipse2Poly(centre, inner, angle, 0, 360, 10)]
+    if shape == "L":
+        points = np.array([(0, 0), (a, 0), (a, thickness), (thickness, thickness), (thickness, b), (0, b)],
+                          dtype=np.float64) - (a / 2, b / 2)
+        theta = np.radians(angle)
+        rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        return [np.round(points @ rotation.T + centre).astype(np.int32)]
+    raise ValueError(f"Unknown piece shape '{shape}'")
+
+
+def fabric_depth(polygons, point):
+    """Signed distance (pixels) from `point` to the edge of a piece: positive on the fabric."""
+    outer, *holes = polygons
+    point = (float(point[0]), float(point[1]))
+    depth = cv2.pointPolygonTest(outer.reshape(-1, 1, 2), point, True)
+    for hole in holes:
+        depth = min(depth, -cv2.pointPolygonTest(hole.reshape(-1, 1, 2), point, True))
+    return depth
+
+
+def moving_claw(from_times, to_times, started, time_scale, at):
+    """Motor position (x_time, y_time) reached `at` into a move that began at `started`."""
+    elapsed = max(at - started, 0.0) / time_scale
+    return tuple(start + max(min(end - start, elapsed), -elapsed) for start, end in zip(from_times, to_times))
+
+
+class SimulatedCell:
+    """A tray with cloth pieces on it, shared by a SimulatedCamera and a SimulatedArm.
+
+    The camera draws the pieces over a fixed noisy backdrop; the arm removes
+    the piece whose fabric is under the claw when it closes, mapping its motor times back to
+    pixels through the station's calibration table. Once the tray is empty
+    a new batch arrives after `refill_delay` seconds.
+
+    While the claw is over the tray the camera also sees it, with the piece
+    it holds hanging from it, until it opens again. During a move set up by
+    start_move() it is drawn where the move has got to when the frame is
+    rendered.
+    """
+
+    def __init__(self, tray_contour, calibration_lut, frame_size=(480, 640), seed=0,
+                 pieces_per_batch=PIECES_PER_BATCH, refill_delay=REFILL_DELAY, miss_rate=MISS_RATE,
+                 shapes=PIECE_SHAPES):
+        self.tray_contour = np.asarray(tray_contour, dtype=np.int32)
+        self.calibration_lut = calibration_lut
+        self.pieces_per_batch = pieces_per_batch
+        self.refill_delay = refill_delay
+        self.miss_rate = miss_rate
+        self.shapes = shapes
+        self.pieces = []  # (shape, polygons from piece_polygons(), gray level)
+        self.picked = 0
+        self.missed_grabs = 0
+        self.claw_pixel = None  # where the claw is over the tray, or None while it is off it
+        self.held = None        # (polygons relative to the claw, gray level) of the piece in the claw
+        self._motion = None     # (from motor times, to motor times, start time, time scale) of the move under way
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._refill_at = None  # the first batch waits until the reference has been captured
+
+        height, width = frame_size
+        self.background = np.full((height, width, 3), 70, dtype=np.uint8)
+        self.background += self._rng.integers(0, 8, self.background.shape, dtype=np.uint8)
+        cv2.polylines(self.background, [self.tray_contour], True, (40, 40, 40), 3)
+        x, y, w, h = cv2.boundingRect(self.tray_contour)
+        self._tray_mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(self._tray_mask, [self.tray_contour], 255)
+        self._tray_rect = (x, y, w, h)
+
+    def start_feeding(self):
+        """Lets pieces arrive; until then the tray stays empty for the reference capture."""
+        with self._lock:
+            if self._refill_at is None:
+                self._refill_at = time.monotonic()
+
+    def feed(self):
+        """Drops the next batch now if the tray is empty, whatever the refill delay."""
+        with self._lock:
+            if not self.pieces:
+                self._refill()
+
+    def _random_point_on_tray(self):
+        x, y, w, h = self._tray_rect
+        while True:
+            px, py = int(self._rng.integers(x, x + w)), int(self._rng.integers(y, y + h))
+            if self._tray_mask[py, px]:
+                return px, py
+
+    def _reachable(self, polygons):
+        """True if the arm reaches every point of a piece's outline.
+
+        Past the arm's reach the calibration clamps motor times to 0, so no
+        grasp could catch a piece lying there and it would be retried forever.
+        """
+        points = np.concatenate([polygon.reshape(-1, 2) for polygon in polygons])
+        return bool((self.calibration_lut.model.predict_raw(points) >= 0).all())
+
+    def _refill(self):
+        count = int(self._rng.integers(self.pieces_per_batch[0], self.pieces_per_batch[1] + 1))
+        while count:
+            axes = tuple(int(a) for a in self._rng.integers(*PIECE_AXES, size=2))
+            shape = self.shapes[int(self._rng.integers(len(self.shapes)))]
+            polygons = piece_polygons(shape, self._random_point_on_tray(), axes, int(self._rng.integers(0, 180)))
+            if self._reachable(polygons):
+                self.pieces.append((shape, polygons, int(self._rng.integers(160, 240))))
+                count -= 1
+
+    def render(self, at=None):
+        """The camera view of the tray at time `at` (now by default)."""
+        at = time.monotonic() if at is None else at
+        with self._lock:
+            if not self.pieces and self._refill_at is not None and time.monotonic() >= self._refill_at:
+                self._refill()
+            pieces = list(self.pieces)
+            claw_pixel, held, motion = self.claw_pixel, self.held, self._motion
+        if motion is not None:
+            pixel = self.calibration_lut.to_pixel(*moving_claw(*motion, at))
+            claw_pixel = None if pixel is None else np.array(pixel, dtype=np.int32)
+        frame = self.background.copy()
+        for _, polygons, level in pieces:
+            # A hole polygon inside the outline is left undrawn.
+            cv2.fillPoly(frame, polygons, (level, level, level))
+        if claw_pixel is not None:
+            if held is not None:
+                polygons, level = held
+                cv2.fillPoly(frame, [polygon + claw_pixel for polygon in polygons], (level, level, level))
+            cv2.circle(frame, claw_pixel, CLAW_RADIUS, (CLAW_LEVEL, CLAW_LEVEL, CLAW_LEVEL), -1)
+        return frame
+
+    def move_claw(self, x_time, y_time):
+        """Places the claw at motor position (x_time, y_time) for the camera."""
+        pixel = self.calibration_lut.to_pixel(x_time, y_time)
+        with self._lock:
+            self.claw_pixel = None if pixel is None else np.array(pixel, dtype=np.int32)
+            self._motion = None
+
+    def start_move(self, from_times, to_times, started, time_scale=1.0):
+        """Sets the claw moving between two motor positions from time `started` until move_claw() places it.
+
+        Each axis runs at one motor second per `time_scale` seconds, as the
+        firmware drives them: together, each stopping when its own time runs out.
+        """
+        with self._lock:
+            self._motion = (from_times, to_times, started, time_scale)
+
+    def release(self):
+        """Opens the claw: the piece it held (if any) drops into the bin."""
+        with self._lock:
+            self.held = None
+
+    def piece_under(self, pixel):
+        """(index, depth) of the piece whose fabric is deepest under `pixel`; depth is negative off the fabric."""
+        with self._lock:
+            depths = [fabric_depth(polygons, pixel) for _, polygons, _ in self.pieces]
+        if not depths:
+            return None, float("-inf")
+        index = int(np.argmax(depths))
+        return index, depths[index]
+
+    def grab(self, x_time, y_time):
+        """Removes the piece under the claw at motor position (x_time, y_time). Returns True if one was caught."""
+        pixel = self.calibration_lut.to_pixel(x_time, y_time)
+        with self._lock:
+            if pixel is None or not self.pieces:
+                self.missed_grabs += 1
+                return False
+            depths = [fabric_depth(polygons, pixel) for _, polygons, _ in self.pieces]
+            nearest = int(np.argmax(depths))
+            if depths[nearest] < -GRAB_TOLERANCE or self._rng.random() < self.miss_rate:
+                self.missed_grabs += 1
+                if depths[nearest] >= -GRAB_TOLERANCE:
+                    # A near miss drags the piece a little.
+                    shape, polygons, level = self.pieces[nearest]
+                    shift = self._rng.integers(-MISS_SHIFT, MISS_SHIFT + 1, size=2).astype(np.int32)
+                    self.pieces[nearest] = (shape, [polygon + shift for polygon in polygons], level)
+                return False
+            _, polygons, level = self.pieces.pop(nearest)
+            self.held = ([np.round((polygon - pixel) * HELD_SHRINK).astype(np.int32) for polygon in polygons], level)
+            self.picked += 1
+            if not self.pieces:
+                self._refill_at = time.monotonic() + self.refill_delay
+            return True
+
+
+class SimulatedCamera:
+    """cv2.VideoCapture stand-in that renders a SimulatedCell at a fixed frame rate.
+
+    bump() knocks the camera: from then on the whole view is shifted, while
+    the cell (and the arm's reach) stay where they were.
+    """
+
+    def __init__(self, cell, fps=SIMULATED_FPS):
+        self.cell = cell
+        self.interval = 1 / fps
+        self.shift = (0, 0)
+        self._next_frame = time.monotonic()
+        self._opened = True
+
+    def bump(self, dx, dy):
+        """Moves the view by (dx, dy) pixels, on top of any earlier bump."""
+        self.shift = (self.shift[0] + dx, self.shift[1] + dy)
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        delay = self._next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame = max(self._next_frame + self.interval, time.monotonic())
+        frame = self.cell.render()
+        if self.shift != (0, 0):
+            shift = np.float32([[1, 0, self.shift[0]], [0, 1, self.shift[1]]])
+            frame = cv2.warpAffine(frame, shift, (frame.shape[1], frame.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+        return True, frame
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        self._opened = False
+
+
+class SimulatedArm:
+    """ArmSerial stand-in: each command takes its firmware duration times `time_scale`.
+
+    Tracks where the claw is, in motor seconds from home, so closing it picks
+    the piece underneath and the camera sees it where it is.
+    """
+
+    def __init__(self, cell, time_scale=TIME_SCALE):
+        self.cell = cell
+        self.time_scale = time_scale
+        self.ser = None
+        self.history = []
+        self._position = (0.0, 0.0)
+
+    def send(self, command):
+        expected, _ = expected_reply(command)
+        start = time.monotonic()
+        parts = command.upper().split()
+        motor, sign = parts[0], 1 if parts[1].startswith("F") else -1
+        x, y = self._position
+        if motor == "XY":
+            x, y = x + sign * float(parts[2]), y + sign * float(parts[3])
+        elif motor[0] == "X":
+            x += sign * float(parts[2])
+        elif motor[0] == "Y":
+            y += sign * float(parts[2])
+        position = (max(x, 0.0), max(y, 0.0))
+        if position != self._position:
+            self.cell.start_move(self._position, position, start, self.time_scale)
+        time.sleep(expected * self.time_scale)
+        if motor[0] == "C" and parts[1].startswith("C"):
+            self.cell.grab(*position)
+        elif motor[0] == "C":
+            self.cell.release()
+        self._position = position
+        self.cell.move_claw(*self._position)
+        elapsed = time.monotonic() - start
+        self.history.append((command, expected, elapsed))
+        return elapsed
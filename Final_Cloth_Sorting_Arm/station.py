@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from arm_serial import ArmCommandError, ArmResetError, ArmSerial, DryRunArm
+from calibration import CalibrationModel, load_calibration_set
+from controller import AsyncArm
+from cycle_trigger import MotionTrigger
+from detectors import ImageSubtractionDetector
+from frame_grabber import FrameGrabber
+from frame_source import ReplayCamera
+from grasp_point import deepest_point
+from metrics import METRICS
+from pick_cycle import PickCycle
+from pick_verification import PickVerifier
+from serial_connection import SerialConnection
+from session_state import load_session, save_session, session_matches
+from simulated_cell import TIME_SCALE, SimulatedArm, SimulatedCamera, SimulatedCell
+from station_setup import build_calibration_lut, build_detector
+from tray_locator import DRIFT_CHECK_INTERVAL, DriftMonitor
+
+STATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stations.json")
+
+# One sorting cell: a camera, the arm's serial port and everything calibrated for that pair.
+# `camera` is a capture index or a recording directory; `port` None means find the Arduino.
+# `cpu` pins the station's worker process to one core (None lets the supervisor choose).
+# `scheduler` is how each cycle orders its picks (see pick_cycle.SCHEDULERS).
+Station = namedtuple("Station", ["name", "camera", "port", "tray_contour", "calibration_set", "detector",
+                                 "detector_params", "baud_rate", "cpu", "simulate", "dry_run", "scheduler"],
+                     defaults=("pipelined",))
+STATION_DEFAULTS = {"port": None, "calibration_set": None, "detector": "subtraction", "detector_params": {},
+                    "baud_rate": 9600, "cpu": None, "simulate": False, "dry_run": False, "scheduler": "pipelined"}
+
+FRAME_TIMEOUT = 2            # seconds to wait for a fresh frame from a station's grabber
+CONNECT_TIMEOUT = 30         # seconds a station looks for its arm before its worker fails
+HEARTBEAT_INTERVAL = 1.0     # seconds between a worker's liveness reports
+TRIGGER_WAIT_TIMEOUT = 0.5   # longest a worker waits for the trigger before checking for a stop
+IDLE_DELAY = 1.0             # pause after a scan that found nothing, for detectors without a trigger
+VERIFY_PICKS = True          # check each grasp after lift-off and re-grasp a piece left behind
+GRASP_AT_DEEPEST_POINT = True  # grasp each piece where it is deepest inside its fabric, not at its centroid
+DRIFT_MONITORING = True      # between cycles, check whether the camera moved and follow the tray if it did
+
+
+def station_from_dict(entry):
+    """Builds a Station from one entry of stations.json, filling in the optional fields."""
+    fields = dict(STATION_DEFAULTS, **entry)
+    fields["tray_contour"] = np.array(fields.pop("tray"), dtype="int32")
+    unknown = set(fields) - set(Station._fields)
+    if unknown:
+        raise ValueError(f"Unknown station field(s) {', '.join(sorted(unknown))} in '{entry.get('name')}'")
+    return Station(**fields)
+
+
+def load_stations(path=STATIONS_FILE):
+    """Reads every station of a stations.json file. Names must be unique."""
+    with open(path) as f:
+        data = json.load(f)
+    stations = [station_from_dict(entry) for entry in data["stations"]]
+    names = [station.name for station in stations]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate station names in '{path}': {', '.join(names)}")
+    return stations
+
+
+def session_path(station):
+    return f"session_{station.name}.npz"
+
+
+def pin_to_cpu(cpu):
+    """Restricts the calling process to one core. Returns False where the OS offers no way to."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+        return True
+    try:
+        import psutil  # Windows and macOS have no os.sched_setaffinity
+    except ImportError:
+        return False
+    psutil.Process().cpu_affinity([cpu])
+    return True
+
+
+class StationWorker:
+    """Runs one station headless: camera, detector and arm, picking whenever the tray has cloth.
+
+    Runs inside a worker process started by StationSupervisor and reports to
+    it through a queue of (kind, station name, time, payload) tuples:
+    "ready", "heartbeat", "cycle", "drift", "error" and "halted". There is no console, so the
+    reference image comes from the station's saved session if the tray still
+    matches it, or else from the first frame: a station must start empty.
+    Each cycle runs through PickCycle, the console program's own scan, pick,
+    grasp check and scheduler, on an event loop with the arm behind an
+    AsyncArm, so a dropped link is reconnected the same way too.
+
+    The arm is opened on the station's own port only. A station without one
+    looks for an Arduino once, skipping `claimed_ports` (the other stations'
+    arms), and then stays on the board it found: on another station's port
+    it would reset that arm mid-move.
+    """
+
+    def __init__(self, station, reports, stop_event, claimed_ports=()):
+        self.station = station
+        self.claimed_ports = tuple(claimed_ports)
+        self.reports = reports
+        self.stop_event = stop_event
+        self.cell = None
+        self.connection = None
+        self.camera = None
+        self.grabber = None
+        self.arm = None
+        self.detector = None
+        self.trigger = None
+        self.verifier = None
+        self.picker = None
+        self.drift_monitor = None
+        self.vision_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+        self.grasp = deepest_point if GRASP_AT_DEEPEST_POINT else None
+        self._last_heartbeat = 0.0
+        self._last_drift_check = 0.0
+
+    def report(self, kind, payload=None):
+        self.reports.put((kind, self.station.name, time.time(), payload))
+
+    def heartbeat(self, force=False):
+        now = time.monotonic()
+        if force or now - self._last_heartbeat >= HEARTBEAT_INTERVAL:
+            self._last_heartbeat = now
+            self.report("heartbeat")
+
+    def _open_camera(self):
+        camera = self.station.camera
+        if self.station.simulate:
+            return SimulatedCamera(self.cell)
+        if isinstance(camera, str):
+            return ReplayCamera(camera, loop=True)
+        return cv2.VideoCapture(camera)
+
+    def _open_arm(self):
+        if self.station.simulate:
+            return SimulatedArm(self.cell)
+        if self.station.dry_run:
+            return DryRunArm()
+        self.connection = SerialConnection(self.station.port, self.station.baud_rate,
+                                           discover=self.station.port is None, exclude=self.claimed_ports)
+        arm = ArmSerial(self.connection.connect(CONNECT_TIMEOUT))
+        self.connection.discover = False  # reconnects stay on this board
+        return arm
+
+    def setup(self):
+        station = self.station
+        name, kind, pixels, times = load_calibration_set(station.calibration_set)
+        calibration = CalibrationModel(kind).fit(pixels, times)
+        self.calibration_lut = build_calibration_lut(calibration, station.tray_contour)
+        if station.simulate:
+            # The cell's own table: it is where the arm really goes, and does not follow the camera.
+            self.cell = SimulatedCell(station.tray_contour, build_calibration_lut(calibration, station.tray_contour),
+                                      seed=zlib.crc32(station.name.encode()))
+
+        self.arm = AsyncArm(self._open_arm(), self.connection)
+        self.camera = self._open_camera()
+        if not self.camera.isOpened():
+            raise RuntimeError(f"Could not open camera {station.camera!r}")
+        self.grabber = FrameGrabber(self.camera).start()
+        _, frame = self.grabber.wait_for_frame_after(time.monotonic(), FRAME_TIMEOUT)
+        if frame is None:
+            raise RuntimeError(f"No frame from camera {station.camera!r}")
+
+        session = None
+        if not station.simulate and os.path.exists(session_path(station)):
+            try:
+                session = load_session(session_path(station))
+            except (OSError, ValueError, KeyError):
+                session = None
+        threshold = station.detector_params.get("threshold", 50)
+        if session is not None and session_matches(session, frame, threshold)[0]:
+            reference_image = session.reference_image
+        else:
+            session = None
+            reference_image = frame
+        self.detector = build_detector(station.detector, reference_image, station.tray_contour,
+                                       station.detector_params)
+        if session is not None and session.background is not None and isinstance(self.detector,
+                                                                                   ImageSubtractionDetector):
+            self.detector.set_background(session.background)
+        if not station.simulate:
+            save_session(session_path(station), reference_image, station.tray_contour, calibration,
+                         station.detector, station.detector_params, getattr(self.detector, "background", None),
+                         time.time())
+        if isinstance(self.detector, ImageSubtractionDetector):
+            self.trigger = MotionTrigger(self.grabber, self.detector)
+        if VERIFY_PICKS:
+            self.verifier = PickVerifier(self.calibration_lut, grasp=self.grasp)
+        self.picker = PickCycle(self.arm, self.grabber, self.detector, self.calibration_lut, self.vision_executor,
+                                station.scheduler, self.verifier, self.grasp, FRAME_TIMEOUT,
+                                on_command=self.heartbeat, should_stop=self.stop_event.is_set,
+                                time_scale=TIME_SCALE if station.simulate else 1.0)
+        if DRIFT_MONITORING:
+            self.drift_monitor = DriftMonitor(reference_image, station.tray_contour)
+            self._last_drift_check = time.monotonic()
+        if self.cell is not None:
+            self.cell.start_feeding()
+        self.report("ready", {"calibration": name, "detector": type(self.detector).__name__,
+                              "port": self.connection.port if self.connection else None})
+
+    def verification(self):
+        if self.verifier is None:
+            return None
+        return {"misses": self.verifier.misses, "retries": self.verifier.retries,
+                "abandoned": self.verifier.abandoned, "time_saved": self.verifier.time_saved}
+
+    async def check_drift(self):
+        """Follows the tray if the camera moved since the last check; reports the move."""
+        if self.drift_monitor is None or time.monotonic() - self._last_drift_check < DRIFT_CHECK_INTERVAL:
+            return
+        self._last_drift_check = time.monotonic()
+        move = await self.picker.check_drift(self.drift_monitor, self.trigger)
+        if move is not None:
+            self.report("drift", {"shift": move.shift, "response": move.response,
+                                  "tray": move.tray_contour.tolist()})
+
+    def run(self):
+        self.setup()
+        asyncio.run(self._run())
+
+    async def _run(self):
+        while not self.stop_event.is_set():
+            self.heartbeat()
+            await self.check_drift()
+            if self.trigger is not None and not await self.picker.vision(self.trigger.wait, TRIGGER_WAIT_TIMEOUT):
+                continue
+            start = time.monotonic()
+            try:
+                picked = await self.picker.cycle()
+            except ArmCommandError as e:
+                self.report("error", str(e))
+                continue
+            except ArmResetError as e:
+                # The arm is somewhere unknown: stop here, and keep the supervisor from restarting us.
+                self.report("halted", str(e))
+                return
+            if self.picker.frame_missed:
+                raise RuntimeError(f"Camera {self.station.camera!r} stopped delivering frames")
+            if picked:
+                if self.trigger is not None:
+                    self.trigger.record_cycle(picked)
+                self.report("cycle", {"picks": picked, "seconds": time.monotonic() - start,
+                                      "stages": METRICS.summary(), "verification": self.verification()})
+            elif self.trigger is not None:
+                self.trigger.disarm()
+            else:
+                await asyncio.to_thread(self.stop_event.wait, IDLE_DELAY)
+
+    def close(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+        self.vision_executor.shutdown(wait=True)
+        if self.camera is not None:
+            self.camera.release()
+        if self.arm is not None:
+            if self.arm.ser is not None and self.arm.ser.is_open:
+                self.arm.ser.close()
+            self.arm.close()
+
+
+def run_station(station, reports, stop_event, cpu=None, claimed_ports=()):
+    """Worker process entry point. Any exception ends the process with an "error" report."""
+    worker = StationWorker(station, reports, stop_event, claimed_ports)
+    try:
+        pinned = pin_to_cpu(cpu) if cpu is not None else False
+        # One OpenCV thread per station: N stations already keep N cores busy.
+        cv2.setNumThreads(1)
+        METRICS.enabled = True
+        worker.report("started", {"pid": os.getpid(), "cpu": cpu if pinned else None})
+        worker.run()
+    except KeyboardInterrupt:
+        pass  # the supervisor handles Ctrl+C and stops every worker itself
+    except BaseException as e:
+        worker.report("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+        raise SystemExit(1)
+    finally:
+        worker.close()
+        worker.report("stopped", {"picks": worker.cell.picked if worker.cell else None})
+
@@ -0,0 +1,21 @@
+import cv2
+
+from calibration import CalibrationLUT
+from detectors import ImageSubtractionDetector, create_detector
+from perspective import PerspectiveFlattener
+
+
+def build_calibration_lut(model, tray_contour):
+    """Bakes the calibration into a per-pixel table over the tray so each pick is a lookup."""
+    tray_x, tray_y, tray_w, tray_h = cv2.boundingRect(tray_contour)
+    return CalibrationLUT(model, (tray_x, tray_y, tray_x + tray_w, tray_y + tray_h))
+
+
+def build_detector(name, reference_image, tray_contour, params):
+    """Builds the tray mask, crop and grayscale reference once for the whole session."""
+    if name == "subtraction":
+        params = dict(params)
+        flatten_scale = params.pop("flatten_scale", None)
+        flattener = PerspectiveFlattener(tray_contour, flatten_scale) if flatten_scale else None
+        return ImageSubtractionDetector(reference_image, tray_contour, flattener=flattener, **params)
+    return create_detector(name, reference_image, tray_contour, **params)
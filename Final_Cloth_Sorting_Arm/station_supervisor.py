@@ -0,0 +1,305 @@
+"""Runs several sorting stations from one host, one worker process per station.
+
+Usage:
+    python station_supervisor.py [stations.json] [--duration SECONDS]
+    python station_supervisor.py --simulate 1 2 4 8 [--duration 20]
+
+Each station (camera, serial port, tray, calibration set and detector, see
+stations.json) runs headless in its own process, pinned to its own core. A
+station that crashes or stops reporting is restarted with backoff while the
+others keep sorting; one that keeps failing is given up on. The supervisor
+prints aggregated throughput and health every few seconds.
+
+--simulate replaces cameras and arms with simulated cells and runs the same
+supervisor with 1, 2, 4, ... stations in turn, reporting how total
+throughput scales with the station count.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from serial_connection import backoff_delays
+from station import STATIONS_FILE, Station, load_stations, run_station
+
+HEARTBEAT_TIMEOUT = 30   # seconds without a report before a worker counts as hung and is restarted
+MAX_RESTARTS = 5         # consecutive failures before a station is given up on
+STABLE_RUN = 60          # seconds a worker must run before its failure count resets
+STOP_TIMEOUT = 10        # seconds a worker gets to finish its move and exit before it is killed
+REPORT_INTERVAL = 5      # seconds between printed summaries
+RESTART_BACKOFF = (1.0, 30.0)  # first and longest delay before restarting a failed station (seconds)
+
+# Simulated scaling runs use the final rig's tray and calibration.
+SIMULATED_TRAY = [[374, 122], [238, 133], [267, 428], [426, 394]]
+
+
+def available_cpus():
+    """Cores this process may run on, in order."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class StationHealth:
+    """What the supervisor knows about one station, built from its worker's reports."""
+
+    def __init__(self, station, cpu):
+        self.station = station
+        self.cpu = cpu
+        self.process = None
+        self.state = "starting"
+        self.pid = None
+        self.pinned = False
+        self.started_at = None
+        self.last_report = None
+        self.restarts = 0
+        self.failures = 0
+        self.next_restart = None
+        self.last_error = None
+        self.picks = 0
+        self.cycles = 0
+        self.cycle_seconds = []
+        self.stages = {}
+        self.verification = None  # pick-verification counts of the worker's current run
+        self._backoff = None
+
+    def restart_delay(self):
+        if self._backoff is None:
+            self._backoff = backoff_delays(*RESTART_BACKOFF)
+        return next(self._backoff)
+
+    def reset_backoff(self):
+        self._backoff = None
+        self.failures = 0
+
+
+class StationSupervisor:
+    """Starts one worker process per station and keeps them running.
+
+    Workers are isolated: a camera that disappears, an arm that will not
+    reconnect or a crash in one station restarts only that station. Every
+    worker reports picks, cycle times and its stage timings to the parent,
+    which aggregates them into one throughput and health view.
+    """
+
+    def __init__(self, stations, cpus=None, max_restarts=MAX_RESTARTS):
+        self.max_restarts = max_restarts
+        self._context = multiprocessing.get_context("spawn")  # the same on Windows, Linux and macOS
+        self.reports = self._context.Queue()
+        self.stop_event = self._context.Event()
+        self.started_at = None
+        cpus = list(cpus) if cpus is not None else available_cpus()
+        self.health = {}
+        for index, station in enumerate(stations):
+            cpu = station.cpu if station.cpu is not None else cpus[index % len(cpus)]
+            self.health[station.name] = StationHealth(station, cpu)
+
+    def claimed_ports(self, health):
+        """Serial ports of the other stations, which this station's port discovery must leave alone."""
+        return tuple(other.station.port for other in self.health.values()
+                     if other is not health and other.station.port)
+
+    def _spawn(self, health):
+        health.process = self._context.Process(target=run_station, name=f"station-{health.station.name}",
+                                               args=(health.station, self.reports, self.stop_event, health.cpu,
+                                                     self.claimed_ports(health)))
+        health.process.start()
+        health.state = "starting"
+        health.started_at = health.last_report = time.monotonic()
+        health.next_restart = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for health in self.health.values():
+            self._spawn(health)
+        return self
+
+    def _handle(self, kind, name, payload):
+        health = self.health[name]
+        health.last_report = time.monotonic()
+        if kind == "started":
+            health.pid = payload["pid"]
+            health.pinned = payload["cpu"] is not None
+        elif kind == "ready":
+            health.state = "running"
+            print(f"✅ Station '{name}' ready ({payload['detector']}, calibration '{payload['calibration']}'"
+                  + (f", arm on {payload['port']}" if payload["port"] else "") + ").")
+        elif kind == "cycle":
+            health.picks += payload["picks"]
+            health.cycles += 1
+            health.cycle_seconds.append(payload["seconds"])
+            health.stages = payload["stages"]
+            health.verification = payload["verification"]
+        elif kind == "drift":
+            dx, dy = payload["shift"]
+            print(f"📷 Station '{name}': camera moved ({dx:+.1f}, {dy:+.1f}) px since setup; following the tray.")
+        elif kind == "error":
+            health.last_error = payload
+            print(f"⚠️ Station '{name}': {payload.splitlines()[0]}")
+        elif kind == "halted":
+            health.state = "halted"
+            health.last_error = payload
+            print(f"🛑 Station '{name}' halted and will not be restarted: {payload}")
+
+    def drain(self, timeout=0.0):
+        """Processes every queued worker report, waiting up to `timeout` seconds for the first."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                kind, name, _, payload = self.reports.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return
+            self._handle(kind, name, payload)
+            deadline = 0
+
+    def check(self):
+        """Restarts workers that died or stopped reporting. Call regularly."""
+        now = time.monotonic()
+        for name, health in self.health.items():
+            if health.state in ("failed", "halted") or self.stop_event.is_set():
+                continue
+            process = health.process
+            if health.next_restart is not None:
+                if now >= health.next_restart:
+                    health.restarts += 1
+                    print(f"🔁 Restarting station '{name}' (restart {health.restarts}).")
+                    self._spawn(health)
+                continue
+            if process.is_alive():
+                if now - health.last_report <= HEARTBEAT_TIMEOUT:
+                    continue
+                print(f"⚠️ Station '{name}' sent nothing for {HEARTBEAT_TIMEOUT} s. Killing it.")
+                process.kill()
+                process.join()
+            if now - health.started_at >= STABLE_RUN:
+                health.reset_backoff()
+            health.failures += 1
+            if health.failures > self.max_restarts:
+                health.state = "failed"
+                print(f"❌ Station '{name}' failed {health.failures} times in a row. Giving up on it.")
+                continue
+            delay = health.restart_delay()
+            health.state = f"down (exit {process.exitcode})"
+            health.next_restart = now + delay
+            print(f"⚠️ Station '{name}' stopped (exit code {process.exitcode}). Restarting in {delay:.1f} s.")
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Asks every worker to finish its current move and exit; kills any that do not."""
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for health in self.health.values():
+            if health.process is None:
+                continue
+            health.process.join(max(deadline - time.monotonic(), 0))
+            if health.process.is_alive():
+                print(f"⚠️ Station '{health.station.name}' did not stop in time. Killing it.")
+                health.process.kill()
+                health.process.join()
+            if health.state not in ("failed", "halted"):
+                health.state = "stopped"
+        self.drain()
+
+    def run(self, duration=None, report_interval=REPORT_INTERVAL):
+        """Supervises until `duration` seconds have passed (or forever), printing a summary periodically."""
+        self.start()
+        next_report = time.monotonic() + report_interval
+        try:
+            while duration is None or time.monotonic() - self.started_at < duration:
+                self.drain(timeout=0.2)
+                self.check()
+                if time.monotonic() >= next_report:
+                    print(self.summary_text())
+                    next_report += report_interval
+        except KeyboardInterrupt:
+            print("\nStopping all stations...")
+        finally:
+            self.stop()
+
+    def summary(self):
+        """{station name: {state, picks, picks_per_min, mean_cycle_s, restarts, report_age_s, cpu, detect_p50_ms,
+        verification}}."""
+        elapsed = time.monotonic() - self.started_at
+        now = time.monotonic()
+        result = {}
+        for name, health in self.health.items():
+            detect = health.stages.get("detect", {})
+            result[name] = {
+                "state": health.state, "picks": health.picks,
+                "picks_per_min": health.picks * 60 / elapsed if elapsed > 0 else 0.0,
+                "mean_cycle_s": float(np.mean(health.cycle_seconds)) if health.cycle_seconds else None,
+                "restarts": health.restarts,
+                "report_age_s": now - health.last_report if health.last_report else None,
+                "cpu": health.cpu if health.pinned else None,
+                "detect_p50_ms": detect.get("p50_ms"),
+                "verification": health.verification,
+            }
+        return result
+
+    def total_picks_per_minute(self):
+        return sum(station["picks_per_min"] for station in self.summary().values())
+
+    def summary_text(self):
+        lines = [f"--- {len(self.health)} station(s), {time.monotonic() - self.started_at:.0f} s, "
+                 f"{self.total_picks_per_minute():.1f} picks/min in total ---"]
+        for name, station in self.summary().items():
+            cycle = f"{station['mean_cycle_s']:.1f} s/cycle" if station["mean_cycle_s"] is not None else "no cycles"
+            detect = f", detect p50 {station['detect_p50_ms']:.1f} ms" if station["detect_p50_ms"] is not None else ""
+            core = f"cpu {station['cpu']}" if station["cpu"] is not None else "unpinned"
+            verification = station["verification"]
+            retries = (f", {verification['misses']} missed grasps/{verification['retries']} retries "
+                       f"({verification['time_saved']:.0f} s saved)" if verification else "")
+            lines.append(f"  {name}: {station['state']}, {station['picks']} picks "
+                         f"({station['picks_per_min']:.1f}/min), {cycle}{detect}{retries}, "
+                         f"{station['restarts']} restart(s), {core}")
+        return "\n".join(lines)
+
+
+def simulated_stations(count):
+    return [Station(f"sim{index}", None, None, np.array(SIMULATED_TRAY, dtype="int32"), None, "subtraction",
+                    {"threshold": 50, "min_area": 225, "dilation_iterations": 5}, 9600, None, True, False)
+            for index in range(count)]
+
+
+def run_scaling(counts, duration):
+    """Runs the supervisor with each number of simulated stations and prints how throughput scales."""
+    rows = []
+    for count in counts:
+        print(f"\n=== {count} simulated station(s) for {duration:.0f} s ===")
+        supervisor = StationSupervisor(simulated_stations(count))
+        supervisor.run(duration, report_interval=duration / 2)
+        summary = supervisor.summary()
+        total = sum(station["picks_per_min"] for station in summary.values())
+        detect = [station["detect_p50_ms"] for station in summary.values() if station["detect_p50_ms"] is not None]
+        rows.append((count, total, float(np.mean(detect)) if detect else float("nan"),
+                     sum(station["restarts"] for station in summary.values())))
+
+    print(f"\n{'stations':>8} {'picks/min':>10} {'per station':>12} {'efficiency':>11} "
+          f"{'detect p50 ms':>14} {'restarts':>9}")
+    single = rows[0][1] / rows[0][0] if rows and rows[0][1] else None
+    for count, total, detect_ms, restarts in rows:
+        efficiency = f"{total / (count * single):.0%}" if single else "n/a"
+        print(f"{count:>8} {total:>10.1f} {total / count:>12.1f} {efficiency:>11} {detect_ms:>14.2f} {restarts:>9}")
+    print(f"Cores available: {len(available_cpus())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stations", nargs="?", default=STATIONS_FILE, help="stations file (default: stations.json)")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds (default: run until Ctrl+C)")
+    parser.add_argument("--simulate", type=int, nargs="+", metavar="N",
+                        help="scaling run with N simulated stations for each N given")
+    args = parser.parse_args()
+
+    if args.simulate:
+        run_scaling(args.simulate, args.duration or 20)
+        return
+    supervisor = StationSupervisor(load_stations(args.stations))
+    supervisor.run(args.duration)
+    print(supervisor.summary_text())
+
+
+if __name__ == "__main__":
+    main()
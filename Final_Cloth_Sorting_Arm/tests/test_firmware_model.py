@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+import firmware_model
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="the model is served on a pseudo-terminal")
+
+
+@pytest.mark.parametrize("scheduler", firmware_model.BENCH_SCHEDULERS)
+def test_bench_runs_in_simulated_time(scheduler):
+    [(name, real, arduino, cell, verifier)] = firmware_model.bench(20, (scheduler,))
+    assert name == scheduler and cell.picked >= 20
+    # About ten seconds of rig time a pick, in milliseconds of real time.
+    assert arduino.clock.now > 100 * real
+    x, y, _ = arduino.model.position()
+    assert (x, y) == pytest.approx((0.0, 0.0), abs=0.01)
@@ -0,0 +1,63 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from detectors import THRESHOLD_VALUE
+from frame_source import FrameRecorder, ReplayCamera, iter_recording
+
+
+def camera_frames(count):
+    """VGA frames with smooth structure and sensor noise, like a real camera's."""
+    rng = np.random.default_rng(0)
+    scene = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (31, 31), 0)
+    return [np.clip(scene + rng.normal(0, 4, scene.shape), 0, 255).astype(np.uint8) for _ in range(count)]
+
+
+def record(path, frames, **options):
+    recorder = FrameRecorder(str(path), **options)
+    for index, frame in enumerate(frames):
+        recorder.write(frame, timestamp=index / 30)
+    recorder.close()
+    return recorder
+
+
+def test_jpeg_chunks_are_compact(tmp_path):
+    frames = camera_frames(20)
+    record(tmp_path, frames, chunk_size=10)
+    chunks = sorted(glob.glob(os.path.join(tmp_path, "chunk_*.npz")))
+    assert len(chunks) == 2
+    raw = 10 * frames[0].nbytes
+    for chunk in chunks:
+        assert os.path.getsize(chunk) < 0.2 * raw
+
+
+def test_jpeg_replay_round_trip(tmp_path):
+    frames = camera_frames(12)
+    record(tmp_path, frames, chunk_size=5)
+    replayed = list(iter_recording(str(tmp_path)))
+    assert [timestamp for timestamp, _ in replayed] == pytest.approx([index / 30 for index in range(12)])
+    for (_, frame), original in zip(replayed, frames):
+        assert frame.shape == original.shape and frame.dtype == np.uint8
+        # JPEG smooths the sensor noise; no pixel comes anywhere near looking like cloth.
+        gray_diff = cv2.absdiff(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.cvtColor(original, cv2.COLOR_BGR2GRAY))
+        assert gray_diff.max() < THRESHOLD_VALUE / 2
+
+
+def test_png_replay_is_lossless(tmp_path):
+    frames = camera_frames(6)
+    record(tmp_path, frames, chunk_size=4, image_format=".png")
+    camera = ReplayCamera(str(tmp_path), realtime=False)
+    for original in frames:
+        ok, frame = camera.read()
+        assert ok and np.array_equal(frame, original)
+    assert camera.read() == (False, None)
+
+
+def test_raw_chunks_still_replay(tmp_path):
+    frames = camera_frames(3)
+    np.savez(os.path.join(tmp_path, "chunk_00000.npz"), frames=np.stack(frames), timestamps=np.arange(3.0))
+    replayed = [frame for _, frame in iter_recording(str(tmp_path))]
+    assert all(np.array_equal(a, b) for a, b in zip(replayed, frames))
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import pytest
+
+from detectors import ImageSubtractionDetector
+from firmware_model import FirmwareModel
+from pick_verification import CLAW_JAW_RADIUS, MAX_RETRIES, commanded, correction_moves, left_behind
+
+TRAY = np.array([(100, 80), (540, 80), (540, 400), (100, 400)], dtype=np.int32)
+CENTRE = (320, 240)
+CLAW_LEVEL = 20
+
+
+def backdrop():
+    rng = np.random.default_rng(0)
+    return (70 + rng.integers(0, 8, (480, 640, 3))).astype(np.uint8)
+
+
+def draw_piece(frame, axes, centre=CENTRE):
+    cv2.ellipse(frame, centre, axes, 30, 0, 360, (200, 200, 200), -1)
+
+
+def draw_claw(frame, centre=CENTRE):
+    cv2.circle(frame, centre, CLAW_JAW_RADIUS - 2, (CLAW_LEVEL,) * 3, -1)
+
+
+def claw_rect(centre=CENTRE):
+    return (centre[0] - CLAW_JAW_RADIUS, centre[1] - CLAW_JAW_RADIUS,
+            centre[0] + CLAW_JAW_RADIUS, centre[1] + CLAW_JAW_RADIUS)
+
+
+def picked_blob(detector, axes):
+    frame = backdrop()
+    draw_piece(frame, axes)
+    blobs = detector.detect(frame)
+    assert len(blobs) == 1
+    return blobs[0]
+
+
+# Half-axes of the rig's pieces, 67 x 69 and 43 x 53 px across: both far smaller
+# than the look-ahead's 120 px footprint.
+PIECES = [(33, 34), (21, 26)]
+
+
+@pytest.mark.parametrize("axes", PIECES)
+def test_piece_that_stays_put_is_a_miss(axes):
+    detector = ImageSubtractionDetector(backdrop(), TRAY)
+    blob = picked_blob(detector, axes)
+    after = backdrop()
+    draw_piece(after, axes)
+    draw_claw(after)
+    assert left_behind(detector, after, blob, claw_rect()) is not None
+
+
+@pytest.mark.parametrize("axes", PIECES)
+def test_piece_in_the_claw_is_a_pick(axes):
+    detector = ImageSubtractionDetector(backdrop(), TRAY)
+    blob = picked_blob(detector, axes)
+    after = backdrop()
+    # The lifted piece gathers under the jaws.
+    draw_piece(after, (axes[0] // 3, axes[1] // 3))
+    draw_claw(after)
+    assert left_behind(detector, after, blob, claw_rect()) is None
+
+
+def test_neighbour_merged_into_the_blob_is_not_a_miss():
+    detector = ImageSubtractionDetector(backdrop(), TRAY)
+    neighbour = (CENTRE[0] + 48, CENTRE[1])
+    frame = backdrop()
+    draw_piece(frame, (21, 26))
+    draw_piece(frame, (26, 26), neighbour)
+    blobs = detector.detect(frame)
+    assert len(blobs) == 1
+    after = backdrop()
+    draw_piece(after, (26, 26), neighbour)
+    draw_piece(after, (7, 8))
+    draw_claw(after)
+    assert left_behind(detector, after, blobs[0], claw_rect()) is None
+
+
+def test_regrasp_corrections_and_return_bring_the_arm_home():
+    rng = np.random.default_rng(0)
+    model = FirmwareModel()
+    for _ in range(200):
+        position = commanded(rng.uniform(0.2, 3.0, 2))
+        model.handle(f"XY F {position[0]:.2f} {position[1]:.2f}", lambda line: None)
+        for _ in range(MAX_RETRIES):
+            retry = commanded(np.add(position, rng.uniform(-0.1, 0.1, 2)))
+            for command in correction_moves(position, retry):
+                model.handle(command, lambda line: None)
+            position = retry
+        model.handle(f"XY R {position[0]:.2f} {position[1]:.2f}", lambda line: None)
+    # Without commanded(), the rounding of each retry adds up: 0.02 s and 0.06 s off home here.
+    x, y, _ = model.position()
+    assert (x, y) == pytest.approx((0.0, 0.0), abs=0.005)
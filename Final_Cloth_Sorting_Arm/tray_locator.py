@@ -0,0 +1,211 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from detectors import GREEN_HI, GREEN_LO, open_close
+from perspective import order_points
+
+# Tray localization: the tray is the largest convex quadrilateral among the edge
+# (or backdrop-colour) outlines that covers at least this share of the frame.
+MIN_TRAY_SHARE = 0.05
+TRAY_EDGE_BLUR = 5
+# Lower than the cloth detector's Canny thresholds: a tray rim can be faint after the blur,
+# and the quad fit discards the clutter weaker edges let in.
+TRAY_CANNY_LOW = 20
+TRAY_CANNY_HIGH = 60
+# approxPolyDP tolerances tried in turn, as shares of the outline's perimeter.
+QUAD_EPSILONS = (0.02, 0.04, 0.06)
+# Farthest (pixels) any corner of a quad found near expected corners may be from them. A
+# piece lying across the rim bends the fit by more; the tray then moves by the shift alone.
+MAX_CORNER_ERROR = 8
+
+# Drift monitoring: phase correlation of a downscaled grayscale frame with the one
+# captured at setup. The tray itself (plus a margin) is left out, so cloth coming and
+# going does not move the estimate; only the rig and floor around it do.
+DRIFT_SCALE = 0.25
+DRIFT_TRAY_MARGIN = 40     # pixels around the tray also left out of the comparison (softened over as many)
+DRIFT_MIN_SHIFT = 2.0      # pixels the view must move before the tray is followed
+DRIFT_MIN_RESPONSE = 0.05  # phase-correlation peak below which an estimate is not trusted
+# Gray levels are clipped to this many standard deviations of the reference's, so a bright
+# piece hanging off the tray (or the arm passing) weighs no more than the floor's texture.
+DRIFT_CLIP_SIGMA = 2.5
+DRIFT_CHECK_INTERVAL = 5.0  # seconds between checks in production
+
+# Where the tray appears after the camera moved: its corners (top-left, top-right,
+# bottom-right, bottom-left), the homography from the new view to the previous one
+# and to the view at setup (the one the calibration was measured in), and the
+# measured (dx, dy) shift and phase-correlation response.
+TrayMove = namedtuple("TrayMove", ["tray_contour", "to_previous", "to_calibrated", "shift", "response"])
+
+
+def fit_quad(contour, min_area):
+    """Ordered corners (float32, see order_points) of a contour that is a convex quadrilateral, or None."""
+    hull = cv2.convexHull(contour)
+    if cv2.contourArea(hull) < min_area:
+        return None
+    perimeter = cv2.arcLength(hull, True)
+    for epsilon in QUAD_EPSILONS:
+        approx = cv2.approxPolyDP(hull, epsilon * perimeter, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return order_points(approx)
+    return None
+
+
+def tray_outlines(frame, method="edges", green_lo=GREEN_LO, green_hi=GREEN_HI):
+    """Candidate tray outlines in a BGR frame, largest first.
+
+    "edges" closes the Canny edges of the blurred frame into regions; "color"
+    takes the regions of the backdrop colour (green by default).
+    """
+    if method == "edges":
+        gray = cv2.GaussianBlur(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (TRAY_EDGE_BLUR, TRAY_EDGE_BLUR), 0)
+        edges = cv2.dilate(cv2.Canny(gray, TRAY_CANNY_LOW, TRAY_CANNY_HIGH), None, iterations=2)
+        contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    elif method == "color":
+        mask = open_close(cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV), green_lo, green_hi))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    else:
+        raise ValueError(f"Unknown tray localization method '{method}'. Choose 'edges' or 'color'.")
+    return sorted(contours, key=cv2.contourArea, reverse=True)
+
+
+def find_tray_corners(frame, method="edges", near=None, max_error=MAX_CORNER_ERROR, min_share=MIN_TRAY_SHARE):
+    """Finds the tray in a frame. Returns its corners as an int32 (4, 2) array ordered like order_points.
+
+    Without `near` the largest quadrilateral wins; with `near` (four corners)
+    the one whose corners lie closest to them, if none is more than
+    `max_error` pixels off. Returns None if no outline qualifies.
+    """
+    min_area = min_share * frame.shape[0] * frame.shape[1]
+    target = None if near is None else order_points(near)
+    best, best_error = None, max_error
+    for contour in tray_outlines(frame, method):
+        if cv2.contourArea(contour) < min_area:
+            break
+        quad = fit_quad(contour, min_area)
+        if quad is None:
+            continue
+        if target is None:
+            best = quad
+            break
+        error = float(np.max(np.linalg.norm(quad - target, axis=1)))
+        if error < best_error:
+            best, best_error = quad, error
+    return None if best is None else np.round(best).astype("int32")
+
+
+def translation(dx, dy):
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+
+
+def transform_points(homography, points):
+    """Applies a 3x3 homography to (N, 2) points. Returns an (N, 2) float array."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
+
+
+class DriftMonitor:
+    """Notices the camera moving relative to the tray during production and finds the tray again.
+
+    check() compares a downscaled frame with the one captured at setup by
+    phase correlation, which costs about a millisecond and ignores the
+    cloth on the tray. Once the view has shifted, it fits the tray quad near
+    where the shift says it went, so a small rotation or tilt from the bump
+    is followed too; if no quad fits, the tray is moved by the shift alone.
+    The returned TrayMove feeds follow_tray().
+    """
+
+    def __init__(self, reference_frame, tray_contour, method="edges", scale=DRIFT_SCALE,
+                 min_shift=DRIFT_MIN_SHIFT, min_response=DRIFT_MIN_RESPONSE):
+        self.method = method
+        self.scale = scale
+        self.min_shift = min_shift
+        self.min_response = min_response
+        self.original_tray = order_points(tray_contour).astype(np.float64)
+        self.tray_contour = np.round(self.original_tray).astype("int32")
+        self.to_calibrated = np.eye(3)
+        self.shift = (0.0, 0.0)
+        self.checks = 0
+        self.moves = 0
+        self.last_response = None
+
+        height, width = reference_frame.shape[:2]
+        self._size = (max(int(width * scale), 8), max(int(height * scale), 8))
+        window = cv2.createHanningWindow(self._size, cv2.CV_32F)
+        tray_small = np.zeros((self._size[1], self._size[0]), dtype=np.uint8)
+        cv2.fillPoly(tray_small, [np.round(self.original_tray * scale).astype(np.int32)], 1)
+        margin = max(int(DRIFT_TRAY_MARGIN * scale), 1)
+        tray_small = cv2.dilate(tray_small, None, iterations=margin)
+        if cv2.countNonZero(tray_small) < 0.9 * tray_small.size:  # a tray filling the view leaves too little
+            # A soft edge, so the hole's outline does not correlate with itself at zero shift.
+            soft = cv2.blur(tray_small.astype(np.float32), (2 * margin + 1, 2 * margin + 1))
+            window *= 1 - soft
+        self._window = window
+        self._window_mask = (window > 0).astype(np.uint8)
+        self._clip = None
+        self._reference = self._small_gray(reference_frame)
+        _, spread = cv2.meanStdDev(self._reference, mask=self._window_mask)
+        self._clip = max(DRIFT_CLIP_SIGMA * float(spread[0, 0]), 1.0)
+        np.clip(self._reference, -self._clip, self._clip, out=self._reference)
+        # Windowed here rather than by phaseCorrelate, which would window its inputs in place.
+        self._reference *= self._window
+        # The quad as the localizer sees it at setup; later fits are compared with it, not with
+        # the (hand-clicked) contour, so any constant offset between the two cancels out.
+        self._reference_quad = find_tray_corners(reference_frame, method, near=self.original_tray)
+
+    def _small_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, self._size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        # Without its mean the image's brightness cannot make the window correlate with itself.
+        small -= cv2.mean(small, mask=self._window_mask)[0]
+        if self._clip is not None:
+            np.clip(small, -self._clip, self._clip, out=small)
+        return small
+
+    def measure(self, frame):
+        """((dx, dy), response): how far the view moved since setup, in full-resolution pixels."""
+        small = self._small_gray(frame)
+        small *= self._window
+        (dx, dy), response = cv2.phaseCorrelate(self._reference, small)
+        return (dx / self.scale, dy / self.scale), response
+
+    def check(self, frame):
+        """Returns a TrayMove if the view moved since the last check that returned one, else None."""
+        self.checks += 1
+        (dx, dy), response = self.measure(frame)
+        self.last_response = response
+        if response < self.min_response or np.hypot(dx - self.shift[0], dy - self.shift[1]) < self.min_shift:
+            return None
+
+        to_new = translation(dx, dy)
+        if self._reference_quad is not None:
+            predicted = transform_points(to_new, self._reference_quad)
+            quad = find_tray_corners(frame, self.method, near=predicted)
+            if quad is not None:
+                to_new = cv2.getPerspectiveTransform(self._reference_quad.astype(np.float32),
+                                                     quad.astype(np.float32)).astype(np.float64)
+        to_calibrated = np.linalg.inv(to_new)
+        to_previous = np.linalg.inv(self.to_calibrated) @ to_calibrated
+        self.tray_contour = np.round(transform_points(to_new, self.original_tray)).astype("int32")
+        self.to_calibrated, self.shift = to_calibrated, (dx, dy)
+        self.moves += 1
+        return TrayMove(self.tray_contour, to_previous, to_calibrated, (dx, dy), response)
+
+    def summary(self):
+        return (f"{self.checks} drift checks, {self.moves} camera moves followed, "
+                f"current shift ({self.shift[0]:+.1f}, {self.shift[1]:+.1f}) px")
+
+
+def follow_tray(move, detector, calibration_lut, trigger=None):
+    """Points everything that caches the tray's position at where a TrayMove found it.
+
+    The detector rebuilds its ROI, masks and warp tables and keeps its
+    learned background; the calibration keeps its table and maps pixels of
+    the new view back to the view it was measured in. Run it on the vision
+    thread between detections so no scan sees half of the update.
+    """
+    detector.retarget(move.tray_contour, move.to_previous)
+    calibration_lut.set_camera_motion(move.to_calibrated)
+    if trigger is not None:
+        trigger.refresh_tray()
@@ -0,0 +1,106 @@
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Annotated frames waiting to be shown. When the display falls behind, the oldest are dropped.
+VISUALIZER_QUEUE_SIZE = 2
+WINDOW_NAME = "Detection Result"
+POLL_INTERVAL = 0.05  # how often the display thread pumps HighGUI events while idle (seconds)
+
+
+class DropOldestQueue:
+    """Bounded queue whose put() never blocks: a full queue discards its oldest item."""
+
+    def __init__(self, maxsize=VISUALIZER_QUEUE_SIZE):
+        self._items = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Returns the oldest item, or None if nothing arrived within `timeout` seconds."""
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+
+class Visualizer:
+    """Draws and shows detection results on its own thread.
+
+    The pick cycle only enqueues the frame and what was found in it; copying,
+    drawing, imshow and waitKey all happen here, so a slow or missing display
+    never holds up the arm.
+    """
+
+    def __init__(self, window=WINDOW_NAME, queue_size=VISUALIZER_QUEUE_SIZE):
+        self.window = window
+        self.queue = DropOldestQueue(queue_size)
+        self._running = False
+        self._thread = None
+        self._canvas = None  # reused for every annotated frame of the same size
+
+    def start(self):
+        """Starts the display thread. Returns self so it can be chained."""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._display_loop, name="Visualizer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        self.queue.put(None)  # wake the display thread
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, frame, tray_contour, contours=(), centroids=()):
+        """Queues a frame to be annotated and shown. The frame must not be modified afterwards."""
+        self.queue.put((frame, tray_contour, list(contours), list(centroids)))
+
+    def _display_loop(self):
+        try:
+            while self._running:
+                request = self.queue.get(POLL_INTERVAL)
+                if request is not None:
+                    frame = request[0]
+                    if self._canvas is None or self._canvas.shape != frame.shape:
+                        self._canvas = np.empty_like(frame)
+                    cv2.imshow(self.window, annotate(*request, out=self._canvas))
+                cv2.waitKey(1)
+        except cv2.error as e:
+            # e.g. an OpenCV build without GUI support: keep sorting, stop drawing.
+            print(f"⚠️ Visualization disabled: {e}")
+        finally:
+            self._running = False
+            try:
+                cv2.destroyWindow(self.window)
+            except cv2.error:
+                pass
+
+
+def annotate(frame, tray_contour, contours, centroids, out=None):
+    """Returns a copy of `frame` with the tray outline, contours and centroids drawn on it.
+
+    The copy is written into `out` (same shape as the frame) if given.
+    """
+    if out is None:
+        display_frame = frame.copy()
+    else:
+        display_frame = out
+        np.copyto(display_frame, frame)
+    cv2.polylines(display_frame, [tray_contour], True, (255, 0, 0), 2)
+    cv2.drawContours(display_frame, contours, -1, (0, 255, 0), 2)
+    for cx, cy in centroids:
+        cv2.circle(display_frame, (int(cx), int(cy)), 5, (0, 0, 255), -1)
+    return display_frame